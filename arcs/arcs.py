@@ -1,8 +1,11 @@
+import os
 from math import ceil
 from gensim.models.doc2vec import Doc2Vec
+from doc_embedding.docvector_store import DocVectorStore
 from trec.trecqrels import TrecQrels
 from trec.trectopics import TrecTopics
-from utils import sample_instance, sync_shuffle_lists
+from arcs.data_generator import ResampledDataGenerator
+from arcs.sampler import NegativeSampler
 
 import numpy as np
 
@@ -17,70 +20,121 @@ def get_hard_easy_neg_numbers(relevant_count):
 
 
 class Arcs:
-    def __init__(self, model_file, qrels_path, topics_path):
+    def __init__(self, model_file, qrels_path, topics_path, snapshot_dir=None):
+        """
+        :param model_file: Doc2Vec model file, or folder of a DocVectorStore exported from it
+        :param qrels_path: folder of TREC qrels
+        :param topics_path: folder of TREC topics
+        :param snapshot_dir: folder of the snapshots of the parsed qrels and topics, None to parse them every time
+        """
         # assert sum(DOC_RATIO) is 1.0
-        self.d2v = Doc2Vec.load(model_file)
-        self.qrels = TrecQrels(qrels_path)
-        self.qrels.init()
+        if os.path.isdir(model_file):
+            self.d2v = None
+            self.docvecs = DocVectorStore(model_file)
+            self.vocab = self.docvecs.vocab
+            self.embedding_dim = self.docvecs.vector_size
+        else:
+            self.d2v = Doc2Vec.load(model_file)
+            self.docvecs = self.d2v.docvecs
+            self.vocab = self.d2v.wv.vocab
+            self.embedding_dim = self.d2v.vector_size
+        self.qrels = TrecQrels(qrels_path,
+                               snapshot=os.path.join(snapshot_dir, "qrels.npz") if snapshot_dir else None)
 
-        self.topics = TrecTopics(topics_path)
-        self.doc_list = self.d2v.docvecs.index2entity
+        self.topics = TrecTopics(topics_path,
+                                 snapshot=os.path.join(snapshot_dir, "topics.npz") if snapshot_dir else None)
+        self.doc_list = self.docvecs.index2entity
 
-        self.embedding_dim = self.d2v.vector_size
-        self.vocab_size = len(self.d2v.wv.vocab)
+        self.vocab_size = len(self.vocab)
 
+        self.sampler = None
+        self.ts_doc_rows = np.empty(0, dtype=np.int64)
         self.ts_doc_list = []
         self.ts_topic_list = []
         self.ts_label_list = []
 
+    def get_sampler(self, seed=None):
+        """
+        The sampler drawing training sets of this instance, built once over the doc rows of the document vectors.
+        :param seed: seed of the random generator, only used when the sampler is built
+        :return: :class:`arcs.sampler.NegativeSampler`
+        """
+        if self.sampler is None:
+            index = self.qrels.build_index(self.doc_list, doc_index=getattr(self.docvecs, "doc_index", None))
+            self.sampler = NegativeSampler(index, self.doc_list, range(TOPIC_START, TOPIC_END + 1), seed=seed)
+        return self.sampler
+
     def create_training_set(self, shuffle=True):
-        for topic_no in range(TOPIC_START, TOPIC_END + 1):
-            relevant_docs = self.qrels.get_doc_list(topic_no, is_rel=True)
-            irrelevant_docs = self.qrels.get_doc_list(topic_no, is_rel=False)
-
-            # add all relevant docs into training set
-            relevant_count = len(relevant_docs)
-            self.ts_doc_list.extend(relevant_docs)
-            self.ts_topic_list.extend([topic_no] * relevant_count)
-            self.ts_label_list.extend([1] * relevant_count)
-
-            # add some retrieved but irrelevant (hard neg) docs into training set
-            hard_neg_count, easy_neg_count = get_hard_easy_neg_numbers(relevant_count)
-            self.ts_doc_list.extend(self.qrels.get_random_docs(hard_neg_count, topic_no, is_rel=False))
-            self.ts_topic_list.extend([topic_no] * hard_neg_count)
-            self.ts_label_list.extend([0] * hard_neg_count)
-
-            # add some totally irrelevant (easy neg) docs into training set
-            exclusive_set = set(relevant_docs)
-            exclusive_set.update(irrelevant_docs)
-            self.ts_doc_list.extend(sample_instance(easy_neg_count, self.doc_list, exclusive_set=exclusive_set))
-            self.ts_topic_list.extend([topic_no] * easy_neg_count)
-            self.ts_label_list.extend([0] * easy_neg_count)
-
-        if shuffle:
-            self.ts_doc_list, self.ts_topic_list, self.ts_label_list = sync_shuffle_lists(self.ts_doc_list,
-                                                                                          self.ts_topic_list,
-                                                                                          self.ts_label_list)
+        """
+        Draw a training set of all relevant documents plus hard and easy negatives per topic, see `DOC_RATIO`.
+        Each call replaces the previous training set with freshly drawn negatives.
+        :param shuffle: shuffle the training set
+        :return: None
+        """
+        self.ts_doc_rows, topic_nos, labels = self.get_sampler().sample(DOC_RATIO, shuffle=shuffle)
+        self.ts_doc_list = [self.doc_list[row] for row in self.ts_doc_rows.tolist()]
+        self.ts_topic_list = topic_nos.tolist()
+        self.ts_label_list = labels.tolist()
 
     def get_training_set(self, use_topic_vector=False,
                          include_title=True, include_desc=False, include_narr=False, norm='l1'):
         if use_topic_vector:
             self.topics.init()
-            self.topics.vectorize(vocab_dict=self.d2v.wv.vocab,
+            self.topics.vectorize(vocab_dict=self.vocab,
                                   include_title=include_title, include_desc=include_desc, include_narr=include_narr,
                                   norm=norm)
             return self.ts_doc_list, [self.topics.get_topic_vector(topic_no) for topic_no in self.ts_topic_list], self.ts_label_list
         else:
             return self.ts_doc_list, self.ts_topic_list, self.ts_label_list
 
+    def get_topic_matrix(self, include_title=True, include_desc=False, include_narr=False, norm='l2', sparse=False):
+        """
+        Topic vectors of the training set as one row per topic plus a row number per sample, to be gathered per batch
+        (see the `tables` parameter of :class:`arcs.data_generator.DataGenerator`) instead of duplicating a
+        vocab sized row for every sample.
+        :param include_title: use the title of topics
+        :param include_desc: use the description of topics
+        :param include_narr: use the narrative of topics
+        :param norm: norm of the topic vectors
+        :param sparse: return the topic matrix as float32 CSR
+        :return: topic matrix, int32 array of topic rows aligned with the training set
+        """
+        self.init_topic_vecs(include_title=include_title, include_desc=include_desc, include_narr=include_narr,
+                             norm=norm, sparse=sparse)
+        row_maps = self.topics.topic_row_maps
+        topic_index = np.fromiter((row_maps[topic_no] for topic_no in self.ts_topic_list), dtype=np.int32,
+                                  count=len(self.ts_topic_list))
+        if sparse:
+            return self.topics.topics_vecs, topic_index
+        return np.asarray(self.topics.topics_vecs, dtype=np.float32), topic_index
+
+    def get_resampled_generator(self, batch_size=32, include_title=True, include_desc=False, include_narr=False,
+                                norm='l2', sparse=True, buffers=0):
+        """
+        Streaming alternative to :meth:`create_training_set`: batches of float32 document and topic vectors whose
+        negatives are redrawn every epoch, without materializing the training set in lists.
+        :param batch_size: number of samples per batch
+        :param include_title: use the title of topics
+        :param include_desc: use the description of topics
+        :param include_narr: use the narrative of topics
+        :param norm: norm of the topic vectors
+        :param sparse: keep the topic vectors sparse, densified per batch
+        :param buffers: number of reused batch buffers, see :class:`arcs.data_generator.DataGenerator`
+        :return: :class:`arcs.data_generator.ResampledDataGenerator`
+        """
+        self.init_topic_vecs(include_title=include_title, include_desc=include_desc, include_narr=include_narr,
+                             norm=norm, sparse=sparse)
+        return ResampledDataGenerator(self.get_sampler(), self.docvecs.vectors_docs, self.topics.topics_vecs,
+                                      self.topics.topic_row_maps, DOC_RATIO, batch_size=batch_size, buffers=buffers)
+
     def get_docvecs(self):
-        return [self.d2v.docvecs[doc] for doc in self.ts_doc_list]
+        return [self.docvecs[doc] for doc in self.ts_doc_list]
 
     def get_topicvecs(self, use_topic_vector=False,
                       include_title=True, include_desc=False, include_narr=False, norm='l2'):
         if use_topic_vector:
             self.topics.init()
-            self.topics.vectorize(vocab_dict=self.d2v.wv.vocab,
+            self.topics.vectorize(vocab_dict=self.vocab,
                                   include_title=include_title, include_desc=include_desc, include_narr=include_narr,
                                   norm=norm)
             return [self.topics.get_topic_vector(topic_no) for topic_no in self.ts_topic_list]
@@ -90,15 +144,15 @@ class Arcs:
     def get_labels(self):
         return self.ts_label_list
 
-    def init_topic_vecs(self, include_title=True, include_desc=False, include_narr=False, norm='l2'):
+    def init_topic_vecs(self, include_title=True, include_desc=False, include_narr=False, norm='l2', sparse=False):
         self.topics.init()
-        self.topics.vectorize(vocab_dict=self.d2v.wv.vocab,
+        self.topics.vectorize(vocab_dict=self.vocab,
                               include_title=include_title, include_desc=include_desc, include_narr=include_narr,
-                              norm=norm)
+                              norm=norm, sparse=sparse)
 
     def training_set_iterator(self):
         for i in range(len(self.ts_doc_list)):
-            yield ([self.d2v.docvecs[self.ts_doc_list[i]],
+            yield ([self.docvecs[self.ts_doc_list[i]],
                    np.array(self.topics.get_topic_vector(self.ts_topic_list[i]), dtype=np.float32)], np.array(self.ts_label_list[i]))
 
 
@@ -1,26 +1,73 @@
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
+import tensorflow as tf
+from scipy.sparse import csr_matrix, issparse
 from tensorflow import keras
 
+from doc_embedding.docvector_store import QuantizedVectors
+
+
+def _check_rows(rows, size, what="rows"):
+    """
+    Check row numbers before they are gathered with np.take(mode='clip'), which would silently map rows out of
+    range to the last row, e.g. the rows of a stale doc or topic map.
+    :param rows: int array of row numbers
+    :param size: number of rows they index
+    :param what: name of the rows in the error message
+    :return: None
+    """
+    if len(rows) and (rows.min() < 0 or rows.max() >= size):
+        raise IndexError("%s out of range 0..%d: %d..%d" % (what, size - 1, rows.min(), rows.max()))
+
 
 class DataGenerator(keras.utils.Sequence):
     'Generates data for Keras'
     def __init__(self, *input_data, labels=None, batch_size=32, dim=1000,
-                 shuffle=True, sec_input_const=False):
-        'Initialization'
+                 shuffle=True, sec_input_const=False, buffers=0, tables=None):
+        """Initialization
+
+        :param input_data: one array-like per model input, rows are samples. Memory mapped inputs (e.g. the
+            float16 or int8 vectors of a DocVectorStore) are kept mapped and converted to float32 per batch,
+            other inputs are converted once.
+        :param labels: labels of the samples, None for prediction
+        :param batch_size: number of samples per batch
+        :param dim: dimension of the document vectors
+        :param shuffle: If True - shuffle the samples after every epoch
+        :param sec_input_const: If True - the second input is a single vector shared by all samples
+        :param buffers: number of preallocated batch buffers reused round robin, 0 allocates every batch.
+            A batch is overwritten `buffers` batches later, so it has to exceed the number of batches
+            kept in flight by the consumer (Keras' `max_queue_size` + `workers`). Keep it small, a long ring
+            of large buffers falls out of cache and is slower than fresh allocations.
+        :param tables: one lookup table (dense array or scipy CSR matrix) or None per input. An input with a table
+            holds row numbers into it, e.g. a topic index per sample into the topic matrix, and its batch is
+            gathered from the table on the fly; sparse rows are densified per batch only.
+        """
         self.dim = dim
         self.batch_size = batch_size
-        self.labels = labels
         # self.list1 = input_list1
         # self.list2 = input_list2
-        self.data = input_data
+        self.tables = list(tables) if tables is not None else [None] * len(input_data)
+        assert len(self.tables) == len(input_data)
+        self.data = [self.__prepare(data, table) for data, table in zip(input_data, self.tables)]
+        self.check_tables()
+        self.labels = np.ascontiguousarray(labels, dtype=int) if labels is not None else None
         self.data_dim = len(input_data)
-        self.length = len(input_data[0])
+        self.length = len(self.data[0])
         assert 1 <= self.data_dim
         if self.labels is not None:
             assert len(self.labels) == self.length
 
         self.shuffle = shuffle
         self.constant = sec_input_const
+        if self.constant:
+            # one row, broadcast to the batch size instead of being copied per sample
+            self.data[1] = np.asarray(self.data[1], dtype='float32').reshape(1, -1)
+
+        self.buffers = [self.__allocate() for _ in range(buffers)]
+        self.next_buffer = 0
 
         self.indexes = np.arange(self.length)
         self.on_epoch_end()
@@ -32,7 +79,7 @@ class DataGenerator(keras.utils.Sequence):
     def __getitem__(self, index):
         'Generate one batch of data'
         # Generate indexes of the batch
-        indexes = self.indexes[index*self.batch_size:(index+1)*self.batch_size]
+        indexes = self.batch_indexes(index)
 
         # Generate data
         # X, y = self.__data_generation(indexes)
@@ -40,44 +87,365 @@ class DataGenerator(keras.utils.Sequence):
         # return X, y
         return self.__data_generation(indexes)
 
+    def batch_indexes(self, index):
+        'Sample indexes of one batch in the current epoch order'
+        return self.indexes[index*self.batch_size:(index+1)*self.batch_size]
+
+    def get_batch(self, indexes):
+        'Generate the batch of the given sample indexes'
+        indexes = np.asarray(indexes)
+        _check_rows(indexes, self.length, "sample indexes")
+        return self.__data_generation(indexes)
+
+    def check_tables(self):
+        'Check the row numbers of the inputs with a lookup table once, instead of per batch'
+        for i, (data, table) in enumerate(zip(self.data, self.tables)):
+            if table is not None:
+                _check_rows(data, table.shape[0], "rows of input %d" % i)
+
     def on_epoch_end(self):
         'Updates indexes after each epoch'
         if self.shuffle:
             np.random.shuffle(self.indexes)
 
+    @staticmethod
+    def __prepare(data, table):
+        'Row numbers of table inputs as int64, in-memory inputs once as contiguous float32 arrays'
+        if table is not None:
+            return np.ascontiguousarray(data, dtype='int64')
+        if isinstance(data, (np.memmap, QuantizedVectors)):
+            # a full float32 copy of a file backed input would not fit in memory, convert it per batch
+            return data
+        return np.ascontiguousarray(data, dtype='float32')
+
+    def __allocate(self):
+        'Allocates one set of batch buffers'
+        inputs = []
+        for i, (data, table) in enumerate(zip(self.data, self.tables)):
+            if self.constant and i == 1:
+                inputs.append(None)
+            else:
+                shape = data.shape[1:] if table is None else table.shape[1:]
+                inputs.append(np.empty((self.batch_size,) + shape, dtype='float32'))
+        labels = np.empty(self.batch_size, dtype=int) if self.labels is not None else None
+        return inputs, labels
+
     def __data_generation(self, indexes):
-        'Generates data containing batch_size samples' # X : (n_samples, *dim, n_channels)
-        # Initialization
-        # X = np.empty((self.batch_size, *self.dim, self.n_channels))
-        # y = np.empty(self.batch_size, dtype=int)
+        'Generates data containing batch_size samples'
+        n = len(indexes)
+        if self.buffers:
+            buffer_inputs, buffer_labels = self.buffers[self.next_buffer]
+            self.next_buffer = (self.next_buffer + 1) % len(self.buffers)
+        else:
+            buffer_inputs, buffer_labels = [None] * self.data_dim, None
 
         inputs = list()
 
         if self.constant:
-            inputs.append(np.array([self.data[0][i] for i in indexes], dtype='float32'))
-            inputs.append(np.array([self.data[1].tolist()] * len(indexes), dtype='float32'))
+            inputs.append(self.__lookup(self.data[0], indexes, buffer_inputs[0]))
+            inputs.append(np.broadcast_to(self.data[1], (n, self.data[1].shape[1])))
         else:
-            for data in self.data:
-                inputs.append(np.array([data[i] for i in indexes], dtype='float32'))
+            for data, table, buffer in zip(self.data, self.tables, buffer_inputs):
+                if table is None:
+                    inputs.append(self.__lookup(data, indexes, buffer))
+                else:
+                    inputs.append(self.__lookup(table, np.take(data, indexes), buffer))
 
         if self.labels is not None:
-            return inputs, np.array([self.labels[i] for i in indexes], dtype=int)
+            return inputs, self.__gather(self.labels, indexes, buffer_labels)
         else:
             return inputs
 
-        # if self.data_dim == 1:
-        #     return np.array([])
-        # output1 = np.array([self.list1[i] for i in indexes], dtype='float32')
-        # output2 = np.array([self.list2[i] for i in indexes], dtype='float32')
-        #
-        # return [output1, output2], np.array([self.labels[i] for i in indexes], dtype=int)
-        #
-        # # Generate data
-        # for i, ID in enumerate(indexes):
-        #     # Store sample
-        #     X[i,] = np.load('data/' + ID + '.npy')
-        #
-        #     # Store class
-        #     y[i] = self.labels[ID]
-        #
-        # return X, keras.utils.to_categorical(y, num_classes=self.n_classes)
\ No newline at end of file
+    @staticmethod
+    def __gather(data, indexes, buffer):
+        'Gathers the rows of a batch, into the buffer if given'
+        if buffer is None:
+            return np.take(data, indexes, axis=0)
+        out = buffer[:len(indexes)]
+        # mode='clip' lets numpy write straight into out, the default mode='raise' buffers the result first.
+        # Sample indexes are checked by get_batch and table rows by check_tables, so nothing is clipped
+        np.take(data, indexes, axis=0, out=out, mode='clip')
+        return out
+
+    @staticmethod
+    def __lookup(table, rows, buffer):
+        'Gathers rows of an input or a lookup table as float32, into the buffer if given'
+        if issparse(table):
+            batch = table[rows].toarray()
+        elif isinstance(table, QuantizedVectors):
+            # int8 document vectors, dequantized per batch
+            batch = table[rows]
+        elif buffer is not None and table.dtype == buffer.dtype:
+            out = buffer[:len(rows)]
+            np.take(table, rows, axis=0, out=out, mode='clip')
+            return out
+        else:
+            batch = np.take(table, rows, axis=0)
+        if buffer is None:
+            return batch.astype('float32', copy=False)
+        out = buffer[:len(rows)]
+        out[...] = batch
+        return out
+
+
+class ResampledDataGenerator(DataGenerator):
+    """Stream a training set whose negatives are redrawn every epoch.
+
+    The samples are only int arrays of doc rows, topic rows and labels drawn by a
+    :class:`~arcs.sampler.NegativeSampler`; document and topic vectors are gathered from their tables per batch,
+    so memory stays flat no matter how many epochs are trained. Every epoch keeps all relevant documents and
+    draws new hard and easy negatives.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> arcs.init_topic_vecs(sparse=True)
+        >>> data_generator = ResampledDataGenerator(arcs.get_sampler(), arcs.docvecs.vectors_docs,
+        ...                                         arcs.topics.topics_vecs, arcs.topics.topic_row_maps,
+        ...                                         DOC_RATIO, batch_size=128)
+        >>> model.fit(x=data_generator, epochs=20)
+
+    """
+
+    def __init__(self, sampler, doc_table, topic_table, topic_row_maps, doc_ratio, batch_size=32, buffers=0):
+        """
+
+        Parameters
+        ----------
+        sampler : :class:`arcs.sampler.NegativeSampler`
+            Sampler over the rows of doc_table.
+        doc_table : array-like
+            Document vectors, one row per doc row of the sampler, e.g. `docvecs.vectors_docs`.
+        topic_table : array-like or scipy CSR matrix
+            Topic vectors, one row per topic.
+        topic_row_maps : dict
+            topic_no -> row in topic_table, e.g. `TrecTopics.topic_row_maps`.
+        doc_ratio : list of float
+            Ratio of relevant, hard negative and easy negative documents.
+        batch_size : int, optional
+            Number of samples per batch.
+        buffers : int, optional
+            Number of reused batch buffers, see :class:`DataGenerator`.
+
+        """
+        self.sampler = sampler
+        self.doc_ratio = doc_ratio
+        self.topic_lookup = np.full(max(topic_row_maps) + 1, -1, dtype=np.int64)
+        for topic_no, row in topic_row_maps.items():
+            self.topic_lookup[topic_no] = row
+        self.resampling = False
+        doc_rows, topic_rows, labels = self.draw()
+        super(ResampledDataGenerator, self).__init__(doc_rows, topic_rows, labels=labels, batch_size=batch_size,
+                                                     shuffle=False, buffers=buffers,
+                                                     tables=[doc_table, topic_table])
+        self.resampling = True
+
+    def draw(self):
+        'Draws a fresh training set, the sampler shuffles it'
+        doc_rows, topic_nos, labels = self.sampler.sample(self.doc_ratio)
+        topic_rows = self.topic_lookup[topic_nos]
+        assert (topic_rows >= 0).all(), "topics without a topic vector"
+        return doc_rows, topic_rows, labels
+
+    def on_epoch_end(self):
+        'Redraws the negatives after each epoch'
+        if self.resampling:
+            doc_rows, topic_rows, labels = self.draw()
+            assert len(doc_rows) == self.length
+            self.data = [doc_rows, topic_rows]
+            self.labels = labels.astype(int)
+            self.check_tables()
+
+
+# state of a prefetch worker process, created once by _init_prefetch_worker
+_prefetch_worker = {}
+
+
+def _share_array(array, blocks):
+    """Describe an array so a worker process can map it without copying.
+
+    File backed arrays (e.g. a DocVectorStore) are reopened from their file, everything else is copied once
+    into a shared memory block.
+    """
+    base = array
+    while base is not None:
+        if isinstance(base, np.memmap) and base.shape == array.shape and base.dtype == array.dtype and \
+                base.__array_interface__['data'] == array.__array_interface__['data']:
+            return "memmap", base.filename, array.dtype.str, array.shape, base.offset
+        base = base.base
+
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    blocks.append(block)
+    return "shm", block.name, array.dtype.str, array.shape, 0
+
+
+def _attach_array(spec):
+    kind, name, dtype, shape, offset = spec
+    if kind == "memmap":
+        return np.memmap(name, dtype=dtype, mode='r', shape=shape, offset=offset)
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=name)
+    _prefetch_worker.setdefault("blocks", []).append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _share_table(table, blocks):
+    if table is None:
+        return None
+    if issparse(table):
+        table = table.tocsr()
+        return "csr", table.shape, [_share_array(array, blocks) for array in (table.data, table.indices, table.indptr)]
+    if isinstance(table, QuantizedVectors):
+        return "int8", table.shape, [_share_array(array, blocks) for array in (table.codes, table.scales)]
+    return "dense", table.shape, [_share_array(np.asarray(table), blocks)]
+
+
+def _attach_table(spec):
+    if spec is None:
+        return None
+    kind, shape, array_specs = spec
+    arrays = [_attach_array(array_spec) for array_spec in array_specs]
+    if kind == "csr":
+        return csr_matrix(tuple(arrays), shape=shape, copy=False)
+    if kind == "int8":
+        return QuantizedVectors(*arrays)
+    return arrays[0]
+
+
+def _init_prefetch_worker(data_specs, labels_spec, table_specs, batch_size, sec_input_const):
+    data = [_attach_table(spec) for spec in data_specs]
+    labels = _attach_array(labels_spec) if labels_spec is not None else None
+    tables = [_attach_table(spec) for spec in table_specs]
+    _prefetch_worker["generator"] = DataGenerator(*data, labels=labels, batch_size=batch_size, shuffle=False,
+                                                  sec_input_const=sec_input_const, tables=tables)
+
+
+def _prefetch_batch(indexes):
+    return _prefetch_worker["generator"].get_batch(indexes)
+
+
+def _release_prefetch(executor, blocks):
+    'Stop the workers of a PrefetchGenerator and unlink its shared memory blocks'
+    executor.shutdown()
+    for block in blocks:
+        block.close()
+        block.unlink()
+    blocks.clear()
+
+
+class PrefetchGenerator(keras.utils.Sequence):
+    """Produce the next batches of a :class:`DataGenerator` in the background while the model computes.
+
+    Up to `prefetch` batches ahead of the requested one are built by a pool of `workers` threads, or processes if
+    `use_processes`. Worker processes map the input arrays instead of receiving copies: memory mapped inputs
+    (e.g. :class:`~doc_embedding.docvector_store.DocVectorStore` vectors) are reopened from their file and
+    in-memory inputs and lookup tables are placed in shared memory once.
+
+    Prefer threads: numpy releases the GIL while gathering, and worker processes pickle every batch back to the
+    parent. In `benchmarks/bench_data_generator.py` process workers were slower than no prefetching at all
+    (92 against 169 batches/s), they only pay off when building a batch costs far more than transferring it.
+
+    Shared memory is released by :meth:`close`, at the end of a `with` block, or at the latest when the
+    generator is garbage collected.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> data_generator = DataGenerator(ts_doc_list, ts_topic_list, labels=ts_label_list, batch_size=128)
+        >>> with PrefetchGenerator(data_generator, prefetch=8, workers=4) as prefetcher:
+        ...     model.fit(x=prefetcher, epochs=20)
+
+    """
+
+    def __init__(self, data_generator, prefetch=4, workers=2, use_processes=False):
+        assert not data_generator.buffers, "prefetched batches must not share reused buffers"
+        self.data_generator = data_generator
+        self.prefetch = prefetch
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.blocks = []
+
+        if use_processes:
+            # worker processes hold a copy of the samples, which would not follow the per epoch redraws
+            assert not isinstance(data_generator, ResampledDataGenerator), "prefetch resampled data with threads"
+            data_specs = [_share_table(data, self.blocks) for data in data_generator.data]
+            labels_spec = _share_array(data_generator.labels, self.blocks) \
+                if data_generator.labels is not None else None
+            table_specs = [_share_table(table, self.blocks) for table in data_generator.tables]
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_prefetch_worker,
+                                                initargs=(data_specs, labels_spec, table_specs,
+                                                          data_generator.batch_size, data_generator.constant))
+            self.produce = _prefetch_batch
+        else:
+            self.executor = ThreadPoolExecutor(workers)
+            self.produce = data_generator.get_batch
+        self.finalizer = weakref.finalize(self, _release_prefetch, self.executor, self.blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.data_generator)
+
+    def __getitem__(self, index):
+        with self.lock:
+            # keep the window [index, index + prefetch] in flight, drop batches that fell out of it
+            for i in [i for i in self.pending if not index <= i <= index + self.prefetch]:
+                self.pending.pop(i).cancel()
+            for i in range(index, min(index + self.prefetch + 1, len(self))):
+                if i not in self.pending:
+                    indexes = np.array(self.data_generator.batch_indexes(i))
+                    self.pending[i] = self.executor.submit(self.produce, indexes)
+            future = self.pending.pop(index)
+        return future.result()
+
+    def on_epoch_end(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            for future in self.pending.values():
+                if not future.cancelled():
+                    future.exception()
+            self.pending.clear()
+            self.data_generator.on_epoch_end()
+
+    def close(self):
+        """Stop the workers and release shared memory."""
+        self.on_epoch_end()
+        self.finalizer()
+
+
+def to_dataset(data_generator, prefetch=tf.data.experimental.AUTOTUNE):
+    """
+    Wrap a DataGenerator (or PrefetchGenerator) into a `tf.data.Dataset`, so tf.data prefetches its batches
+    while the model computes. The generator is advanced to the next epoch each time the dataset is exhausted.
+    :param data_generator: :class:`DataGenerator` or :class:`PrefetchGenerator`
+    :param prefetch: number of batches tf.data keeps ready
+    :return: a dataset of (inputs, labels) or inputs batches
+    """
+    def as_tuple(batch):
+        if isinstance(batch, tuple):
+            return tuple(batch[0]), batch[1]
+        return tuple(batch)
+
+    def dtype_shape(array):
+        return tf.as_dtype(array.dtype), tf.TensorShape((None,) + array.shape[1:])
+
+    first = as_tuple(data_generator[0])
+    output_types = tf.nest.map_structure(lambda array: dtype_shape(array)[0], first)
+    output_shapes = tf.nest.map_structure(lambda array: dtype_shape(array)[1], first)
+
+    def batches():
+        for i in range(len(data_generator)):
+            yield as_tuple(data_generator[i])
+        data_generator.on_epoch_end()
+
+    return tf.data.Dataset.from_generator(batches, output_types=output_types,
+                                          output_shapes=output_shapes).prefetch(prefetch)
@@ -0,0 +1,152 @@
+import logging
+
+import numpy as np
+
+from trec.trecqrels import QrelsIndex
+
+logger = logging.getLogger(__name__)
+
+MAX_REJECTION_ROUNDS = 100
+
+
+class NegativeSampler:
+    """Vectorized sampler of training triples (doc row, topic, label) over an integer doc index.
+
+    Judged documents of every topic are kept as sorted int64 doc rows, so a whole training set is drawn with a
+    handful of NumPy calls instead of scanning the document list per topic:
+
+    * all relevant documents of a topic are positives
+    * hard negatives are drawn from the judged irrelevant rows of the topic, without replacement as long as there
+      are enough of them
+    * easy negatives are drawn uniformly from all rows by rejection sampling against the judged rows of the topic,
+      which almost never rejects since a topic judges a tiny fraction of the collection
+
+    Documents of the qrels missing from the doc index are dropped.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> sampler = NegativeSampler(qrels, docvecs.index2entity, range(51, 451))
+        >>> doc_rows, topic_nos, labels = sampler.sample(doc_ratio=[0.7, 0.2, 0.1])
+
+    """
+
+    def __init__(self, qrels, doc_list, topic_nos, doc_index=None, seed=None):
+        """
+
+        Parameters
+        ----------
+        qrels : :class:`trec.trecqrels.TrecQrels` or :class:`trec.trecqrels.QrelsIndex`
+            Relevance judgements, an index has to share its ids with the rows of doc_list.
+        doc_list : list of str
+            doc_no of every doc row, e.g. `docvecs.index2entity`.
+        topic_nos : iterable of int
+            Topics to sample for.
+        doc_index : dict, optional
+            doc_no -> doc row, built from doc_list if not given.
+        seed : int, optional
+            Seed of the random generator.
+
+        """
+        self.index = qrels if isinstance(qrels, QrelsIndex) else QrelsIndex(qrels, doc_list, doc_index=doc_index)
+        self.doc_list = doc_list
+        self.n_docs = len(doc_list)
+        self.topic_nos = np.fromiter(topic_nos, dtype=np.int32)
+        self.rng = np.random.default_rng(seed)
+
+        def rows(topic_no, is_rel):
+            ids = self.index.get_ids(topic_no, is_rel).astype(np.int64)
+            # ids from n_docs on are judged documents without a vector
+            return ids[ids < self.n_docs]
+
+        relevant = [rows(int(topic_no), True) for topic_no in self.topic_nos]
+        irrelevant = [rows(int(topic_no), False) for topic_no in self.topic_nos]
+
+        self.relevant_counts = np.array([len(r) for r in relevant], dtype=np.int64)
+        self.relevant_rows = np.concatenate(relevant + [np.empty(0, dtype=np.int64)])
+        self.irrelevant_counts = np.array([len(r) for r in irrelevant], dtype=np.int64)
+        self.irrelevant_offsets = np.concatenate(([0], np.cumsum(self.irrelevant_counts)))
+        self.irrelevant_rows = np.concatenate(irrelevant + [np.empty(0, dtype=np.int64)])
+
+        # judged (topic position, doc row) pairs as sorted keys topic_pos * n_docs + doc_row
+        self.judged_keys = np.unique(np.concatenate(
+            [pos * self.n_docs + np.concatenate((r, i)) for pos, (r, i) in enumerate(zip(relevant, irrelevant))] +
+            [np.empty(0, dtype=np.int64)]))
+
+    def negative_counts(self, doc_ratio):
+        """
+        Number of hard and easy negatives per topic, same as `arcs.arcs.get_hard_easy_neg_numbers`.
+        :param doc_ratio: ratio of relevant, hard negative and easy negative documents
+        :return: int64 arrays of hard and easy negative counts, aligned with topic_nos
+        """
+        percentage = self.relevant_counts / doc_ratio[0]
+        return np.ceil(percentage * doc_ratio[1]).astype(np.int64), np.ceil(percentage * doc_ratio[2]).astype(np.int64)
+
+    def sample_hard(self, counts):
+        """
+        Draw hard negatives of every topic from its judged irrelevant rows.
+        :param counts: number of hard negatives per topic
+        :return: int64 doc rows, int64 topic positions
+        """
+        counts = np.where(self.irrelevant_counts > 0, counts, 0)
+        topic_pos = np.repeat(np.arange(len(counts)), counts)
+        # rank within topic of every slot: 0..count-1
+        rank = np.arange(len(topic_pos)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        # without replacement: shuffle every topic segment by sorting random keys within it
+        segment_pos = np.repeat(np.arange(len(counts)), self.irrelevant_counts)
+        shuffled = np.lexsort((self.rng.random(len(segment_pos)), segment_pos))
+        enough = counts[topic_pos] <= self.irrelevant_counts[topic_pos]
+        positions = np.where(enough,
+                             rank,
+                             # with replacement if the topic has fewer irrelevant documents than requested
+                             (self.rng.random(len(topic_pos)) * self.irrelevant_counts[topic_pos]).astype(np.int64))
+        positions = np.minimum(positions, self.irrelevant_counts[topic_pos] - 1)
+        flat = self.irrelevant_offsets[topic_pos] + positions
+        flat = np.where(enough, shuffled[flat], flat)
+        return self.irrelevant_rows[flat], topic_pos
+
+    def sample_easy(self, counts):
+        """
+        Draw easy negatives of every topic uniformly from the rows not judged for the topic.
+        :param counts: number of easy negatives per topic
+        :return: int64 doc rows, int64 topic positions
+        """
+        topic_pos = np.repeat(np.arange(len(counts)), counts)
+        doc_rows = self.rng.integers(0, self.n_docs, len(topic_pos))
+        pending = np.arange(len(topic_pos))
+        for _ in range(MAX_REJECTION_ROUNDS):
+            keys = topic_pos[pending] * self.n_docs + doc_rows[pending]
+            found = np.searchsorted(self.judged_keys, keys)
+            judged = self.judged_keys[np.minimum(found, len(self.judged_keys) - 1)] == keys \
+                if len(self.judged_keys) else np.zeros(len(keys), dtype=bool)
+            pending = pending[judged]
+            if not len(pending):
+                break
+            doc_rows[pending] = self.rng.integers(0, self.n_docs, len(pending))
+        else:
+            raise ValueError("could not draw easy negatives, too few unjudged documents")
+        return doc_rows, topic_pos
+
+    def sample(self, doc_ratio, shuffle=True):
+        """
+        Draw a fresh training set, cheap enough to be called every epoch.
+        :param doc_ratio: ratio of relevant, hard negative and easy negative documents
+        :param shuffle: shuffle the triples
+        :return: int64 doc rows, int32 topic numbers, int8 labels
+        """
+        hard_counts, easy_counts = self.negative_counts(doc_ratio)
+        hard_rows, hard_pos = self.sample_hard(hard_counts)
+        easy_rows, easy_pos = self.sample_easy(easy_counts)
+        relevant_pos = np.repeat(np.arange(len(self.topic_nos)), self.relevant_counts)
+
+        doc_rows = np.concatenate((self.relevant_rows, hard_rows, easy_rows))
+        topic_nos = self.topic_nos[np.concatenate((relevant_pos, hard_pos, easy_pos))]
+        labels = np.zeros(len(doc_rows), dtype=np.int8)
+        labels[:len(self.relevant_rows)] = 1
+
+        if shuffle:
+            order = self.rng.permutation(len(doc_rows))
+            doc_rows, topic_nos, labels = doc_rows[order], topic_nos[order], labels[order]
+        return doc_rows, topic_nos, labels
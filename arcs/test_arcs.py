@@ -34,4 +34,32 @@ def test_get_training_set():
     # print(ts_doc)
     # print(ts_label)
 
-    print(len(ts_doc))
\ No newline at end of file
+    print(len(ts_doc))
+
+
+def test_get_topic_matrix(tmp_path):
+    import numpy as np
+    from arcs.arcs import Arcs
+    from doc_embedding.docvector_store import write_store
+    from trec.test_trectopics import SAMPLE_TOPICS
+    from trec.trectopics import TrecTopics
+
+    words = ["airbus", "subsidies", "south", "african", "sanctions"]
+    write_store(str(tmp_path / "docvecs"), np.random.rand(3, 4), ["D0", "D1", "D2"], words, 4)
+    (tmp_path / "qrels").mkdir()
+    (tmp_path / "qrels" / "qrels.51-52").write_text("51 0 D0 1\n52 0 D1 1\n52 0 D2 0\n")
+    (tmp_path / "topics").mkdir()
+    (tmp_path / "topics" / "topics.51-52").write_text(SAMPLE_TOPICS)
+
+    arcs = Arcs(str(tmp_path / "docvecs"), str(tmp_path / "qrels"), str(tmp_path / "topics"))
+    # tokens of the topics as written, independent of the lemmatizer
+    arcs.topics = TrecTopics(str(tmp_path / "topics"), lemmatization=False)
+    arcs.ts_topic_list = [52, 51, 52, 52, 51]
+    for sparse in (False, True):
+        topic_matrix, topic_index = arcs.get_topic_matrix(sparse=sparse)
+        assert topic_index.dtype == np.int32 and len(topic_index) == len(arcs.ts_topic_list)
+        rows = topic_matrix[topic_index]
+        rows = rows.toarray() if sparse else rows
+        for row, topic_no in zip(rows, arcs.ts_topic_list):
+            np.testing.assert_allclose(row, arcs.topics.get_topic_vector(topic_no), rtol=1e-6)
+        assert not np.allclose(rows[0], rows[1])
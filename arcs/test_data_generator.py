@@ -0,0 +1,195 @@
+import numpy as np
+
+from arcs.data_generator import DataGenerator, PrefetchGenerator, to_dataset
+
+
+def test_batches():
+    docvecs = np.random.rand(100, 5)
+    topicvecs = np.random.rand(100, 3)
+    labels = np.random.randint(0, 2, 100)
+
+    for buffers in (0, 2):
+        data_generator = DataGenerator(list(docvecs), list(topicvecs), labels=list(labels), batch_size=16,
+                                       shuffle=False, buffers=buffers)
+        assert len(data_generator) == 6
+        (docs, topics), batch_labels = data_generator[1]
+        assert docs.dtype == np.float32 and docs.shape == (16, 5)
+        np.testing.assert_allclose(docs, docvecs[16:32], rtol=1e-6)
+        np.testing.assert_allclose(topics, topicvecs[16:32], rtol=1e-6)
+        np.testing.assert_array_equal(batch_labels, labels[16:32])
+
+
+def test_sec_input_const():
+    docvecs = np.random.rand(100, 5)
+    topic_vec = np.random.rand(3)
+
+    data_generator = DataGenerator(docvecs, topic_vec, batch_size=32, shuffle=False, sec_input_const=True)
+    docs, topics = data_generator[2]
+    assert topics.shape == (32, 3)
+    np.testing.assert_allclose(docs, docvecs[64:96], rtol=1e-6)
+    np.testing.assert_allclose(topics, np.tile(topic_vec, (32, 1)), rtol=1e-6)
+
+
+def test_prefetch(tmp_path):
+    docvecs = np.random.rand(200, 5).astype(np.float32)
+    np.save(str(tmp_path / "docvecs.npy"), docvecs)
+    docvecs_mmap = np.load(str(tmp_path / "docvecs.npy"), mmap_mode='r')
+    topicvecs = np.random.rand(200, 3)
+    labels = np.random.randint(0, 2, 200)
+
+    for use_processes in (False, True):
+        data_generator = DataGenerator(docvecs_mmap, topicvecs, labels=labels, batch_size=16)
+        prefetcher = PrefetchGenerator(data_generator, prefetch=3, workers=2, use_processes=use_processes)
+        for _ in range(2):
+            for i in range(len(prefetcher)):
+                (docs, topics), batch_labels = prefetcher[i]
+                indexes = data_generator.batch_indexes(i)
+                np.testing.assert_array_equal(docs, docvecs[indexes])
+                np.testing.assert_allclose(topics, topicvecs[indexes], rtol=1e-6)
+                np.testing.assert_array_equal(batch_labels, labels[indexes])
+            prefetcher.on_epoch_end()
+        prefetcher.close()
+
+
+def test_mapped_inputs(tmp_path):
+    from doc_embedding.docvector_store import QuantizedVectors
+
+    docvecs = np.random.rand(200, 5).astype(np.float16)
+    np.save(str(tmp_path / "docvecs.npy"), docvecs)
+    docvecs_mmap = np.load(str(tmp_path / "docvecs.npy"), mmap_mode='r')
+    scales = np.full(5, 1 / 127, dtype=np.float32)
+    codes = np.rint(docvecs.astype(np.float32) * 127).astype(np.int8)
+    quantized = QuantizedVectors(codes, scales)
+    labels = np.random.randint(0, 2, 200)
+
+    # int8 rows against their exact dequantization, float32 rounding may exceed the 0.5 / 127 bound
+    for inputs, expected in ((docvecs_mmap, docvecs), (quantized, codes * scales)):
+        for buffers in (0, 2):
+            data_generator = DataGenerator(inputs, labels=labels, batch_size=16, buffers=buffers)
+            # kept mapped instead of copied into a float32 array
+            assert data_generator.data[0] is inputs
+            [docs], _ = data_generator[1]
+            assert docs.dtype == np.float32
+            np.testing.assert_allclose(docs, expected[data_generator.batch_indexes(1)], rtol=1e-6)
+
+        data_generator = DataGenerator(inputs, labels=labels, batch_size=16)
+        prefetcher = PrefetchGenerator(data_generator, prefetch=2, workers=2, use_processes=True)
+        [docs], _ = prefetcher[0]
+        np.testing.assert_allclose(docs, expected[data_generator.batch_indexes(0)], rtol=1e-6)
+        prefetcher.close()
+
+
+def test_prefetch_release():
+    import gc
+    from multiprocessing import shared_memory
+    import pytest
+
+    data_generator = DataGenerator(np.random.rand(100, 5), labels=np.random.randint(0, 2, 100), batch_size=16)
+    with PrefetchGenerator(data_generator, workers=1, use_processes=True) as prefetcher:
+        prefetcher[0]
+        names = [block.name for block in prefetcher.blocks]
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    # not closed, released once garbage collected
+    prefetcher = PrefetchGenerator(data_generator, workers=1, use_processes=True)
+    names = [block.name for block in prefetcher.blocks]
+    del prefetcher
+    gc.collect()
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def test_to_dataset():
+    data_generator = DataGenerator(np.random.rand(100, 5), np.random.rand(100, 3),
+                                   labels=np.random.randint(0, 2, 100), batch_size=16)
+    batches = list(to_dataset(data_generator))
+    assert len(batches) == 6
+    (docs, topics), batch_labels = batches[0]
+    assert docs.shape == (16, 5) and topics.shape == (16, 3) and batch_labels.shape == (16,)
+
+
+def test_tables():
+    from scipy.sparse import csr_matrix
+
+    docvecs = np.random.rand(100, 5)
+    topic_matrix = np.random.rand(4, 7) * (np.random.rand(4, 7) > 0.6)
+    topic_index = np.random.randint(0, 4, 100)
+    labels = np.random.randint(0, 2, 100)
+
+    for table in (topic_matrix, csr_matrix(topic_matrix), topic_matrix.astype(np.float16)):
+        for buffers in (0, 2):
+            data_generator = DataGenerator(docvecs, topic_index, labels=labels, batch_size=16, shuffle=False,
+                                           buffers=buffers, tables=[None, table])
+            (docs, topics), _ = data_generator[1]
+            assert topics.dtype == np.float32 and topics.shape == (16, 7)
+            np.testing.assert_allclose(docs, docvecs[16:32], rtol=1e-6)
+            np.testing.assert_allclose(topics, topic_matrix[topic_index[16:32]], rtol=1e-3)
+
+    data_generator = DataGenerator(docvecs, topic_index, labels=labels, batch_size=16,
+                                   tables=[None, csr_matrix(topic_matrix)])
+    prefetcher = PrefetchGenerator(data_generator, prefetch=2, workers=2, use_processes=True)
+    (docs, topics), _ = prefetcher[0]
+    np.testing.assert_allclose(topics, topic_matrix[topic_index[data_generator.batch_indexes(0)]], rtol=1e-6)
+    prefetcher.close()
+
+    # int8 vectors are dequantized per batch, also in worker processes
+    from doc_embedding.docvector_store import QuantizedVectors
+    scales = np.full(7, 1 / 127, dtype=np.float32)
+    codes = np.rint(topic_matrix * 127).astype(np.int8)
+    quantized = QuantizedVectors(codes, scales)
+    for use_processes in (False, True):
+        data_generator = DataGenerator(docvecs, topic_index, labels=labels, batch_size=16, tables=[None, quantized])
+        prefetcher = PrefetchGenerator(data_generator, prefetch=2, workers=2, use_processes=use_processes)
+        (docs, topics), _ = prefetcher[0]
+        assert topics.dtype == np.float32
+        # the exact dequantization, float32 rounding may exceed the 0.5 / 127 bound against topic_matrix
+        np.testing.assert_allclose(topics, (codes * scales)[topic_index[data_generator.batch_indexes(0)]], rtol=1e-6)
+        prefetcher.close()
+
+
+def test_resampled():
+    from types import SimpleNamespace
+    from scipy.sparse import csr_matrix
+    from arcs.data_generator import ResampledDataGenerator
+    from arcs.sampler import NegativeSampler
+
+    doc_table = np.random.rand(500, 4).astype(np.float32)
+    topic_table = csr_matrix(np.eye(2, 6, dtype=np.float32))
+    qrels = SimpleNamespace(qrels={True: {51: {"D%d" % i for i in range(20)}, 52: {"D%d" % i for i in range(20, 30)}},
+                                   False: {51: {"D%d" % i for i in range(30, 50)}, 52: set()}})
+    sampler = NegativeSampler(qrels, ["D%d" % i for i in range(500)], [51, 52], seed=0)
+
+    data_generator = ResampledDataGenerator(sampler, doc_table, topic_table, {51: 1, 52: 0}, [0.7, 0.2, 0.1],
+                                            batch_size=8)
+    epochs = []
+    for _ in range(2):
+        docs = []
+        for i in range(len(data_generator)):
+            (doc_vecs, topic_vecs), labels = data_generator[i]
+            assert doc_vecs.dtype == np.float32 and topic_vecs.shape == (8, 6)
+            rows = data_generator.data[0][data_generator.batch_indexes(i)]
+            np.testing.assert_array_equal(doc_vecs, doc_table[rows])
+            docs.append(rows)
+        epochs.append(np.concatenate(docs))
+        data_generator.on_epoch_end()
+    # 20 + 10 relevant, 6 hard + 3 easy negatives for 51, no hard and 2 easy negatives for 52
+    assert len(data_generator) == 41 // 8
+    assert not np.array_equal(epochs[0], epochs[1])
+
+
+def test_rows_out_of_range():
+    import pytest
+
+    topic_matrix = np.random.rand(4, 7)
+    docvecs = np.random.rand(100, 5)
+    # a stale topic index pointing past the topic matrix
+    with pytest.raises(IndexError):
+        DataGenerator(docvecs, np.full(100, 4), labels=np.zeros(100), tables=[None, topic_matrix])
+    data_generator = DataGenerator(docvecs, np.full(100, 3), labels=np.zeros(100), batch_size=16,
+                                   tables=[None, topic_matrix])
+    with pytest.raises(IndexError):
+        data_generator.get_batch(np.array([0, 100]))
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from arcs.sampler import NegativeSampler
+
+
+def make_qrels():
+    qrels = {True: {51: {"D1", "D2", "D3", "MISSING"}, 52: {"D4"}},
+             False: {51: {"D5", "D6", "D7", "D8", "D9"}, 52: {"D1"}}}
+    return SimpleNamespace(qrels=qrels)
+
+
+def test_sample():
+    doc_list = ["D%d" % i for i in range(1000)]
+    sampler = NegativeSampler(make_qrels(), doc_list, [51, 52, 53], seed=1)
+
+    for _ in range(20):
+        doc_rows, topic_nos, labels = sampler.sample([0.7, 0.2, 0.1])
+        triples = set(zip(doc_rows.tolist(), topic_nos.tolist(), labels.tolist()))
+        assert {(row, topic) for row, topic, label in triples if label == 1} == {(1, 51), (2, 51), (3, 51), (4, 52)}
+
+        # 3 relevant: ceil(3 / 0.7 * 0.2) = 1 hard and ceil(3 / 0.7 * 0.1) = 1 easy negative
+        negatives = [(row, topic) for row, topic, label in zip(doc_rows, topic_nos, labels) if label == 0]
+        hard_51 = [row for row, topic in negatives if topic == 51 and 5 <= row <= 9]
+        assert len(hard_51) == 1
+        assert len(negatives) == 4
+        assert (4, 52) not in negatives and (1, 51) not in negatives
+        assert 53 not in topic_nos
+
+
+def test_hard_with_replacement():
+    doc_list = ["D%d" % i for i in range(100)]
+    sampler = NegativeSampler(make_qrels(), doc_list, [51, 52], seed=2)
+    rows, topic_pos = sampler.sample_hard(np.array([5, 3]))
+    assert sorted(rows[topic_pos == 0].tolist()) == [5, 6, 7, 8, 9]
+    assert rows[topic_pos == 1].tolist() == [1, 1, 1]
+
+    rows, topic_pos = sampler.sample_easy(np.array([50, 50]))
+    assert not np.isin(rows[topic_pos == 0], [1, 2, 3, 5, 6, 7, 8, 9]).any()
+    assert not np.isin(rows[topic_pos == 1], [1, 4]).any()
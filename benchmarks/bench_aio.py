@@ -0,0 +1,64 @@
+"""Benchmark the asyncio ranking front: hundreds of concurrent queries from one event loop.
+
+Usage::
+
+    python -m benchmarks.bench_aio --docs 100000 --queries 500 --in-flight 500
+
+"""
+import argparse
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from tensorflow import keras
+
+from serving.aio import AsyncRanker
+from serving.ranker import Ranker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=300)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--in-flight", type=int, default=500)
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 64])
+    args = parser.parse_args()
+
+    vocab = {"w%d" % i: i for i in range(args.vocab)}
+    docvecs = np.random.rand(args.docs, args.dim).astype(np.float32)
+    inputs = keras.Input(shape=(args.dim,))
+    sbm = keras.Model(inputs, keras.layers.UnitNormalization()(
+        keras.layers.Dense(len(vocab), use_bias=False, name='SBM')(inputs)))
+    model_loader = SimpleNamespace(docvecs=docvecs, sbm=sbm, get_docs_list=lambda: ["D%d" % i for i in range(args.docs)],
+                                   get_docvecs=lambda: docvecs, get_vocab=lambda: vocab)
+    tokenizer = SimpleNamespace(tokenize_batch=lambda texts: [text.split() for text in texts])
+    ranker = Ranker(model_loader, tokenizer=tokenizer)
+    rng = np.random.default_rng(0)
+    texts = [" ".join("w%d" % i for i in rng.integers(0, args.vocab, 4)) for _ in range(args.queries)]
+
+    async def run(max_batch):
+        latencies = []
+        async with AsyncRanker(ranker, max_batch=max_batch, max_in_flight=args.in_flight) as async_ranker:
+            async def query(text):
+                start = time.perf_counter()
+                await async_ranker.rank(text, k=100)
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(query(text) for text in texts))
+            elapsed = time.perf_counter() - start
+            threads = threading.active_count()
+        latencies = np.array(latencies) * 1000
+        print("max batch %-4d qps %7.1f, p50 %8.1f ms, p99 %8.1f ms, %d threads" % (
+            max_batch, len(texts) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), threads))
+
+    for max_batch in args.max_batch:
+        asyncio.run(run(max_batch))
+
+
+if __name__ == '__main__':
+    main()
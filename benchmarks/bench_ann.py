@@ -0,0 +1,58 @@
+"""Benchmark recall@k and latency of the IVF index against brute force search over document vectors.
+
+Usage::
+
+    python -m benchmarks.bench_ann --docs 200000 --dim 300 --lists 1024
+
+Documents are drawn around random topics so the vectors are clustered like Doc2Vec vectors, queries are perturbed
+documents.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from evaluation.ann import BruteForceIndex, IVFIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=300)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--lists", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=1000)
+    parser.add_argument("--metric", default="cosine")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(args.clusters, args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, args.clusters, args.docs)] + \
+        0.5 * rng.normal(size=(args.docs, args.dim)).astype(np.float32)
+    queries = vectors[rng.choice(args.docs, args.queries)] + 0.5 * rng.normal(size=(args.queries, args.dim))
+
+    brute = BruteForceIndex(vectors, metric=args.metric)
+    start = time.perf_counter()
+    exact_rows, _ = brute.search(queries, args.k)
+    brute_ms = (time.perf_counter() - start) / args.queries * 1000
+    print("%-26s recall@%d %6.3f %10.2f ms/query" % ("brute force", args.k, 1.0, brute_ms))
+    start = time.perf_counter()
+    for query in queries[:10]:
+        brute.search(query, args.k)
+    print("%-26s recall@%d %6.3f %10.2f ms/query" % ("brute force, one by one", args.k, 1.0,
+                                                      (time.perf_counter() - start) / 10 * 1000))
+
+    start = time.perf_counter()
+    ivf = IVFIndex(vectors, metric=args.metric, n_lists=args.lists)
+    print("ivf build %.1f s" % (time.perf_counter() - start))
+    for n_probe in (4, 16, 64, 128):
+        start = time.perf_counter()
+        rows, _ = ivf.search(queries, args.k, n_probe=n_probe)
+        elapsed_ms = (time.perf_counter() - start) / args.queries * 1000
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(rows.tolist(), exact_rows.tolist())])
+        print("%-26s recall@%d %6.3f %10.2f ms/query" % ("ivf n_probe=%d" % n_probe, args.k, recall, elapsed_ms))
+
+
+if __name__ == '__main__':
+    main()
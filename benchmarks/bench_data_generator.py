@@ -0,0 +1,87 @@
+"""Micro-benchmark DataGenerator batches/second: per-sample list comprehensions vs vectorized gathers.
+
+Usage::
+
+    python -m benchmarks.bench_data_generator --samples 50000 --dim 1000 --topic-dim 20000
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from arcs.data_generator import DataGenerator, PrefetchGenerator
+
+
+def legacy_batch(data, labels, indexes, constant):
+    """DataGenerator.__data_generation as it was before the vectorized gathers."""
+    inputs = list()
+    if constant:
+        inputs.append(np.array([data[0][i] for i in indexes], dtype='float32'))
+        inputs.append(np.array([data[1].tolist()] * len(indexes), dtype='float32'))
+    else:
+        for d in data:
+            inputs.append(np.array([d[i] for i in indexes], dtype='float32'))
+    return inputs, np.array([labels[i] for i in indexes], dtype=int)
+
+
+def bench(name, batches, get_batch):
+    start = time.perf_counter()
+    for i in range(batches):
+        get_batch(i)
+    elapsed = time.perf_counter() - start
+    print("%-28s %10.1f batches/s" % (name, batches / elapsed))
+
+
+def bench_overlap(name, generator, batches, compute_s):
+    """Consume batches with a simulated model step of compute_s seconds each."""
+    start = time.perf_counter()
+    for i in range(batches):
+        generator[i]
+        time.sleep(compute_s)
+    elapsed = time.perf_counter() - start
+    print("%-28s %10.1f batches/s with %.1f ms model step" % (name, batches / elapsed, compute_s * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--topic-dim", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--compute-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    # inputs as Arcs hands them over: lists of per-sample vectors
+    docvecs = list(np.random.rand(args.samples, args.dim).astype(np.float32))
+    topic_rows = np.random.rand(50, args.topic_dim).astype(np.float32)
+    topicvecs = [topic_rows[i % 50] for i in range(args.samples)]
+    labels = list(np.random.randint(0, 2, args.samples))
+    batches = min(args.batches, args.samples // args.batch_size)
+    indexes = np.random.permutation(args.samples)
+
+    def batch_indexes(i):
+        return indexes[i * args.batch_size:(i + 1) * args.batch_size]
+
+    bench("legacy pairs", batches, lambda i: legacy_batch((docvecs, topicvecs), labels, batch_indexes(i), False))
+    for buffers in (0, 2, 12):
+        generator = DataGenerator(docvecs, topicvecs, labels=labels, batch_size=args.batch_size, buffers=buffers)
+        bench("vectorized pairs buffers=%d" % buffers, batches, generator.__getitem__)
+
+    bench("legacy constant", batches, lambda i: legacy_batch((docvecs, topic_rows[0]), labels, batch_indexes(i), True))
+    generator = DataGenerator(docvecs, topic_rows[0], labels=labels, batch_size=args.batch_size,
+                              sec_input_const=True, buffers=12)
+    bench("vectorized constant", batches, generator.__getitem__)
+
+    generator = DataGenerator(docvecs, topicvecs, labels=labels, batch_size=args.batch_size)
+    bench_overlap("synchronous", generator, batches, args.compute_ms / 1000)
+    for use_processes in (False, True):
+        prefetcher = PrefetchGenerator(generator, prefetch=8, workers=4, use_processes=use_processes)
+        bench_overlap("prefetch %s" % ("processes" if use_processes else "threads"), prefetcher, batches,
+                      args.compute_ms / 1000)
+        prefetcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark float32, float16 and int8 document vector stores: size, random batch reads and the drift of the runs
+of a keyword SBM scoring them.
+
+Usage::
+
+    python -m benchmarks.bench_docvector_store --docs 200000 --dim 1000 --vocab 2000
+
+"""
+import argparse
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from sklearn.preprocessing import normalize
+from tensorflow import keras
+
+from benchmarks.bench_evaluator import Topics
+from doc_embedding.docvector_store import DocVectorStore, convert_store, export_docvecs
+from evaluation.evaluator import Evaluator
+from evaluation.quantization import quantization_report
+from utils import ModelLoader
+
+
+def store_evaluator(store, sbm, topics):
+    model_loader = ModelLoader()
+    model_loader.docvecs, model_loader.sbm = store, sbm
+    return Evaluator(model_loader, topics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=512)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--vocab", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Doc2Vec like vectors: clustered, roughly normal per dimension
+    centers = rng.normal(size=(100, args.dim)).astype(np.float32)
+    vectors = np.empty((args.docs, args.dim), dtype=np.float32)
+    for start in range(0, args.docs, 65536):
+        n = min(65536, args.docs - start)
+        vectors[start: start + n] = centers[rng.integers(0, 100, n)] + rng.normal(size=(n, args.dim))
+    d2v = SimpleNamespace(docvecs=SimpleNamespace(vectors_docs=vectors,
+                                                  index2entity=["DOC-%d" % i for i in range(args.docs)]),
+                          wv=SimpleNamespace(index2word=[]), vector_size=args.dim)
+    inputs = keras.Input(shape=(args.dim,))
+    sbm = keras.Model(inputs, keras.layers.Dense(args.vocab, use_bias=False, name='SBM')(inputs))
+    topics = Topics(normalize(sparse_random(args.topics, args.vocab, density=0.005, format='csr', random_state=0)))
+
+    root = tempfile.mkdtemp()
+    export_docvecs(d2v, os.path.join(root, "float32"))
+    del vectors, d2v
+    reference = store_evaluator(DocVectorStore(os.path.join(root, "float32")), sbm, topics)
+    batches = [np.sort(rng.choice(args.docs, args.batch, replace=False)) for _ in range(args.batches)]
+
+    for dtype in ("float32", "float16", "int8"):
+        if dtype != "float32":
+            convert_store(os.path.join(root, "float32"), os.path.join(root, dtype), dtype)
+        store = DocVectorStore(os.path.join(root, dtype))
+        for rows in batches:
+            store[rows]
+        start = time.perf_counter()
+        for rows in batches:
+            store[rows]
+        elapsed = time.perf_counter() - start
+        print("%-8s %8.1f MB %8.3f ms per batch of %d" % (dtype, os.path.getsize(os.path.join(root, dtype, "vectors.bin"))
+                                                          / 2 ** 20, 1000 * elapsed / args.batches, args.batch))
+        if dtype != "float32":
+            report = quantization_report(reference, store_evaluator(store, sbm, topics), k=1000)
+            print("         " + ", ".join("%s %.6g" % item for item in report.items() if "bytes" not in item[0]))
+
+
+if __name__ == '__main__':
+    main()
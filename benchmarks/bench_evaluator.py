@@ -0,0 +1,60 @@
+"""Benchmark scoring a retrieval SBM: one forward pass per document and topic vs its split document tower.
+
+Usage::
+
+    python -m benchmarks.bench_evaluator --docs 5000 --topics 20
+
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from sklearn.preprocessing import normalize
+from tensorflow import keras
+
+from evaluation.evaluator import Evaluator
+
+
+class Topics:
+    def __init__(self, topics_vecs):
+        self.topics_vecs = topics_vecs
+        self.topic_row_maps = {51 + i: i for i in range(topics_vecs.shape[0])}
+
+    def get_topic_vectors(self, topic_nos, dense=True):
+        vecs = self.topics_vecs[[self.topic_row_maps[topic_no] for topic_no in topic_nos]]
+        return vecs.toarray() if dense else vecs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--vocab", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    docvecs = np.random.rand(args.docs, args.dim).astype(np.float32)
+    topics = Topics(normalize(sparse_random(args.topics, args.vocab, density=0.001, format='csr')))
+    doc_input, topic_input = keras.Input(shape=(args.dim,)), keras.Input(shape=(args.vocab,))
+    projected = keras.layers.Dense(args.vocab, use_bias=False, name='SBM')(doc_input)
+    sbm = keras.Model([doc_input, topic_input], keras.layers.Dot(axes=1, normalize=True)([projected, topic_input]))
+    model_loader = SimpleNamespace(docvecs=docvecs, sbm=sbm, get_docs_list=lambda: range(args.docs),
+                                   get_docvecs=lambda: docvecs)
+
+    results = []
+    for name, split_towers in (("pairwise", False), ("document tower", True)):
+        evaluator = Evaluator(model_loader, topics, workers=args.workers, split_towers=split_towers)
+        scores = np.zeros((args.docs, args.topics), dtype=np.float32)
+        start = time.perf_counter()
+        for doc_rows, topic_nos, block in evaluator.score_blocks():
+            scores[np.ix_(doc_rows, topic_nos - 51)] = block
+        print("%-20s %8.2f s" % (name, time.perf_counter() - start))
+        results.append(scores)
+    print("max abs difference %.2g" % np.abs(results[0] - results[1]).max())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark incremental Doc2Vec inference of new documents: tokenization and inferred docs per second by workers.
+
+Usage::
+
+    python -m benchmarks.bench_incremental --new-docs 2000 --workers 1 2 4
+
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+
+from doc_embedding.docvector_store import DocVectorStore, write_store
+from doc_embedding.incremental import DocInferencer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=5000, help="documents the model is trained on")
+    parser.add_argument("--new-docs", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=300, help="words per document")
+    parser.add_argument("--dim", type=int, default=300)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocab = np.array(["w%d" % i for i in range(5000)])
+    # zipf like word frequencies
+    weights = 1 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+
+    def random_docs(n):
+        return [vocab[rng.choice(len(vocab), args.words, p=weights)].tolist() for _ in range(n)]
+
+    corpus = [TaggedDocument(words, ["DOC-%d" % i]) for i, words in enumerate(random_docs(args.docs))]
+    d2v = Doc2Vec(corpus, dm=0, dbow_words=1, vector_size=args.dim, window=8, min_count=5, epochs=args.epochs,
+                  workers=os.cpu_count())
+    new_docs = random_docs(args.new_docs)
+    texts = ["<DOC>\n<DOCNO> NEW-%d </DOCNO>\n<TEXT>\n%s\n</TEXT>\n</DOC>" % (i, " ".join(words))
+             for i, words in enumerate(new_docs[:500])]
+
+    for workers in args.workers:
+        path = tempfile.mkdtemp()
+        write_store(path, np.zeros((args.docs, args.dim), dtype=np.float32), ["DOC-%d" % i for i in range(args.docs)],
+                    [], args.dim)
+        inferencer = DocInferencer(d2v, DocVectorStore(path), workers=workers)
+        if workers == args.workers[0]:
+            inferencer.tokenize(texts[:10])
+            start = time.perf_counter()
+            inferencer.tokenize(texts)
+            print("%-24s %10.0f docs/s" % ("tokenize", len(texts) / (time.perf_counter() - start)))
+        start = time.perf_counter()
+        inferencer.add(["NEW-%d" % i for i in range(args.new_docs)], token_lists=new_docs)
+        print("%-24s %10.0f docs/s" % ("infer + append, %d workers" % workers,
+                                        args.new_docs / (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    main()
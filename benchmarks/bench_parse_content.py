@@ -0,0 +1,71 @@
+"""Benchmark body/title extraction: per-tag scans (previous parse_content) vs the single pass engine.
+
+Usage::
+
+    python -m benchmarks.bench_parse_content --docs 20000
+
+"""
+import argparse
+import random
+import re
+import time
+
+from trec.treccorpus import BODY_TAGS, BODY_END_TAGS, TITLE_TAGS, TITLE_END_TAGS, extract, parse_content, strip_tags
+from benchmarks.bench_treccorpus import WORDS
+
+
+def legacy_parse_content(content):
+    """parse_content as it was before the single pass engine: one scan per body, end and title tag."""
+    text = ""
+    title = None
+    text_tag_start_pos = content.find("<TEXT>")
+    for i in range(0, len(BODY_TAGS)):
+        h1 = [m.end() for m in re.finditer(BODY_TAGS[i], content)]
+        h2 = [m.start() for m in re.finditer(BODY_END_TAGS[i], content)]
+        for j in range(0, len(h1)):
+            text += strip_tags(content, h1[j], h2[j])
+
+    for i in range(0, len(TITLE_TAGS)):
+        if content.find(TITLE_TAGS[i], 0, text_tag_start_pos) >= 0:
+            title = extract(content, TITLE_TAGS[i], TITLE_END_TAGS[i], -1, None)
+            break
+    return text, title
+
+
+def make_content(paragraphs, inner_tags):
+    parts = ["<PARENT> FR881-0001 </PARENT>", "<HL> %s </HL>" % " ".join(random.sample(WORDS, 6)),
+             "<CENTER> %s </CENTER>" % " ".join(random.sample(WORDS, 4)), "<TEXT>"]
+    for _ in range(paragraphs):
+        words = random.choices(WORDS, k=60)
+        for _ in range(inner_tags):
+            words.insert(random.randrange(len(words)), "<!-- PJG 0012 frnewline -->")
+        parts.append("<P> %s </P>" % " ".join(words))
+    parts.append("</TEXT>")
+    return " ".join(parts)
+
+
+def run(func, contents, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in contents:
+            func(content)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for label, paragraphs, inner_tags in (("newswire", 8, 0), ("federal register", 40, 4), ("long FR/CR", 400, 4)):
+        contents = [make_content(paragraphs, inner_tags) for _ in range(max(1, args.docs // paragraphs * 8))]
+        size = sum(len(c) for c in contents) * args.repeat
+        for name, func in (("legacy", legacy_parse_content), ("single pass", parse_content)):
+            elapsed = run(func, contents, args.repeat)
+            print("%-17s %-12s %10.0f docs/s %8.1f MB/s" % (label, name, len(contents) * args.repeat / elapsed,
+                                                         size / 2 ** 20 / elapsed))
+
+
+if __name__ == '__main__':
+    main()
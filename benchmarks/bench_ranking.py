@@ -0,0 +1,49 @@
+"""Benchmark run generation: sorting all scores of every topic vs streaming TopK over score blocks.
+
+Usage::
+
+    python -m benchmarks.bench_ranking --docs 500000 --topics 5
+
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from evaluation.ranking import TopK, write_runs
+from utils import create_trec_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=500000)
+    parser.add_argument("--topics", type=int, default=5, help="the full sort takes about 6 s per topic")
+    parser.add_argument("--block", type=int, default=65536)
+    parser.add_argument("--depth", type=int, default=1000)
+    args = parser.parse_args()
+
+    doc_list = ["DOC-%07d" % i for i in range(args.docs)]
+    scores = np.random.rand(args.docs, args.topics).astype(np.float32)
+    runs_dir = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    for j in range(args.topics):
+        # as the evaluation notebook does: a dict of all scores, sorted, written line by line
+        result = dict(zip(doc_list, scores[:, j:j + 1]))
+        sorted_result = sorted(result.items(), key=lambda x: x[1], reverse=True)
+        create_trec_runs(os.path.join(runs_dir, "legacy.txt"), sorted_result, 51 + j, top=args.depth)
+    print("%-20s %8.2f s" % ("full sort", time.perf_counter() - start))
+
+    start = time.perf_counter()
+    top_k = TopK(range(51, 51 + args.topics), k=args.depth)
+    for block in range(0, args.docs, args.block):
+        top_k.push(np.arange(block, min(block + args.block, args.docs)), top_k.topic_nos,
+                   scores[block: block + args.block])
+    write_runs(os.path.join(runs_dir, "topk.txt"), top_k, doc_list, depth=args.depth)
+    print("%-20s %8.2f s" % ("streaming top-k", time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark building an Arcs training set: per-topic scans of the document list vs the vectorized NegativeSampler.
+
+Usage::
+
+    python -m benchmarks.bench_sampler --docs 500000 --topics 400
+
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from arcs.arcs import DOC_RATIO, get_hard_easy_neg_numbers
+from arcs.sampler import NegativeSampler
+from utils import sample_instance
+
+
+def make_qrels(doc_list, topics, judged):
+    qrels = {True: {}, False: {}}
+    for topic_no in range(topics):
+        docs = random.sample(doc_list, judged)
+        qrels[True][topic_no] = set(docs[:judged // 10])
+        qrels[False][topic_no] = set(docs[judged // 10:])
+    return SimpleNamespace(qrels=qrels)
+
+
+def legacy_training_set(qrels, doc_list, topics):
+    """Arcs.create_training_set as it was before the sampler, one full scan of doc_list per topic."""
+    ts_doc_list = []
+    for topic_no in range(topics):
+        relevant_docs = list(qrels.qrels[True][topic_no])
+        irrelevant_docs = list(qrels.qrels[False][topic_no])
+        ts_doc_list.extend(relevant_docs)
+        hard_neg_count, easy_neg_count = get_hard_easy_neg_numbers(len(relevant_docs))
+        ts_doc_list.extend(random.sample(irrelevant_docs, hard_neg_count))
+        exclusive_set = set(relevant_docs)
+        exclusive_set.update(irrelevant_docs)
+        ts_doc_list.extend(sample_instance(easy_neg_count, doc_list, exclusive_set=exclusive_set))
+    return ts_doc_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=500000)
+    parser.add_argument("--topics", type=int, default=400)
+    parser.add_argument("--judged", type=int, default=1500)
+    parser.add_argument("--legacy-topics", type=int, default=20, help="topics timed with the legacy scan")
+    args = parser.parse_args()
+
+    doc_list = ["DOC-%07d" % i for i in range(args.docs)]
+    qrels = make_qrels(doc_list, args.topics, args.judged)
+
+    start = time.perf_counter()
+    legacy_training_set(qrels, doc_list, args.legacy_topics)
+    elapsed = (time.perf_counter() - start) * args.topics / args.legacy_topics
+    print("%-24s %8.2f s per training set (extrapolated from %d topics)" % ("legacy", elapsed, args.legacy_topics))
+
+    start = time.perf_counter()
+    sampler = NegativeSampler(qrels, doc_list, range(args.topics))
+    print("%-24s %8.2f s once" % ("sampler index", time.perf_counter() - start))
+    start = time.perf_counter()
+    for _ in range(10):
+        doc_rows, _, _ = sampler.sample(DOC_RATIO)
+    print("%-24s %8.3f s per training set, %d triples" % ("sampler", (time.perf_counter() - start) / 10,
+                                                         len(doc_rows)))
+
+
+if __name__ == '__main__':
+    main()
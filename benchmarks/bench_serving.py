@@ -0,0 +1,52 @@
+"""Benchmark the HTTP ranking server: latency and QPS without and with micro-batching.
+
+Usage::
+
+    python -m benchmarks.bench_serving --docs 100000 --concurrency 32 --requests 500
+
+"""
+import argparse
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+from tensorflow import keras
+
+from serving.loadgen import DEFAULT_QUERIES, format_summary, http_client, run_load
+from serving.ranker import Ranker
+from serving.server import RankingServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=300)
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--k", type=int, default=100)
+    args = parser.parse_args()
+
+    words = sorted({word for query in DEFAULT_QUERIES for word in query.split()})
+    vocab = {word: i for i, word in enumerate(words + ["w%d" % i for i in range(args.vocab - len(words))])}
+    docvecs = np.random.rand(args.docs, args.dim).astype(np.float32)
+    inputs = keras.Input(shape=(args.dim,))
+    sbm = keras.Model(inputs, keras.layers.UnitNormalization()(
+        keras.layers.Dense(len(vocab), use_bias=False, name='SBM')(inputs)))
+    model_loader = SimpleNamespace(docvecs=docvecs, sbm=sbm, get_docs_list=lambda: ["D%d" % i for i in range(args.docs)],
+                                   get_docvecs=lambda: docvecs, get_vocab=lambda: vocab)
+    tokenizer = SimpleNamespace(tokenize_batch=lambda texts: [text.split() for text in texts])
+    ranker = Ranker(model_loader, tokenizer=tokenizer)
+    queries = [{"text": text, "k": args.k} for text in DEFAULT_QUERIES]
+
+    for name, max_batch in (("no batching", 1), ("micro-batching", 32)):
+        server = RankingServer(("127.0.0.1", 0), ranker, max_batch=max_batch, max_wait=0.002)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        summary = run_load(http_client(*server.server_address), queries, args.concurrency, args.requests)
+        print("%-16s %s, mean batch %.1f" % (name, format_summary(summary), server.stats_summary()["mean_batch"]))
+        server.shutdown()
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark one doc2vec epoch over the pipe-delimited lemmatized file vs the binary token corpus.
+
+Usage::
+
+    python -m benchmarks.bench_tokencorpus --docs 200000 --workdir /tmp/token_bench
+
+"""
+import argparse
+import os
+import random
+import time
+
+from trec.tokencorpus import TokenCorpus, convert_content
+from utils import read_content
+
+
+def generate(filename, docs, vocab_size=100000, doc_len=300):
+    vocab = ["w%x" % (i * 2654435761 % 16 ** 7) for i in range(vocab_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+    with open(filename, 'w') as fp:
+        for i in range(docs):
+            tokens = random.choices(vocab, weights, k=random.randint(doc_len // 4, doc_len * 2))
+            fp.write("SYN-%d|title %d|%s\n" % (i, i, " ".join(tokens)))
+
+
+def epoch(documents):
+    start = time.perf_counter()
+    tokens = 0
+    for words, _ in documents:
+        tokens += len(words)
+    return tokens, time.perf_counter() - start
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workdir", default="token_bench")
+    parser.add_argument("--docs", type=int, default=50000)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    text_file = os.path.join(args.workdir, "lemmatized.dat")
+    token_path = os.path.join(args.workdir, "tokens")
+    generate(text_file, args.docs)
+    start = time.perf_counter()
+    convert_content(text_file, token_path)
+    print("convert %.2f s" % (time.perf_counter() - start))
+
+    print("text file    %8.1f MB" % (os.path.getsize(text_file) / 2 ** 20))
+    print("token corpus %8.1f MB" % (folder_size(token_path) / 2 ** 20))
+    for name, documents in (("read_content", read_content(text_file)), ("TokenCorpus", TokenCorpus(token_path))):
+        tokens, elapsed = epoch(documents)
+        print("%-12s %8.2f s/epoch %10.0f tokens/s" % (name, elapsed, tokens / elapsed))
+
+
+if __name__ == '__main__':
+    main()
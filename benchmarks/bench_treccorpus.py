@@ -0,0 +1,75 @@
+"""Benchmark document splitting in TrecCorpus: line reader vs byte level scanner.
+
+Usage::
+
+    python -m benchmarks.bench_treccorpus --size-mb 4096 --workdir /tmp/trec_bench
+
+"""
+import argparse
+import os
+import random
+import time
+
+from trec.treccorpus import TrecCorpus
+
+WORDS = ["federal", "register", "agency", "rule", "notice", "section", "amendment", "proposed",
+         "market", "stock", "price", "company", "report", "government", "court", "energy"]
+
+
+def make_doc(doc_no, paragraphs):
+    lines = ["<DOC>", "<DOCNO> %s </DOCNO>" % doc_no, "<HEAD> %s </HEAD>" % " ".join(random.sample(WORDS, 6)),
+             "<TEXT>"]
+    for _ in range(paragraphs):
+        lines.append("<P>")
+        lines.extend(" ".join(random.choices(WORDS, k=12)) for _ in range(5))
+        lines.append("</P>")
+    lines.extend(["</TEXT>", "</DOC>", ""])
+    return "\n".join(lines)
+
+
+def generate(workdir, size_mb, file_mb=256, long_doc_ratio=0.02):
+    """Write synthetic TREC files mixing newswire sized and long FR/CR sized documents."""
+    os.makedirs(workdir, exist_ok=True)
+    templates = [make_doc("SYN-%d" % i, 3) for i in range(50)]
+    long_templates = [make_doc("SYN-L%d" % i, 2000) for i in range(5)]
+    written = 0
+    file_no = 0
+    while written < size_mb * 2 ** 20:
+        with open(os.path.join(workdir, "syn%03d.dat" % file_no), "w") as f:
+            file_written = 0
+            while file_written < file_mb * 2 ** 20:
+                doc = random.choice(long_templates if random.random() < long_doc_ratio else templates)
+                f.write(doc)
+                file_written += len(doc)
+        written += file_written
+        file_no += 1
+    return written
+
+
+def run(corpus):
+    start = time.perf_counter()
+    count = 0
+    for _ in corpus.parse_file():
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workdir", default="trec_bench")
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--skip-generate", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        generate(args.workdir, args.size_mb)
+    total = sum(os.path.getsize(os.path.join(args.workdir, f)) for f in os.listdir(args.workdir))
+
+    for name, use_scanner in (("read_doc", False), ("scan_docs", True)):
+        corpus = TrecCorpus(args.workdir, dictionary={}, use_scanner=use_scanner)
+        count, elapsed = run(corpus)
+        print("%-10s %8d docs %8.2f s %8.1f MB/s" % (name, count, elapsed, total / 2 ** 20 / elapsed))
+
+
+if __name__ == '__main__':
+    main()
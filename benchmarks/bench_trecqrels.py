@@ -0,0 +1,86 @@
+"""Benchmark TrecQrels dict-of-sets against the integer coded QrelsIndex: memory, membership and sampling.
+
+Usage::
+
+    python -m benchmarks.bench_trecqrels --docs 500000 --topics 400 --judged 1500
+
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+from trec.trecqrels import QrelsIndex, TrecQrels
+
+
+def build_qrels(doc_list, topics, judged):
+    """Dict-of-sets as TrecQrels.init builds it."""
+    qrels = {}
+    for topic_no in range(topics):
+        for i, doc_no in enumerate(random.sample(doc_list, judged)):
+            qrels.setdefault(i < judged // 10, {}).setdefault(topic_no, set()).add(doc_no)
+    return qrels
+
+
+def timed(name, calls, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print("%-34s %10.2f us per call" % (name, elapsed / calls * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=500000)
+    parser.add_argument("--topics", type=int, default=400)
+    parser.add_argument("--judged", type=int, default=1500)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    doc_list = ["DOC-%07d" % i for i in range(args.docs)]
+    doc_index = {doc_no: i for i, doc_no in enumerate(doc_list)}
+
+    tracemalloc.start()
+    qrels = SimpleNamespace(qrels=build_qrels(doc_list, args.topics, args.judged))
+    sets_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    index = QrelsIndex(qrels, doc_list, doc_index=doc_index)
+    print("%-34s %10.2f s" % ("index build", time.perf_counter() - start))
+    print("%-34s %10.1f MB" % ("dict-of-sets memory", sets_bytes / 2 ** 20))
+    print("%-34s %10.1f MB" % ("index memory", index.nbytes() / 2 ** 20))
+
+    topic_nos = np.random.randint(0, args.topics, args.lookups)
+    rows = np.random.randint(0, args.docs, args.lookups)
+    pairs = list(zip(topic_nos.tolist(), [doc_list[row] for row in rows]))
+    legacy = TrecQrels.__new__(TrecQrels)
+    legacy.qrels = qrels.qrels
+
+    timed("contains dict-of-sets", len(pairs),
+          lambda: [legacy.contains(topic_no, doc_no, False) for topic_no, doc_no in pairs])
+    timed("contains index", len(pairs),
+          lambda: [index.contains(topic_no, doc_no, False) for topic_no, doc_no in pairs])
+    timed("contains_ids index, 1000 per call", len(pairs),
+          lambda: [index.contains_ids(topic_no, rows[i: i + 1000], False)
+                   for i, topic_no in zip(range(0, len(rows), 1000), topic_nos[::1000].tolist())])
+
+    timed("get_doc_list dict-of-sets", args.topics,
+          lambda: [legacy.get_doc_list(topic_no, False) for topic_no in range(args.topics)])
+    timed("get_ids index", args.topics, lambda: [index.get_ids(topic_no, False) for topic_no in range(args.topics)])
+
+    if sys.version_info < (3, 11):
+        timed("get_random_docs dict-of-sets", args.topics,
+              lambda: [random.sample(legacy.qrels[False][topic_no], 300) for topic_no in range(args.topics)])
+    timed("get_random_docs (tuple)", args.topics,
+          lambda: [legacy.get_random_docs(300, topic_no) for topic_no in range(args.topics)])
+    rng = np.random.default_rng()
+    timed("sample index", args.topics, lambda: [index.sample(300, topic_no, rng=rng) for topic_no in range(args.topics)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+
+import numpy as np
+from gensim.models import Doc2Vec
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.bin"
+DOCS_FILE = "doc_nos.txt"
+VOCAB_FILE = "vocab.txt"
+SCALES_FILE = "scales.npy"
+
+EXPORT_BLOCK = 65536
+STORE_DTYPES = ("float32", "float16", "int8")
+INT8_MAX = 127
+
+
+def export_docvecs(d2v, path, dtype="float32"):
+    """
+    Export document vectors, doc_nos and vocabulary of a Doc2Vec model into a :class:`DocVectorStore` folder.
+    :param d2v: Doc2Vec model or model file
+    :param path: folder of the store to be created
+    :param dtype: "float32", "float16" or "int8" storage, int8 is scaled per dimension
+    :return: None
+    """
+    if isinstance(d2v, str):
+        d2v = Doc2Vec.load(d2v)
+    write_store(path, d2v.docvecs.vectors_docs, d2v.docvecs.index2entity, d2v.wv.index2word, d2v.vector_size,
+                dtype=dtype)
+
+
+def convert_store(path, new_path, dtype):
+    """
+    Copy a :class:`DocVectorStore` into another storage dtype, e.g. to quantize a float32 store to int8.
+    :param path: folder of the store
+    :param new_path: folder of the store to be created
+    :param dtype: storage dtype of the new store
+    :return: None
+    """
+    store = DocVectorStore(path)
+    write_store(new_path, store.vectors_docs, store.index2entity, store.index2word, store.vector_size, dtype=dtype)
+
+
+def int8_scales(vectors):
+    'Per dimension scales mapping the largest absolute value of every dimension to 127'
+    max_abs = np.zeros(vectors.shape[1], dtype=np.float32)
+    for start in range(0, len(vectors), EXPORT_BLOCK):
+        block = np.abs(np.asarray(vectors[start: start + EXPORT_BLOCK], dtype=np.float32))
+        if len(block):
+            np.maximum(max_abs, block.max(axis=0), out=max_abs)
+    return np.where(max_abs > 0, max_abs / INT8_MAX, 1).astype(np.float32)
+
+
+def write_store(path, vectors, doc_nos, words, vector_size, dtype="float32"):
+    """
+    Write the files of a :class:`DocVectorStore`, vectors block by block.
+    :param path: folder of the store to be created
+    :param vectors: document vectors, any array-like supporting slices
+    :param doc_nos: doc_no of every vector
+    :param words: vocabulary in index order
+    :param vector_size: dimension of the vectors
+    :param dtype: "float32", "float16" or "int8" storage
+    :return: None
+    """
+    assert dtype in STORE_DTYPES
+    os.makedirs(path, exist_ok=True)
+
+    scales = int8_scales(vectors) if dtype == "int8" else None
+    with open(os.path.join(path, VECTORS_FILE), 'wb') as fp:
+        for start in range(0, len(vectors), EXPORT_BLOCK):
+            block = np.asarray(vectors[start: start + EXPORT_BLOCK], dtype=np.float32)
+            if scales is not None:
+                block = np.clip(np.rint(block / scales), -INT8_MAX, INT8_MAX)
+            np.ascontiguousarray(block, dtype=dtype).tofile(fp)
+    if scales is not None:
+        np.save(os.path.join(path, SCALES_FILE), scales)
+    with open(os.path.join(path, DOCS_FILE), 'w', encoding="utf-8") as fp:
+        for doc_no in doc_nos:
+            fp.write(doc_no + "\n")
+    with open(os.path.join(path, VOCAB_FILE), 'w', encoding="utf-8") as fp:
+        for word in words:
+            fp.write(word + "\n")
+    write_meta(path, {"dtype": dtype, "count": len(vectors), "vector_size": vector_size})
+    logger.info("exported %d document vectors (%s) into %s", len(vectors), dtype, path)
+
+
+def write_meta(path, meta):
+    tmp_file = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp_file, 'w') as fp:
+        json.dump(meta, fp)
+    os.replace(tmp_file, os.path.join(path, META_FILE))
+
+
+class QuantizedVectors:
+    """int8 document vectors with one float32 scale per dimension, dequantized to float32 when indexed.
+
+    Indexing by a row, a slice or an array of rows dequantizes only those rows, so a batch costs a quarter of the
+    float32 memory bandwidth. `codes` is the int8 memmap of the store, to share it with other processes.
+    """
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+        self.shape = codes.shape
+        self.ndim = codes.ndim
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        # (rows, dims) keys pick the scales of the dims
+        scales = self.scales[key[1:]] if isinstance(key, tuple) else self.scales
+        return np.multiply(self.codes[key], scales, dtype=np.float32)
+
+    def __array__(self, dtype=None, copy=None):
+        'Dequantize all vectors, only for small stores'
+        return np.asarray(self[:], dtype=dtype)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+
+class DocVectorStore:
+    """Memory mapped document vectors exported from a Doc2Vec model by :func:`export_docvecs`.
+
+    Only the document vectors, the doc_no index and the vocabulary are loaded, so opening a store takes seconds
+    instead of a full `Doc2Vec.load`, and worker processes mapping the same store share its pages.
+    The store mimics the parts of `Doc2Vec.docvecs` used in this project (`index2entity`, `vectors_docs`,
+    `store[doc_no]`), and `vocab` can be passed wherever `d2v.wv.vocab` was used to vectorize topics.
+
+    Vectors are stored as float32, float16 or int8 scaled per dimension (half and a quarter of the memory), and
+    read back as float32. The `vectors_docs` of an int8 store is a :class:`QuantizedVectors`.
+    New documents are added by :meth:`append`, e.g. with vectors inferred by
+    :class:`doc_embedding.incremental.DocInferencer`.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> export_docvecs("F:/Models/doc2vec_trec_d1000.model", "F:/Models/docvecs_d1000/")
+        >>> store = DocVectorStore("F:/Models/docvecs_d1000/")
+        >>> store["WSJ870807-0086"]
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r') as fp:
+            self.meta = json.load(fp)
+        self.vector_size = self.meta["vector_size"]
+        self.dtype = np.dtype(self.meta["dtype"])
+
+        count = self.meta["count"]
+        self.scales = np.load(os.path.join(path, SCALES_FILE)) if self.dtype == np.int8 else None
+        self.vectors_docs = self._map_vectors(count)
+
+        with open(os.path.join(path, DOCS_FILE), 'rb') as fp:
+            lines = fp.readlines()[:count]
+        self.index2entity = [line.decode("utf-8").rstrip("\n") for line in lines]
+        # end of the committed doc_nos, an interrupted append may have written more
+        self.docs_end = sum(len(line) for line in lines)
+        self.doc_index = {doc_no: i for i, doc_no in enumerate(self.index2entity)}
+
+        self.index2word = []
+        if os.path.exists(os.path.join(path, VOCAB_FILE)):
+            with open(os.path.join(path, VOCAB_FILE), 'r', encoding="utf-8") as fp:
+                self.index2word = [line.rstrip("\n") for line in fp]
+        self.vocab = {word: i for i, word in enumerate(self.index2word)}
+
+    def _map_vectors(self, count):
+        vectors = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=self.dtype, mode='r',
+                            shape=(count, self.vector_size)) if count else \
+            np.empty((0, self.vector_size), dtype=self.dtype)
+        return QuantizedVectors(vectors, self.scales) if self.scales is not None else vectors
+
+    def __len__(self):
+        return len(self.index2entity)
+
+    def __contains__(self, doc_no):
+        return doc_no in self.doc_index
+
+    def __getitem__(self, key):
+        """
+        Get document vectors as float32.
+        :param key: a doc_no, a row number, a slice or an array of row numbers
+        :return: a vector or a matrix of vectors
+        """
+        if isinstance(key, str):
+            key = self.doc_index[key]
+        return np.asarray(self.vectors_docs[key], dtype=np.float32)
+
+    def get_rows(self, doc_nos):
+        """
+        Row numbers of many documents.
+        :param doc_nos: iterable of doc_nos
+        :return: int64 array of rows
+        """
+        return np.fromiter((self.doc_index[doc_no] for doc_no in doc_nos), dtype=np.int64)
+
+    def append(self, vectors, doc_nos):
+        """
+        Add the vectors of new documents at the end of the store, without rewriting the existing vectors and doc_nos.
+        Vectors of an int8 store are quantized with the scales of the store, values beyond them are clipped.
+        The count in the meta file is written last, so an interrupted append leaves the store as it was.
+        :param vectors: float array of shape (len(doc_nos), vector_size)
+        :param doc_nos: doc_nos of the new documents, not yet in the store
+        :return: int64 array of the rows of the new documents
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.vector_size)
+        doc_nos = list(doc_nos)
+        assert len(vectors) == len(doc_nos)
+        assert len(set(doc_nos)) == len(doc_nos) and not any(doc_no in self.doc_index for doc_no in doc_nos), \
+            "documents already in the store"
+        count = len(self.index2entity)
+        if self.scales is not None:
+            vectors = np.clip(np.rint(vectors / self.scales), -INT8_MAX, INT8_MAX)
+
+        # drop what an interrupted append may have left behind the last committed row
+        with open(os.path.join(self.path, VECTORS_FILE), 'ab') as fp:
+            fp.truncate(count * self.vector_size * self.dtype.itemsize)
+            np.ascontiguousarray(vectors, dtype=self.dtype).tofile(fp)
+        lines = "".join(doc_no + "\n" for doc_no in doc_nos).encode("utf-8")
+        with open(os.path.join(self.path, DOCS_FILE), 'ab') as fp:
+            fp.truncate(self.docs_end)
+            fp.write(lines)
+        self.meta["count"] = count + len(doc_nos)
+        write_meta(self.path, self.meta)
+
+        self.index2entity.extend(doc_nos)
+        self.docs_end += len(lines)
+        self.doc_index.update((doc_no, count + i) for i, doc_no in enumerate(doc_nos))
+        self.vectors_docs = self._map_vectors(len(self.index2entity))
+        logger.info("appended %d document vectors to %s", len(doc_nos), self.path)
+        return np.arange(count, count + len(doc_nos), dtype=np.int64)
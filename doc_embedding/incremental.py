@@ -0,0 +1,116 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from trec.treccorpus import TOKEN_MAX_LEN, TOKEN_MIN_LEN, parse_doc
+from utils import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+INFER_CHUNK = 64
+
+
+class DocInferencer:
+    """Add new documents to a :class:`~doc_embedding.docvector_store.DocVectorStore` without retraining Doc2Vec.
+
+    Only the new documents are tokenized, by the same path :meth:`trec.treccorpus.TrecCorpus.get_texts` tokenized
+    the training corpus with (:func:`trec.treccorpus.parse_doc`, then `Tokenizer.tokenize_pipe`), and their vectors
+    are inferred by `Doc2Vec.infer_vector` in a pool of threads sharing the one loaded model (gensim's inference
+    routines release the GIL). The vectors are appended to the store and to any nearest
+    neighbour index over it (see :mod:`evaluation.ann`), so the new documents are retrievable right away.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> d2v = Doc2Vec.load("F:/Models/doc2vec_trec_d1000.model")
+        >>> inferencer = DocInferencer(d2v, DocVectorStore("F:/Models/docvecs_d1000/"), workers=8)
+        >>> rows = inferencer.add(["NEW-0001", "NEW-0002"], [sgml_doc_1, sgml_doc_2])
+
+    """
+
+    def __init__(self, d2v, store, tokenizer=None, workers=None, epochs=None, ann_indexes=(), merge_title=True,
+                 strip_noise=True):
+        """
+
+        Parameters
+        ----------
+        d2v : :class:`gensim.models.Doc2Vec`
+            Trained model the store was exported from.
+        store : :class:`~doc_embedding.docvector_store.DocVectorStore`
+            Store the new documents are appended to.
+        tokenizer : :class:`utils.Tokenizer`, optional
+            Tokenizer of the training corpus, the one of :class:`trec.treccorpus.TrecCorpus` if None.
+        workers : int, optional
+            Number of inference threads, all cores if None.
+        epochs : int, optional
+            Inference epochs, the training epochs of the model if None.
+        ann_indexes : iterable, optional
+            Indexes over the vectors of the store, extended after every append.
+        merge_title : bool, optional
+            If True - merge document's title into body text, as the training corpus did.
+        strip_noise : bool, optional
+            If True - drop noise tags together with their content, as the training corpus did.
+
+        """
+        assert store.vector_size == d2v.vector_size
+        self.d2v = d2v
+        self.store = store
+        self.tokenizer = tokenizer
+        self.workers = workers or cpu_count()
+        self.epochs = epochs
+        self.ann_indexes = list(ann_indexes)
+        self.merge_title = merge_title
+        self.strip_noise = strip_noise
+
+    def tokenize(self, contents, batch_size=128, n_process=1):
+        """
+        Tokenize new documents into the tokens :meth:`trec.treccorpus.TrecCorpus.get_texts` yields for them.
+        :param contents: TREC formatted documents, `<DOC>` ... `</DOC>` or the content after their `</DOCNO>`
+        :param batch_size: number of texts buffered per spacy batch
+        :param n_process: number of spacy processes, -1 use all cores
+        :return: a list of lists of tokens
+        """
+        if self.tokenizer is None:
+            self.tokenizer = Tokenizer(minimum_len=TOKEN_MIN_LEN, maximum_len=TOKEN_MAX_LEN, lowercase=True,
+                                       output_lemma=True, use_stopwords=True)
+        texts = ((parse_doc(content, self.merge_title, self.strip_noise)[0], None) for content in contents)
+        return [tokens for tokens, _ in self.tokenizer.tokenize_pipe(texts, n_process=n_process,
+                                                                     batch_size=batch_size)]
+
+    def _infer_chunk(self, token_lists):
+        return [self.d2v.infer_vector(tokens, epochs=self.epochs) for tokens in token_lists]
+
+    def infer(self, token_lists):
+        """
+        Infer the vectors of tokenized documents in parallel.
+        :param token_lists: a list of lists of tokens
+        :return: float32 array of shape (len(token_lists), vector_size), in input order
+        """
+        vectors = np.empty((len(token_lists), self.d2v.vector_size), dtype=np.float32)
+        chunks = range(0, len(token_lists), INFER_CHUNK)
+        with ThreadPoolExecutor(self.workers) as executor:
+            for start, chunk in zip(chunks, executor.map(self._infer_chunk,
+                                                         (token_lists[start: start + INFER_CHUNK] for start in chunks))):
+                if chunk:
+                    vectors[start: start + len(chunk)] = chunk
+        return vectors
+
+    def add(self, doc_nos, texts=None, token_lists=None):
+        """
+        Tokenize, infer and append new documents to the store and the indexes.
+        :param doc_nos: doc_nos of the new documents
+        :param texts: TREC formatted documents, see :meth:`tokenize`
+        :param token_lists: already tokenized documents instead of texts
+        :return: int64 array of the rows of the new documents in the store
+        """
+        assert (texts is None) != (token_lists is None)
+        if token_lists is None:
+            token_lists = self.tokenize(texts)
+        rows = self.store.append(self.infer(token_lists), doc_nos)
+        for index in self.ann_indexes:
+            index.add(self.store.vectors_docs)
+        logger.info("added %d documents, %d in the store", len(rows), len(self.store))
+        return rows
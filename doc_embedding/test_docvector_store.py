@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from doc_embedding.docvector_store import DocVectorStore, QuantizedVectors, convert_store, export_docvecs
+
+
+def fake_d2v(count=5, vector_size=4):
+    vectors = np.random.rand(count, vector_size).astype(np.float32)
+    return SimpleNamespace(docvecs=SimpleNamespace(vectors_docs=vectors,
+                                                   index2entity=["DOC-%d" % i for i in range(count)]),
+                           wv=SimpleNamespace(index2word=["market", "stock", "price"]),
+                           vector_size=vector_size)
+
+
+def test_export_load(tmp_path):
+    d2v = fake_d2v()
+    export_docvecs(d2v, str(tmp_path))
+
+    store = DocVectorStore(str(tmp_path))
+    assert len(store) == 5
+    assert store.index2entity == d2v.docvecs.index2entity
+    assert isinstance(store.vectors_docs, np.memmap)
+    np.testing.assert_array_equal(store.vectors_docs, d2v.docvecs.vectors_docs)
+    np.testing.assert_array_equal(store["DOC-3"], d2v.docvecs.vectors_docs[3])
+    np.testing.assert_array_equal(store[np.array([4, 0])], d2v.docvecs.vectors_docs[[4, 0]])
+    assert list(store.get_rows(["DOC-2", "DOC-0"])) == [2, 0]
+    assert store.vocab == {"market": 0, "stock": 1, "price": 2}
+
+
+def test_float16(tmp_path):
+    d2v = fake_d2v()
+    export_docvecs(d2v, str(tmp_path), dtype="float16")
+
+    store = DocVectorStore(str(tmp_path))
+    assert store.vectors_docs.dtype == np.float16
+    assert store["DOC-1"].dtype == np.float32
+    np.testing.assert_allclose(store["DOC-1"], d2v.docvecs.vectors_docs[1], rtol=1e-3)
+
+
+def test_int8(tmp_path):
+    d2v = fake_d2v(count=50)
+    d2v.docvecs.vectors_docs[:, 2] = 0
+    export_docvecs(d2v, str(tmp_path / "float32"))
+    convert_store(str(tmp_path / "float32"), str(tmp_path / "int8"), "int8")
+
+    store = DocVectorStore(str(tmp_path / "int8"))
+    assert isinstance(store.vectors_docs, QuantizedVectors) and store.vectors_docs.codes.dtype == np.int8
+    assert store.index2entity == d2v.docvecs.index2entity and store.vocab["price"] == 2
+    vectors = d2v.docvecs.vectors_docs
+    # half a quantization step of the largest value of every dimension
+    atol = np.abs(vectors).max(axis=0) / 254 + 1e-7
+    for key in (7, slice(3, 9), np.array([40, 1])):
+        assert store[key].dtype == np.float32
+        assert np.all(np.abs(store[key] - vectors[key]) <= atol)
+    assert np.all(store[:, 2] == 0)
+    np.testing.assert_allclose(np.asarray(store.vectors_docs), store[:])
+
+
+def test_append(tmp_path):
+    for dtype in ("float32", "int8"):
+        d2v = fake_d2v()
+        path = str(tmp_path / dtype)
+        export_docvecs(d2v, path, dtype=dtype)
+        store = DocVectorStore(path)
+        # within the scales of the int8 store
+        new_vectors = d2v.docvecs.vectors_docs[[2, 0, 1]] * 0.9
+
+        # an interrupted append left rows and doc_nos behind the committed count
+        with open(str(tmp_path / dtype / "vectors.bin"), 'ab') as fp:
+            fp.write(b"\0" * 7)
+        with open(str(tmp_path / dtype / "doc_nos.txt"), 'a') as fp:
+            fp.write("STALE-0\nSTA")
+        assert store.append(new_vectors, ["NEW-0", "NEW-1", "NEW-2"]).tolist() == [5, 6, 7]
+        assert len(store) == 8 and store.get_rows(["NEW-1"]).tolist() == [6]
+
+        for reopened in (store, DocVectorStore(path)):
+            assert reopened.index2entity[-4:] == ["DOC-4", "NEW-0", "NEW-1", "NEW-2"]
+            np.testing.assert_allclose(reopened[5:], new_vectors, atol=0.01)
+            np.testing.assert_allclose(reopened[:5], d2v.docvecs.vectors_docs, atol=0.01)
+            assert reopened["NEW-2"].dtype == np.float32
+        # only the new doc_nos were written after the committed ones
+        with open(str(tmp_path / dtype / "doc_nos.txt"), 'r') as fp:
+            assert fp.read().split("\n")[-5:] == ["DOC-4", "NEW-0", "NEW-1", "NEW-2", ""]
+    try:
+        store.append(new_vectors[:1], ["DOC-1"])
+        assert False
+    except AssertionError as e:
+        assert "already in the store" in str(e)
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from doc_embedding.docvector_store import DocVectorStore, write_store
+from doc_embedding.incremental import DocInferencer
+from evaluation.ann import IVFIndex
+
+WORDS = ["market", "stock", "price", "trade", "bank", "rate", "oil", "crude", "export", "tariff"]
+
+
+def test_add(tmp_path):
+    rng = np.random.default_rng(0)
+    # a vector per bag of words, to check the order of the inferred vectors
+    d2v = SimpleNamespace(vector_size=8, infer_vector=lambda tokens, epochs=None: np.array(
+        [tokens.count(word) for word in WORDS[:8]], dtype=np.float32))
+    vectors = rng.random((40, 8), dtype=np.float32)
+    write_store(str(tmp_path), vectors, ["DOC-%d" % i for i in range(40)], WORDS, 8)
+    store = DocVectorStore(str(tmp_path))
+    index = IVFIndex(store.vectors_docs, metric="cosine", n_lists=4, train_size=40)
+
+    inferencer = DocInferencer(d2v, store, workers=3, ann_indexes=[index])
+    new_docs = [list(rng.choice(WORDS, 20)) for _ in range(150)]
+    rows = inferencer.add(["NEW-%d" % i for i in range(150)], token_lists=new_docs)
+    assert rows.tolist() == list(range(40, 190)) and len(store) == 190
+    np.testing.assert_array_equal(store[40:], [d2v.infer_vector(tokens) for tokens in new_docs])
+    assert DocVectorStore(str(tmp_path)).index2entity[-1] == "NEW-149"
+
+    assert index.offsets[-1] == 190 and sorted(index.order.tolist()) == list(range(190))
+    new_row = int(index.search(store[100], k=1, n_probe=4)[0][0, 0])
+    assert np.isclose(store[new_row] @ store[100], np.linalg.norm(store[new_row]) * np.linalg.norm(store[100]))
+
+
+def test_tokenize_like_corpus(tmp_path):
+    from trec.test_treccorpus import SAMPLE_DOCS
+    from trec.treccorpus import TrecCorpus
+
+    data = tmp_path / "data"
+    data.mkdir()
+    noisy = SAMPLE_DOCS.replace("first body", "The first bodies were <CENTER> noise </CENTER> mentioned a b")
+    (data / "fr881.dat").write_text(noisy)
+    corpus_tokens = [tokens for tokens, _ in TrecCorpus(str(data), dictionary={}).get_texts()]
+
+    store = SimpleNamespace(vector_size=8)
+    inferencer = DocInferencer(SimpleNamespace(vector_size=8), store)
+    new_docs = ["<DOC>" + doc for doc in noisy.split("<DOC>")[1:]]
+    assert inferencer.tokenize(new_docs) == corpus_tokens
@@ -0,0 +1,233 @@
+import logging
+
+import numpy as np
+
+from evaluation.ranking import TopK
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BLOCK = 65536
+METRICS = ("ip", "cosine")
+
+
+def _normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class BruteForceIndex:
+    """Exact search over document vectors, blockwise so memory mapped vectors are streamed once per query batch.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> index = BruteForceIndex(model_loader.get_docvecs(), metric="cosine")
+        >>> rows, scores = index.search(queries, k=1000)
+
+    """
+
+    def __init__(self, vectors, metric="ip", block=SEARCH_BLOCK):
+        """
+        :param vectors: document vectors, one row per doc row, e.g. `ModelLoader.get_docvecs()`
+        :param metric: "ip" inner product or "cosine"
+        :param block: number of document vectors scored at once
+        """
+        assert metric in METRICS
+        self.vectors = vectors
+        self.metric = metric
+        self.block = block
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, vectors):
+        """
+        Extend the index by documents appended to its vectors, e.g. by :meth:`DocVectorStore.append`.
+        :param vectors: all document vectors, the indexed ones followed by the new ones
+        :return: None
+        """
+        assert len(vectors) >= len(self.vectors)
+        self.vectors = vectors
+
+    def score(self, queries, rows):
+        'Exact scores of queries against some doc rows, n_queries x n_rows'
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.metric == "cosine":
+            vectors = _normalized(vectors)
+        return _normalized(queries) @ vectors.T if self.metric == "cosine" else queries @ vectors.T
+
+    def search(self, queries, k):
+        """
+        :param queries: float32 array of shape (n_queries, dim)
+        :param k: number of neighbours per query
+        :return: int64 doc rows and float32 scores of shape (n_queries, k), best first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        top_k = TopK(range(len(queries)), k=k)
+        for start in range(0, len(self.vectors), self.block):
+            rows = np.arange(start, min(start + self.block, len(self.vectors)))
+            top_k.push(rows, top_k.topic_nos, self.score(queries, slice(start, start + self.block)).T)
+        return _results(top_k, k)
+
+
+class IVFIndex(BruteForceIndex):
+    """Inverted file index: document vectors are clustered by k-means and a query only scores the documents of the
+    `n_probe` clusters whose centroids match it best, trading recall for latency.
+
+    There is no default `n_probe`, the recall it buys depends on the collection: in `benchmarks/bench_ann.py`
+    (200k clustered vectors, 1024 lists, k=1000) recall was 0.39 at n_probe 16, 0.62 at 64 and 0.74 at 128.
+    Measure it on a sample of queries against a :class:`BruteForceIndex` before choosing.
+
+    Only centroids and the cluster assignment (an int array) are kept, candidates are gathered from the original,
+    possibly memory mapped, vectors.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> index = IVFIndex(model_loader.get_docvecs(), n_lists=1024, n_probe=128, metric="cosine")
+        >>> index.save("F:/Models/ivf_d1000.npz")
+        >>> rows, scores = index.search(queries, k=1000)
+
+    """
+
+    def __init__(self, vectors, metric="ip", n_lists=1024, n_probe=None, train_size=65536, iterations=10, seed=0,
+                 block=SEARCH_BLOCK, trained=None):
+        """
+        :param vectors: document vectors, one row per doc row
+        :param metric: "ip" inner product or "cosine"
+        :param n_lists: number of clusters
+        :param n_probe: number of clusters scored per query, None to pass it to every :meth:`search`
+        :param train_size: number of sampled vectors k-means is trained on
+        :param iterations: k-means iterations
+        :param seed: seed of sampling and initialization
+        :param block: number of document vectors assigned at once
+        :param trained: (centroids, order, offsets) of a saved index, skips training
+        """
+        super(IVFIndex, self).__init__(vectors, metric=metric, block=block)
+        self.n_probe = n_probe
+        if trained is not None:
+            self.centroids, self.order, self.offsets = trained
+        else:
+            n_lists = min(n_lists, len(vectors))
+            self.centroids = self.train(n_lists, train_size, iterations, np.random.default_rng(seed))
+            self.order, self.offsets = self.assign()
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return _normalized(vectors) if self.metric == "cosine" else vectors
+
+    def _nearest(self, vectors, centroids):
+        # argmin of squared distances, |v|^2 is constant per row
+        return np.argmax(vectors @ centroids.T - 0.5 * (centroids * centroids).sum(axis=1), axis=1)
+
+    def train(self, n_lists, train_size, iterations, rng):
+        sample_rows = np.sort(rng.choice(len(self.vectors), size=min(train_size, len(self.vectors)), replace=False))
+        sample = self._prepare(self.vectors[sample_rows])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = self._nearest(sample, centroids)
+            counts = np.bincount(nearest, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # restart empty clusters on random samples
+            centroids[~filled] = sample[rng.choice(len(sample), size=int((~filled).sum()))]
+        return centroids
+
+    def assign(self):
+        'Cluster of every vector, as a CSR style order of doc rows plus offsets per cluster'
+        clusters = np.empty(len(self.vectors), dtype=np.int32)
+        for start in range(0, len(self.vectors), self.block):
+            clusters[start: start + self.block] = self._nearest(self._prepare(self.vectors[start: start + self.block]),
+                                                                 self.centroids)
+        order = np.argsort(clusters, kind='stable').astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(clusters, minlength=len(self.centroids)))))
+        return order, offsets
+
+    def add(self, vectors):
+        """
+        Assign documents appended to the vectors to the trained clusters, without retraining.
+        :param vectors: all document vectors, the indexed ones followed by the new ones
+        :return: None
+        """
+        count = len(self.vectors)
+        super(IVFIndex, self).add(vectors)
+        if len(vectors) == count:
+            return
+        clusters = np.concatenate([self._nearest(self._prepare(vectors[start: start + self.block]), self.centroids)
+                                   for start in range(count, len(vectors), self.block)])
+        old_clusters = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        clusters = np.concatenate((old_clusters, clusters))
+        rows = np.concatenate((self.order, np.arange(count, len(vectors), dtype=np.int64)))
+        order = np.argsort(clusters, kind='stable')
+        self.order = rows[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(clusters, minlength=len(self.centroids)))))
+
+    def candidates(self, query, n_probe):
+        'Doc rows of the n_probe clusters best matching the query, in doc row order'
+        n_probe = min(n_probe, len(self.centroids))
+        best = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        rows = np.concatenate([self.order[self.offsets[c]: self.offsets[c + 1]] for c in best])
+        return np.sort(rows)
+
+    def search(self, queries, k, n_probe=None):
+        """
+        :param queries: float32 array of shape (n_queries, dim)
+        :param k: number of neighbours per query
+        :param n_probe: number of clusters scored per query, the one of the index if None
+        :return: int64 doc rows and float32 scores of shape (n_queries, k), best first, padded by -1 rows if the
+            probed clusters hold fewer than k documents
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_probe = n_probe or self.n_probe
+        if not n_probe:
+            raise ValueError("n_probe is not set, pass it to the index or to search")
+        top_k = TopK(range(len(queries)), k=k)
+        for i, query in enumerate(queries):
+            rows = self.candidates(self._prepare(query), n_probe)
+            top_k.push(rows, [i], self.score(query[None], rows).T)
+        return _results(top_k, k)
+
+    def save(self, filename):
+        np.savez(filename, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 metric=np.array(self.metric), n_probe=np.array(self.n_probe or 0))
+
+    @classmethod
+    def load(cls, filename, vectors):
+        """
+        :param filename: file written by :meth:`save`
+        :param vectors: the document vectors the index was built over
+        :return: the index
+        """
+        with np.load(filename) as data:
+            assert int(data["offsets"][-1]) == len(vectors), "index built over other vectors"
+            return cls(vectors, metric=str(data["metric"]), n_probe=int(data["n_probe"]) or None,
+                       trained=(data["centroids"], data["order"], data["offsets"]))
+
+
+def _results(top_k, k):
+    rows = np.full((len(top_k.topic_nos), k), -1, dtype=np.int64)
+    scores = np.full((len(top_k.topic_nos), k), -np.inf, dtype=np.float32)
+    for i in range(len(top_k.topic_nos)):
+        query_rows, query_scores = top_k.result(i)
+        rows[i, :len(query_rows)] = query_rows
+        scores[i, :len(query_rows)] = query_scores
+    return rows, scores
+
+
+# pluggable backends, any object with search(queries, k) -> (rows, scores) can be passed to the Evaluator
+INDEXES = {"brute": BruteForceIndex, "ivf": IVFIndex}
+
+
+def build_index(kind, vectors, **kwargs):
+    """
+    :param kind: name of a backend in `INDEXES`
+    :param vectors: document vectors, one row per doc row
+    :param kwargs: passed to the backend
+    :return: the index
+    """
+    return INDEXES[kind](vectors, **kwargs)
@@ -1,18 +1,337 @@
-from arcs.data_generator import DataGenerator
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.sparse import issparse
+from sklearn.preprocessing import normalize
+from tensorflow import keras
+
+from evaluation.ranking import RUN_DEPTH, RUN_TAG, TopK, write_runs
+
+logger = logging.getLogger(__name__)
+
+DOC_BLOCK = 65536
+TOPIC_BATCH = 100
+PREDICT_BATCH = 512
+# bytes of the dense topic rows of one pairwise prediction, a vocabulary wide row is repeated for every document
+PAIRWISE_BATCH_BYTES = 64 * 1024 * 1024
+
+
+def _producer(tensor):
+    'Layer whose output a Keras tensor is'
+    return tensor._keras_history[0]
+
+
+def _is_scalar_head(layer):
+    'A layer mapping the 1 wide cosine of a retrieval model to its score'
+    if isinstance(layer, keras.layers.Activation):
+        return True
+    return isinstance(layer, keras.layers.Dense) and layer.units == 1 and layer.input.shape[-1] == 1
+
 
 class Evaluator:
-    def __init__(self, model_loader, trec_topic):
+    """Score every document of the collection against every topic with a trained SBM, in bounded memory.
+
+    Documents are scored in blocks of `doc_block` rows against batches of topics, so at most `workers` blocks of
+    float32 scores plus one SBM prediction batch per worker are held at once, instead of the whole
+    collection x topics result. Two kinds of SBM are supported:
+
+    * keyword models with one input, mapping a document vector to a vocabulary sized vector: every prediction
+      batch is projected once, l2 normalized and multiplied with the topic vectors of all topics (cosine)
+    * retrieval models with two inputs (document vector, topic vector) predicting the score of each pair. If the
+      output is the cosine (a normalized `Dot`) of a document projection and the topic input, possibly followed by
+      a scalar head like the `Dense(1, activation='sigmoid')` of the training model, the model is split into its
+      document tower, which is scored like a keyword model: one forward pass per document for all topics
+      instead of one per document and topic. The head is applied to the cosine scores afterwards
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> model_loader = ModelLoader()
+        >>> model_loader.load_docvecs("F:/Models/docvecs_d1000/")
+        >>> model_loader.load_sbm("F:/Models/NN/sbm_keyword")
+        >>> evaluator = Evaluator(model_loader, TrecTopics("F:/Runs/topics"), workers=4)
+        >>> evaluator.init_topics(include_title=True)
+        >>> for doc_rows, topic_nos, scores in evaluator.score_blocks():
+        ...     pass
+
+    """
+
+    def __init__(self, model_loader, trec_topic, doc_block=DOC_BLOCK, topic_batch=TOPIC_BATCH,
+                 batch_size=PREDICT_BATCH, workers=1, projections=None, split_towers=True):
+        """
+
+        Parameters
+        ----------
+        model_loader : :class:`utils.ModelLoader`
+            Loader holding the document vectors and the SBM.
+        trec_topic : :class:`trec.trectopics.TrecTopics`
+            Topics to score.
+        doc_block : int, optional
+            Number of documents scored per block.
+        topic_batch : int, optional
+            Number of topics scored per block by a retrieval model, a keyword model scores all topics per block.
+        batch_size : int, optional
+            Number of documents (or pairs) per SBM prediction.
+        workers : int, optional
+            Number of threads scoring blocks concurrently.
+        projections : array-like, optional
+            Precomputed keyword model predictions of all documents, e.g. memory mapped from
+            :meth:`utils.ModelLoader.get_predict_vec_array` with a cache, used instead of predicting.
+        split_towers : bool, optional
+            If True, score a retrieval model by its document tower when it factorizes, see :meth:`get_doc_tower`.
+
+        """
         self.model_loader = model_loader
         self.topics = trec_topic
+        self.doc_block = doc_block
+        self.topic_batch = topic_batch
+        self.batch_size = batch_size
+        self.workers = workers
+        self.projections = projections
+        self.split_towers = split_towers
+        self.doc_tower = None
+        self.doc_tower_of = None
+        self.score_head = []
+
+    def init_topics(self, include_title=True, include_desc=False, include_narr=False, norm='l2'):
+        """
+        Vectorize the topics with the vocabulary of the loaded Doc2Vec model, kept sparse.
+        :return: None
+        """
+        self.topics.vectorize(vocab_dict=self.model_loader.vocab, include_title=include_title,
+                              include_desc=include_desc, include_narr=include_narr, norm=norm, sparse=True)
+
+    def get_doc_tower(self):
+        """
+        Document tower of a retrieval model whose output is a normalized `Dot` of a projection of the document input
+        and the topic input itself, i.e. score = head(cos(tower(doc), topic)). The head is empty or a scalar head
+        over the cosine (`Dense(1)` on the 1 wide cosine and activations), kept in `score_head`.
+        :return: Keras model mapping a document vector to its projection, None if the SBM does not factorize
+        """
+        sbm = self.model_loader.sbm
+        if self.doc_tower_of is not sbm:
+            self.doc_tower_of, self.doc_tower, self.score_head = sbm, None, []
+            if self.split_towers and len(sbm.inputs) == 2 and len(sbm.outputs) == 1:
+                head = []
+                layer = _producer(sbm.outputs[0])
+                while _is_scalar_head(layer):
+                    head.insert(0, layer)
+                    layer = _producer(layer.input)
+                if isinstance(layer, keras.layers.Dot) and layer.normalize and len(layer.input) == 2:
+                    doc_side, topic_side = layer.input
+                    if doc_side is sbm.inputs[1]:
+                        doc_side, topic_side = topic_side, doc_side
+                    if topic_side is sbm.inputs[1]:
+                        self.doc_tower = keras.Model(sbm.inputs[0], doc_side)
+                        self.score_head = head
+                        logger.info("scoring the document tower of %s", sbm.name)
+        return self.doc_tower
+
+    def apply_head(self, scores):
+        """
+        Apply the scalar head of a split retrieval model elementwise, see :meth:`get_doc_tower`.
+        :param scores: cosine scores of any shape
+        :return: float32 scores of the SBM, of the same shape
+        """
+        for layer in self.score_head:
+            scores = np.asarray(layer(np.reshape(scores, (-1, 1))), dtype=np.float32).reshape(np.shape(scores))
+        return scores
+
+    def is_pairwise(self):
+        return self.projections is None and len(self.model_loader.sbm.inputs) == 2 and self.get_doc_tower() is None
+
+    def predict(self, inputs):
+        'One SBM prediction batch as float32, of the document tower if the SBM is split'
+        model = self.model_loader.sbm if self.is_pairwise() else (self.get_doc_tower() or self.model_loader.sbm)
+        return np.asarray(model(inputs, training=False), dtype=np.float32)
+
+    def _score_block(self, doc_rows, topic_nos):
+        'Scores of one doc block against a batch of topics, n_docs x n_topics'
+        return self.score_vectors(doc_rows, self.topics.get_topic_vectors(topic_nos, dense=False))
+
+    def score_vectors(self, doc_rows, topic_vecs):
+        """
+        Scores of documents against topic vectors, which need not belong to the topics, e.g. of ad-hoc queries.
+        :param doc_rows: rows of the documents
+        :param topic_vecs: sparse or dense topic vectors, one row per topic
+        :return: float32 array of shape (len(doc_rows), number of topic vectors)
+        """
+        if self.is_pairwise():
+            return self._score_pairs(doc_rows, topic_vecs)
+        docvecs = self.model_loader.get_docvecs()
+        split = self.projections is None and self.get_doc_tower() is not None
+        if split:
+            # the normalized Dot also normalizes the topic input
+            topic_vecs = normalize(topic_vecs)
+        scores = np.empty((len(doc_rows), topic_vecs.shape[0]), dtype=np.float32)
+        for start in range(0, len(doc_rows), self.batch_size):
+            batch_rows = doc_rows[start: start + self.batch_size]
+            if self.projections is not None:
+                projected = np.asarray(self.projections[batch_rows], dtype=np.float32)
+            else:
+                projected = self.predict(np.asarray(docvecs[batch_rows], dtype=np.float32))
+            norms = np.linalg.norm(projected, axis=1, keepdims=True)
+            projected = projected / np.where(norms > 0, norms, 1)
+            # sparse topics x vocab times vocab x docs
+            scores[start: start + len(batch_rows)] = np.asarray((topic_vecs @ projected.T).T)
+        return self.apply_head(scores) if split else scores
+
+    def _score_pairs(self, doc_rows, topic_vecs):
+        """
+        Scores of a pairwise retrieval model, one prediction per document and topic. The topic row is repeated
+        for every document of a prediction batch, so batches are capped to :data:`PAIRWISE_BATCH_BYTES`.
+        :param doc_rows: rows of the documents
+        :param topic_vecs: sparse or dense topic vectors, one row per topic
+        :return: float32 array of shape (len(doc_rows), number of topic vectors)
+        """
+        docvecs = self.model_loader.get_docvecs()
+        width = topic_vecs.shape[1]
+        batch_size = max(1, min(self.batch_size, PAIRWISE_BATCH_BYTES // (4 * width)))
+        scores = np.empty((len(doc_rows), topic_vecs.shape[0]), dtype=np.float32)
+        for start in range(0, len(doc_rows), batch_size):
+            docs = np.asarray(docvecs[doc_rows[start: start + batch_size]], dtype=np.float32)
+            for j in range(topic_vecs.shape[0]):
+                topic_vec = topic_vecs[j].toarray() if issparse(topic_vecs) else topic_vecs[j: j + 1]
+                topic_batch = np.broadcast_to(np.asarray(topic_vec, dtype=np.float32), (len(docs), width))
+                scores[start: start + len(docs), j] = self.predict([docs, topic_batch]).reshape(-1)
+        return scores
+
+    def score_blocks(self, topic_nos=None, doc_rows=None):
+        """
+        Generate the scores of all documents against all topics block by block, in document order.
+        :param topic_nos: topics to score, all vectorized topics if None
+        :param doc_rows: rows of the documents to score (e.g. of a subset of the collection), all if None
+        :return: a generator yield doc rows, topic numbers, float32 scores of shape (len(doc rows), len(topics))
+        """
+        if topic_nos is None:
+            topic_nos = list(self.topics.topic_row_maps)
+        if doc_rows is None:
+            doc_rows = np.arange(len(self.model_loader.get_docs_list()))
+        doc_rows = np.asarray(doc_rows, dtype=np.int64)
+        topic_nos = np.asarray(topic_nos, dtype=np.int32)
+
+        # a keyword model projects each document once for all topics, batching topics would project it again
+        topic_batch = self.topic_batch if self.is_pairwise() else max(len(topic_nos), 1)
+        tasks = ((doc_rows[start: start + self.doc_block], topic_nos[t: t + topic_batch])
+                 for start in range(0, len(doc_rows), self.doc_block)
+                 for t in range(0, len(topic_nos), topic_batch))
+        with ThreadPoolExecutor(self.workers) as executor:
+            # at most workers blocks scored ahead of the consumer
+            pending = deque()
+            for block_rows, block_topics in tasks:
+                future = executor.submit(self._score_block, block_rows, block_topics)
+                pending.append((block_rows, block_topics, future))
+                if len(pending) >= self.workers:
+                    block_rows, block_topics, future = pending.popleft()
+                    yield block_rows, block_topics, future.result()
+            while pending:
+                block_rows, block_topics, future = pending.popleft()
+                yield block_rows, block_topics, future.result()
+
+    def topic_queries(self, topic_nos):
+        """
+        Topic vectors mapped into the document vector space through the kernel K of the Dense layer named 'SBM',
+        the query vectors K t of a nearest neighbour index over the document vectors.
+
+        This is only an approximation of the SBM: the inner product d . K t leaves out the norm |d K| of the
+        projection, which a keyword model divides by, and anything else the SBM computes besides its 'SBM' layer.
+        Retrieve enough candidates for the SBM to rescore, or pass better queries to :meth:`candidate_blocks`.
+        :param topic_nos: topic numbers
+        :return: float32 array of shape (len(topic_nos), vector size)
+        """
+        kernel = self.model_loader.sbm.get_layer('SBM').get_weights()[0]
+        topic_vecs = self.topics.get_topic_vectors(topic_nos, dense=False)
+        return np.asarray(topic_vecs @ kernel.T, dtype=np.float32)
+
+    def candidate_blocks(self, ann_index, candidates, topic_nos=None, doc_rows=None, queries=None):
+        """
+        Score only the candidates of a nearest neighbour index per topic with the SBM.
+
+        A keyword or split model projects the union of the candidates of all topics once, block by block, and the
+        candidates of every topic are gathered from the scores of the block, so a document that is a candidate of
+        many topics is projected only once. A pairwise model scores the candidates of each topic on their own.
+        :param ann_index: index over the document vectors, see :mod:`evaluation.ann`
+        :param candidates: number of candidates retrieved per topic
+        :param topic_nos: topics to score, all vectorized topics if None
+        :param doc_rows: rows of the documents that may be candidates, all if None
+        :param queries: query vectors of the index aligned with topic_nos, :meth:`topic_queries` if None
+        :return: a generator yield doc rows, [topic number], float32 scores of shape (len(doc rows), 1)
+        """
+        if topic_nos is None:
+            topic_nos = list(self.topics.topic_row_maps)
+        topic_nos = np.asarray(topic_nos, dtype=np.int32)
+        if queries is None:
+            queries = self.topic_queries(topic_nos)
+        rows, _ = ann_index.search(queries, candidates)
+        topic_rows = []
+        for candidate_rows in rows:
+            candidate_rows = np.sort(candidate_rows[candidate_rows >= 0])
+            if doc_rows is not None:
+                candidate_rows = candidate_rows[np.isin(candidate_rows, doc_rows)]
+            topic_rows.append(candidate_rows)
+
+        if self.is_pairwise():
+            for topic_no, candidate_rows in zip(topic_nos, topic_rows):
+                yield candidate_rows, [topic_no], self._score_block(candidate_rows, [topic_no])
+            return
+        union = np.unique(np.concatenate(topic_rows)) if topic_rows else np.empty(0, dtype=np.int64)
+        for start in range(0, len(union), self.doc_block):
+            block_rows = union[start: start + self.doc_block]
+            scores = self._score_block(block_rows, topic_nos)
+            for j, (topic_no, candidate_rows) in enumerate(zip(topic_nos, topic_rows)):
+                # both are sorted, the candidates of the topic within the block are a slice
+                lo = np.searchsorted(candidate_rows, block_rows[0], side='left')
+                hi = np.searchsorted(candidate_rows, block_rows[-1], side='right')
+                if hi > lo:
+                    positions = np.searchsorted(block_rows, candidate_rows[lo: hi])
+                    yield candidate_rows[lo: hi], [topic_no], scores[positions, j: j + 1]
 
-    def evaluate(self):
-        return None
+    def evaluate(self, consume, topic_nos=None, doc_rows=None):
+        """
+        Score all documents against all topics, handing every block to a consumer instead of keeping them.
+        :param consume: callable(doc rows, topic numbers, scores) called once per block
+        :param topic_nos: topics to score, all vectorized topics if None
+        :param doc_rows: rows of the documents to score, all if None
+        :return: None
+        """
+        for block_rows, block_topics, scores in self.score_blocks(topic_nos=topic_nos, doc_rows=doc_rows):
+            consume(block_rows, block_topics, scores)
 
-    def _evaluate(self, topic_no):
-        input_lenght = len(self.model_loader.get_docs_list())
-        data_generator = DataGenerator(self.model_loader.get_docvecs,
-                                       self.topics)
-        self.model_loader.sbm.predict()
+    def _evaluate(self, topic_no, doc_rows=None):
+        """
+        Scores of one topic against all documents.
+        :param topic_no: topic number
+        :param doc_rows: rows of the documents to score, all if None
+        :return: float32 array of scores aligned with doc_rows
+        """
+        return np.concatenate([scores[:, 0] for _, _, scores in self.score_blocks([topic_no], doc_rows)])
 
-    def create_runs(self, runs_file):
-        return None
\ No newline at end of file
+    def create_runs(self, runs_file, depth=RUN_DEPTH, run_tag=RUN_TAG, topic_nos=None, doc_rows=None,
+                    ann_index=None, candidates=10 * RUN_DEPTH, ann_queries=None):
+        """
+        Score all documents against all topics in one pass and write the top documents of every topic as TREC runs.
+        :param runs_file: run file to write
+        :param depth: number of documents per topic, 1000 for standard TREC runs
+        :param run_tag: run tag of the last column
+        :param topic_nos: topics to score, all vectorized topics if None
+        :param doc_rows: rows of the documents to score, all if None
+        :param ann_index: nearest neighbour index over the document vectors, only its candidates are scored
+        :param candidates: number of candidates retrieved per topic from ann_index, before they are restricted to
+            doc_rows
+        :param ann_queries: query vectors of ann_index aligned with topic_nos, see :meth:`candidate_blocks`
+        :return: the :class:`evaluation.ranking.TopK` of the run
+        """
+        if topic_nos is None:
+            topic_nos = list(self.topics.topic_row_maps)
+        top_k = TopK(topic_nos, k=depth)
+        if ann_index is not None:
+            for block_rows, block_topics, scores in self.candidate_blocks(ann_index, candidates, topic_nos,
+                                                                          doc_rows=doc_rows, queries=ann_queries):
+                top_k.push(block_rows, block_topics, scores)
+        else:
+            self.evaluate(top_k.push, topic_nos=topic_nos, doc_rows=doc_rows)
+        write_runs(runs_file, top_k, self.model_loader.get_docs_list(), run_tag=run_tag, depth=depth)
+        return top_k
@@ -0,0 +1,89 @@
+import numpy as np
+
+from evaluation.ranking import RUN_DEPTH, TopK
+
+
+def relevance_matrix(rows, topic_nos, index):
+    """
+    Mark the relevant documents of rankings.
+    :param rows: int array of shape (n_rankings, depth), ranked doc rows best first, -1 pads short rankings
+    :param topic_nos: topic of every ranking, topics may repeat, e.g. one ranking per configuration of a sweep
+    :param index: :class:`trec.trecqrels.QrelsIndex` sharing its ids with the doc rows
+    :return: bool array of the shape of rows
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    relevant = np.zeros(rows.shape, dtype=bool)
+    for topic_no in np.unique(topic_nos).tolist():
+        rankings = np.flatnonzero(np.asarray(topic_nos) == topic_no)
+        relevant[rankings] = index.contains_ids(topic_no, rows[rankings], is_rel=True) & (rows[rankings] >= 0)
+    return relevant
+
+
+def evaluate_rankings(rows, topic_nos, index, precision_at=10):
+    """
+    MAP, P@k, R-prec and nDCG of many rankings at once, as trec_eval computes them from a run of the same depth:
+    every relevant document of the qrels counts, also those not retrieved or without a document vector, and
+    topics without relevant documents are left out.
+    :param rows: int array of shape (n_rankings, depth), ranked doc rows best first, -1 pads short rankings
+    :param topic_nos: topic of every ranking
+    :param index: :class:`trec.trecqrels.QrelsIndex` sharing its ids with the doc rows
+    :param precision_at: cutoff of the precision
+    :return: dict of per ranking float64 arrays "map", "P_<precision_at>", "Rprec", "ndcg", plus the "topic_nos"
+        of the evaluated rankings
+    """
+    topic_nos = np.asarray(topic_nos, dtype=np.int32)
+    relevant = relevance_matrix(rows, topic_nos, index)
+    n_relevant = np.array([len(index.get_ids(topic_no, True)) for topic_no in topic_nos.tolist()], dtype=np.int64)
+    judged = n_relevant > 0
+    relevant, n_relevant, topic_nos = relevant[judged], n_relevant[judged], topic_nos[judged]
+    depth = relevant.shape[1]
+    ranks = np.arange(1, depth + 1)
+
+    found = np.cumsum(relevant, axis=1)
+    average_precision = (relevant * found / ranks).sum(axis=1) / n_relevant
+    precision = found[:, min(precision_at, depth) - 1] / precision_at if depth else np.zeros(len(topic_nos))
+    r_cut = np.minimum(n_relevant, depth)
+    r_precision = np.where(r_cut > 0, found[np.arange(len(r_cut)), np.maximum(r_cut - 1, 0)], 0) / n_relevant
+
+    discounts = 1 / np.log2(np.arange(2, max(depth, n_relevant.max(initial=0)) + 2))
+    dcg = (relevant * discounts[:depth]).sum(axis=1)
+    ideal = np.cumsum(discounts)[n_relevant - 1]
+
+    return {"topic_nos": topic_nos, "map": average_precision, "P_%d" % precision_at: precision,
+            "Rprec": r_precision, "ndcg": dcg / ideal}
+
+
+def evaluate_top_k(top_k, index, depth=RUN_DEPTH, precision_at=10):
+    """
+    Evaluate the rankings of a :class:`evaluation.ranking.TopK`, e.g. of :meth:`Evaluator.create_runs`.
+    :return: see :func:`evaluate_rankings`
+    """
+    rows = np.full((len(top_k.topic_nos), depth), -1, dtype=np.int64)
+    for i, topic_no in enumerate(top_k.topic_nos.tolist()):
+        topic_rows = top_k.result(topic_no)[0][:depth]
+        rows[i, :len(topic_rows)] = topic_rows
+    return evaluate_rankings(rows, top_k.topic_nos, index, precision_at=precision_at)
+
+
+def evaluate_scores(scores, topic_nos, index, depth=RUN_DEPTH, precision_at=10):
+    """
+    Evaluate a score matrix without writing a run file.
+    :param scores: float array of shape (n_docs, n_topics), one column per topic
+    :param topic_nos: topic of every column
+    :param index: :class:`trec.trecqrels.QrelsIndex` sharing its ids with the doc rows
+    :return: see :func:`evaluate_rankings`
+    """
+    top_k = TopK(range(len(topic_nos)), k=depth)
+    top_k.push(np.arange(len(scores)), top_k.topic_nos, scores)
+    rows = np.stack([top_k.result(i)[0] for i in range(len(topic_nos))]) if len(topic_nos) else \
+        np.empty((0, depth), dtype=np.int64)
+    return evaluate_rankings(rows, topic_nos, index, precision_at=precision_at)
+
+
+def summarize(results):
+    """
+    :param results: per ranking results of :func:`evaluate_rankings`
+    :return: dict of the mean of every metric over the evaluated topics
+    """
+    return {name: float(values.mean()) if len(values) else 0.0
+            for name, values in results.items() if name != "topic_nos"}
@@ -0,0 +1,205 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from trec.snapshot import source_signature
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK = 1 << 24
+PROJECT_BATCH = 4096
+CACHE_DTYPES = ("float32", "float16")
+SIGNATURES_FILE = "signatures.idx"
+
+# (path, size, mtime_ns) -> digest, a model is only hashed once per process unless it changes
+_digests = {}
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def _file_digest(filename):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_files(path):
+    """
+    Files of a model file or folder (e.g. a saved Keras model or a
+    :class:`~doc_embedding.docvector_store.DocVectorStore`). The arrays gensim saves next to a model file
+    (`<file>.*.npy`, e.g. the document vectors of a Doc2Vec model) are part of the model.
+    :param path: model file or folder
+    :return: sorted absolute file names, folder their names are relative to
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names), path
+    return [path] + sorted(glob.glob(glob.escape(path) + ".*.npy")), os.path.dirname(path)
+
+
+def model_digest(path):
+    """
+    Content hash of a model file, or of all files of a model folder, see :func:`model_files`.
+    :param path: model file or folder
+    :return: hex digest
+    """
+    files, base = model_files(path)
+    digest = hashlib.blake2b(digest_size=16)
+    for filename in files:
+        key = _stat_key(filename)
+        if key not in _digests:
+            _digests[key] = _file_digest(filename)
+        digest.update(os.path.relpath(filename, base).encode("utf-8"))
+        digest.update(_digests[key].encode("ascii"))
+    return digest.hexdigest()
+
+
+class ProjectionCache:
+    """Memory mapped cache of SBM predictions of all document vectors.
+
+    An entry is keyed by the content hashes of the SBM and of the Doc2Vec model (or document vector store) it was
+    computed from, so retraining either model makes a new entry and the superseded one is removed. An entry takes
+    count x output dim x 4 bytes (2 for float16), which only fits keyword models with a moderate vocabulary.
+
+    Hashing a model of several GB takes seconds, so the key of a pair of models is remembered in the cache folder
+    under the (path, mtime_ns, size) signature of their files, see :func:`trec.snapshot.source_signature`. The models
+    are only hashed again when a file changes, and a touched but unchanged model still finds its entry by content.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> cache = ProjectionCache("F:/Models/projections/")
+        >>> projections = cache.get_or_build("F:/Models/NN/sbm_keyword", "F:/Models/docvecs_d1000/",
+        ...                                  docvecs.vectors_docs, sbm.predict_on_batch)
+
+    """
+
+    def __init__(self, cache_dir, dtype="float32"):
+        assert dtype in CACHE_DTYPES
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.dtype = dtype
+        self.signature_file = os.path.join(cache_dir, SIGNATURES_FILE)
+
+    def key(self, sbm_path, d2v_path):
+        """
+        :param sbm_path: SBM model file or folder
+        :param d2v_path: Doc2Vec model file or document vector store folder
+        :return: cache key of the pair of models
+        """
+        signature = source_signature(model_files(sbm_path)[0] + model_files(d2v_path)[0], dtype=self.dtype)
+        signature = hashlib.blake2b(json.dumps(signature, sort_keys=True).encode("utf-8"),
+                                    digest_size=16).hexdigest()
+        signatures = self._signatures()
+        if signature not in signatures:
+            signatures[signature] = hashlib.blake2b(
+                (model_digest(sbm_path) + model_digest(d2v_path) + self.dtype).encode("ascii"),
+                digest_size=16).hexdigest()
+            self._save_signatures(signatures)
+        return signatures[signature]
+
+    def _signatures(self):
+        'File signature -> key of the pairs of models hashed so far'
+        if not os.path.exists(self.signature_file):
+            return {}
+        with open(self.signature_file, 'r') as fp:
+            return json.load(fp)
+
+    def _save_signatures(self, signatures):
+        with open(self.signature_file + ".tmp", 'w') as fp:
+            json.dump(signatures, fp)
+        os.replace(self.signature_file + ".tmp", self.signature_file)
+
+    def _files(self, key):
+        return os.path.join(self.cache_dir, key + ".bin"), os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        """
+        :param key: see :meth:`key`
+        :return: read-only memmap of the projections, None if not cached
+        """
+        data_file, meta_file = self._files(key)
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, 'r') as fp:
+            meta = json.load(fp)
+        shape = tuple(meta["shape"])
+        if not np.prod(shape):
+            # an empty file cannot be mapped
+            return np.empty(shape, dtype=meta["dtype"])
+        return np.memmap(data_file, dtype=meta["dtype"], mode='r', shape=shape)
+
+    def build(self, key, docvecs, predict, sources=None, batch_size=PROJECT_BATCH):
+        """
+        Predict all document vectors batch by batch straight into the cache file.
+        :param key: see :meth:`key`
+        :param docvecs: document vectors, one row per document
+        :param predict: callable mapping a float32 batch of document vectors to its predictions
+        :param sources: (sbm_path, d2v_path) recorded to remove entries superseded by this one
+        :param batch_size: number of documents per prediction
+        :return: read-only memmap of the projections
+        """
+        data_file, meta_file = self._files(key)
+        tmp_file = data_file + ".tmp"
+        if not len(docvecs):
+            # the output dimension is unknown without a prediction
+            shape = (0,) + np.asarray(predict(np.zeros((1,) + np.shape(docvecs)[1:], dtype=np.float32))).shape[1:]
+        with open(tmp_file, 'wb') as fp:
+            for start in range(0, len(docvecs), batch_size):
+                batch = np.asarray(predict(np.asarray(docvecs[start: start + batch_size], dtype=np.float32)))
+                shape = (len(docvecs),) + batch.shape[1:]
+                np.ascontiguousarray(batch, dtype=self.dtype).tofile(fp)
+        os.replace(tmp_file, data_file)
+
+        sources = [os.path.abspath(path) for path in sources] if sources else None
+        if sources:
+            self.remove_superseded(sources)
+        with open(meta_file + ".tmp", 'w') as fp:
+            json.dump({"dtype": self.dtype, "shape": shape, "sources": sources}, fp)
+        os.replace(meta_file + ".tmp", meta_file)
+        logger.info("cached %s projections of %d documents into %s", shape, len(docvecs), data_file)
+        return self.get(key)
+
+    def remove_superseded(self, sources):
+        'Remove entries computed from the same model paths, their models changed since'
+        removed = set()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.cache_dir, name), 'r') as fp:
+                meta = json.load(fp)
+            if meta.get("sources") == sources and meta.get("dtype") == self.dtype:
+                removed.add(name[:-len(".json")])
+                data_file, meta_file = self._files(name[:-len(".json")])
+                os.remove(meta_file)
+                if os.path.exists(data_file):
+                    os.remove(data_file)
+        signatures = self._signatures()
+        if removed & set(signatures.values()):
+            self._save_signatures({signature: key for signature, key in signatures.items() if key not in removed})
+
+    def get_or_build(self, sbm_path, d2v_path, docvecs, predict, batch_size=PROJECT_BATCH):
+        """
+        Cached projections of the models, computed if missing or outdated.
+        :param sbm_path: SBM model file or folder
+        :param d2v_path: Doc2Vec model file or document vector store folder
+        :param docvecs: document vectors, one row per document
+        :param predict: callable mapping a float32 batch of document vectors to its predictions
+        :param batch_size: number of documents per prediction
+        :return: read-only memmap of the projections
+        """
+        key = self.key(sbm_path, d2v_path)
+        projections = self.get(key)
+        if projections is None:
+            projections = self.build(key, docvecs, predict, sources=(sbm_path, d2v_path), batch_size=batch_size)
+        return projections
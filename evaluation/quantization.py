@@ -0,0 +1,97 @@
+import numpy as np
+
+from evaluation.metrics import evaluate_rankings, summarize
+from evaluation.ranking import TopK
+
+REPORT_SAMPLE = 10000
+REPORT_DEPTH = 1000
+
+
+def vector_drift(reference, quantized, rows):
+    """
+    :param reference: float32 document vectors
+    :param quantized: the same vectors read back from a quantized store
+    :param rows: sorted doc rows to compare
+    :return: per row cosine similarity and relative l2 error of the quantized vectors
+    """
+    original = np.asarray(reference[rows], dtype=np.float32)
+    restored = np.asarray(quantized[rows], dtype=np.float32)
+    norms = np.linalg.norm(original, axis=1)
+    safe_norms = np.where(norms > 0, norms, 1)
+    cosine = (original * restored).sum(axis=1) / safe_norms / np.maximum(np.linalg.norm(restored, axis=1), 1e-12)
+    return cosine, np.linalg.norm(restored - original, axis=1) / safe_norms
+
+
+def run_rankings(evaluator, topic_nos, k):
+    """
+    Top k documents of every topic scored by an :class:`evaluation.evaluator.Evaluator`, the rankings of the runs
+    of :meth:`~evaluation.evaluator.Evaluator.create_runs` without writing them.
+    :param evaluator: :class:`evaluation.evaluator.Evaluator`
+    :param topic_nos: topics to rank
+    :param k: depth of the rankings
+    :return: int64 doc rows of shape (len(topic_nos), k) best first, -1 padded, and their float32 scores
+    """
+    top_k = TopK(topic_nos, k=k)
+    evaluator.evaluate(top_k.push, topic_nos=topic_nos)
+    rows = np.full((len(topic_nos), k), -1, dtype=np.int64)
+    scores = np.full((len(topic_nos), k), np.nan, dtype=np.float32)
+    for i, topic_no in enumerate(topic_nos):
+        topic_rows, topic_scores = top_k.result(topic_no)
+        rows[i, :len(topic_rows)], scores[i, :len(topic_rows)] = topic_rows, topic_scores
+    return rows, scores
+
+
+def quantization_report(reference, quantized, topic_nos=None, k=REPORT_DEPTH, sample=REPORT_SAMPLE, seed=0,
+                        index=None):
+    """
+    Compare scoring quantized document vectors with scoring their float32 reference by the same SBM: memory, drift
+    of the vectors, and drift of the SBM rankings of the topics, i.e. of the runs of
+    :meth:`~evaluation.evaluator.Evaluator.create_runs`.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> convert_store("F:/Models/docvecs_d1000/", "F:/Models/docvecs_d1000_int8/", "int8")
+        >>> report = quantization_report(Evaluator(float32_loader, trec_topics), Evaluator(int8_loader, trec_topics),
+        ...                              index=qrels.index)
+
+    :param reference: :class:`evaluation.evaluator.Evaluator` over the float32 document vectors
+    :param quantized: Evaluator with the same SBM and topics over the same vectors in a float16 or int8 store
+    :param topic_nos: topics to rank, all vectorized topics of the reference if None
+    :param k: depth of the compared rankings, at most the number of documents
+    :param sample: number of sampled documents the vector drift is measured on
+    :param seed: seed of the sample
+    :param index: optional :class:`trec.trecqrels.QrelsIndex`, to compare MAP, P@10, R-prec and nDCG of the rankings
+    :return: dict of the measures
+    """
+    reference_vecs = reference.model_loader.get_docvecs()
+    quantized_vecs = quantized.model_loader.get_docvecs()
+    n_docs = len(reference_vecs)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n_docs, size=min(sample, n_docs), replace=False))
+    cosine, error = vector_drift(reference_vecs, quantized_vecs, rows)
+    report = {"reference_bytes": int(reference_vecs.nbytes), "quantized_bytes": int(quantized_vecs.nbytes),
+              "mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min()),
+              "mean_relative_error": float(error.mean())}
+
+    if topic_nos is None:
+        topic_nos = list(reference.topics.topic_row_maps)
+    k = min(k, n_docs)
+    reference_rows, reference_scores = run_rankings(reference, topic_nos, k)
+    quantized_rows, _ = run_rankings(quantized, topic_nos, k)
+    overlap = [len(np.intersect1d(a[a >= 0], b[b >= 0])) / max((a >= 0).sum(), 1)
+               for a, b in zip(reference_rows, quantized_rows)]
+    report["overlap@%d" % k] = float(np.mean(overlap))
+    # scores of the same documents: the reference top k rescored from the quantized vectors
+    drift = []
+    for topic_no, topic_rows, topic_scores in zip(topic_nos, reference_rows, reference_scores):
+        valid = topic_rows >= 0
+        if valid.any():
+            drift.append(np.abs(quantized._evaluate(topic_no, doc_rows=topic_rows[valid]) - topic_scores[valid]))
+    report["mean_score_drift"] = float(np.concatenate(drift).mean()) if drift else 0.0
+
+    if index is not None:
+        report["reference_metrics"] = summarize(evaluate_rankings(reference_rows, topic_nos, index))
+        report["quantized_metrics"] = summarize(evaluate_rankings(quantized_rows, topic_nos, index))
+    return report
@@ -0,0 +1,82 @@
+import numpy as np
+
+RUN_DEPTH = 1000
+RUN_TAG = "test"
+WRITE_BUFFER = 1 << 20
+
+
+class TopK:
+    """Keep the k best scored documents of every topic while score blocks stream by.
+
+    Every block is merged with the current top k of its topics by one `np.argpartition` over all topics of the
+    block, so the full doc x topic scores are never kept nor sorted. Only the final k per topic are sorted.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> top_k = TopK(range(51, 451), k=1000)
+        >>> evaluator.evaluate(top_k.push)
+        >>> doc_rows, scores = top_k.result(51)
+
+    """
+
+    def __init__(self, topic_nos, k=RUN_DEPTH):
+        self.k = k
+        self.topic_nos = np.asarray(list(topic_nos), dtype=np.int32)
+        self.topic_pos = {int(topic_no): pos for pos, topic_no in enumerate(self.topic_nos)}
+        self.scores = np.full((len(self.topic_nos), k), -np.inf, dtype=np.float32)
+        self.rows = np.full((len(self.topic_nos), k), -1, dtype=np.int64)
+
+    def push(self, doc_rows, topic_nos, scores):
+        """
+        Merge a block of scores.
+        :param doc_rows: rows of the documents of the block
+        :param topic_nos: topics of the block
+        :param scores: float32 scores of shape (len(doc_rows), len(topic_nos))
+        :return: None
+        """
+        positions = np.fromiter((self.topic_pos[int(topic_no)] for topic_no in topic_nos), dtype=np.int64,
+                                count=len(topic_nos))
+        doc_rows = np.asarray(doc_rows, dtype=np.int64)
+        candidate_scores = np.concatenate((self.scores[positions], np.asarray(scores, dtype=np.float32).T), axis=1)
+        candidate_rows = np.concatenate((self.rows[positions],
+                                         np.broadcast_to(doc_rows, (len(positions), len(doc_rows)))), axis=1)
+        if candidate_scores.shape[1] > self.k:
+            best = np.argpartition(-candidate_scores, self.k - 1, axis=1)[:, :self.k]
+            candidate_scores = np.take_along_axis(candidate_scores, best, axis=1)
+            candidate_rows = np.take_along_axis(candidate_rows, best, axis=1)
+        self.scores[positions] = candidate_scores
+        self.rows[positions] = candidate_rows
+
+    def result(self, topic_no):
+        """
+        The top documents of a topic, best first, ties by doc row.
+        :param topic_no: topic number
+        :return: int64 doc rows, float32 scores
+        """
+        pos = self.topic_pos[topic_no]
+        rows, scores = self.rows[pos], self.scores[pos]
+        valid = rows >= 0
+        rows, scores = rows[valid], scores[valid]
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+
+def write_runs(runs_file, top_k, doc_list, run_tag=RUN_TAG, depth=RUN_DEPTH):
+    """
+    Write a TREC run file of all topics of a :class:`TopK`, ranked like :func:`utils.create_trec_runs`.
+    Lines of a topic are formatted and written in bulk through a large write buffer.
+    :param runs_file: run file to write
+    :param top_k: :class:`TopK` holding the scored documents
+    :param doc_list: doc_no of every doc row
+    :param run_tag: run tag of the last column
+    :param depth: maximum number of documents per topic, e.g. 1000 for standard TREC runs
+    :return: None
+    """
+    with open(runs_file, 'w', buffering=WRITE_BUFFER) as fp:
+        for topic_no in top_k.topic_nos.tolist():
+            rows, scores = top_k.result(topic_no)
+            lines = ["%d Q0 %s %d %.8g %s\n" % (topic_no, doc_list[row], rank, score, run_tag)
+                     for rank, (row, score) in enumerate(zip(rows[:depth].tolist(), scores[:depth].tolist()))]
+            fp.write("".join(lines))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from evaluation.ann import BruteForceIndex, IVFIndex, build_index
+
+
+def test_brute_force():
+    vectors = np.random.rand(300, 6).astype(np.float32)
+    queries = np.random.rand(4, 6).astype(np.float32)
+    for metric in ("ip", "cosine"):
+        rows, scores = BruteForceIndex(vectors, metric=metric, block=64).search(queries, k=5)
+        if metric == "cosine":
+            exact = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ \
+                (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).T
+        else:
+            exact = queries @ vectors.T
+        np.testing.assert_array_equal(rows, np.argsort(-exact, axis=1)[:, :5])
+        np.testing.assert_allclose(scores, np.sort(exact, axis=1)[:, ::-1][:, :5], rtol=1e-5)
+
+
+def test_ivf(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 8))
+    vectors = (centers[rng.integers(0, 20, 2000)] + 0.1 * rng.normal(size=(2000, 8))).astype(np.float32)
+    queries = vectors[:10] + 0.01
+
+    exact_rows, _ = build_index("brute", vectors, metric="cosine").search(queries, k=10)
+    index = build_index("ivf", vectors, metric="cosine", n_lists=20, n_probe=3, train_size=500)
+    assert index.offsets[-1] == 2000 and sorted(index.order.tolist()) == list(range(2000))
+    rows, _ = index.search(queries, k=10)
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(rows.tolist(), exact_rows.tolist())])
+    assert recall >= 0.9
+    np.testing.assert_array_equal(index.search(queries, k=10, n_probe=20)[0], exact_rows)
+
+    index.save(str(tmp_path / "ivf.npz"))
+    loaded = IVFIndex.load(str(tmp_path / "ivf.npz"), vectors)
+    np.testing.assert_array_equal(loaded.search(queries, k=10)[0], rows)
+
+    # without n_probe at construction it must be given per search
+    index = IVFIndex(vectors, metric="cosine", n_lists=20, train_size=500)
+    with pytest.raises(ValueError):
+        index.search(queries, k=10)
+    np.testing.assert_array_equal(index.search(queries, k=10, n_probe=20)[0], exact_rows)
@@ -0,0 +1,176 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from tensorflow import keras
+
+from evaluation import evaluator as evaluator_module
+from evaluation.evaluator import Evaluator
+from utils import ModelLoader
+
+
+class FakeTopics:
+    def __init__(self, topics_vecs):
+        self.topics_vecs = csr_matrix(topics_vecs)
+        self.topic_row_maps = {51 + i: i for i in range(topics_vecs.shape[0])}
+
+    def get_topic_vectors(self, topic_nos, dense=True):
+        vecs = self.topics_vecs[[self.topic_row_maps[topic_no] for topic_no in topic_nos]]
+        return vecs.toarray() if dense else vecs
+
+
+class FakeKeyedVectors:
+    'Document vectors of a loaded Doc2Vec model, which cannot be indexed by slices or arrays of rows'
+
+    def __init__(self, vectors):
+        self.vectors_docs = vectors
+        self.index2entity = list(range(len(vectors)))
+
+    def __getitem__(self, key):
+        raise TypeError("index vectors_docs instead")
+
+
+def make_evaluator(sbm, docvecs, topics, **kwargs):
+    model_loader = ModelLoader()
+    model_loader.docvecs = FakeKeyedVectors(docvecs)
+    model_loader.sbm = sbm
+    return Evaluator(model_loader, topics, **kwargs)
+
+
+def test_score_blocks():
+    docvecs = np.random.rand(103, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(7, 20) * (np.random.rand(7, 20) > 0.5))
+    inputs = keras.Input(shape=(8,))
+    sbm = keras.Model(inputs, keras.layers.Dense(20, use_bias=False, name='SBM')(inputs))
+    weights = sbm.get_layer('SBM').get_weights()[0]
+    expected = normalize(docvecs @ weights) @ topics_vecs.T
+
+    evaluator = make_evaluator(sbm, docvecs, FakeTopics(topics_vecs), doc_block=25, topic_batch=3, batch_size=10,
+                               workers=3)
+    scores = np.zeros((103, 7), dtype=np.float32)
+    blocks = 0
+    for doc_rows, topic_nos, block in evaluator.score_blocks():
+        scores[np.ix_(doc_rows, topic_nos - 51)] = block
+        blocks += 1
+    # a keyword model scores all topics per doc block
+    assert blocks == 5
+    np.testing.assert_allclose(scores, expected, rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(evaluator._evaluate(53, doc_rows=[5, 2]), expected[[5, 2], 2], rtol=1e-4, atol=1e-5)
+
+    evaluator = make_evaluator(None, docvecs, FakeTopics(topics_vecs), doc_block=25, projections=docvecs @ weights)
+    np.testing.assert_allclose(evaluator._evaluate(52), expected[:, 1], rtol=1e-4, atol=1e-5)
+
+
+def test_score_pairs(monkeypatch):
+    docvecs = np.random.rand(30, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(4, 20))
+    doc_input, topic_input = keras.Input(shape=(8,)), keras.Input(shape=(20,))
+    projected = keras.layers.Dense(20, use_bias=False, name='SBM')(doc_input)
+    sbm = keras.Model([doc_input, topic_input], keras.layers.Dot(axes=1, normalize=True)([projected, topic_input]))
+    weights = sbm.get_layer('SBM').get_weights()[0]
+    expected = normalize(docvecs @ weights) @ topics_vecs.T
+
+    for split_towers in (False, True):
+        evaluator = make_evaluator(sbm, docvecs, FakeTopics(topics_vecs), doc_block=16, topic_batch=3, batch_size=8,
+                                   split_towers=split_towers)
+        assert evaluator.is_pairwise() != split_towers
+        scores = np.zeros((30, 4), dtype=np.float32)
+        evaluator.evaluate(lambda doc_rows, topic_nos, block: scores.__setitem__(np.ix_(doc_rows, topic_nos - 51),
+                                                                                 block))
+        np.testing.assert_allclose(scores, expected, rtol=1e-4, atol=1e-5)
+    # the split model scores all topics per doc block
+    assert len(list(evaluator.score_blocks())) == 2
+
+    # pairwise predictions are capped by the width of the repeated topic rows
+    monkeypatch.setattr(evaluator_module, "PAIRWISE_BATCH_BYTES", 4 * 20 * 3)
+    evaluator = make_evaluator(sbm, docvecs, FakeTopics(topics_vecs), batch_size=8, split_towers=False)
+    batches = []
+    predict = evaluator.predict
+    evaluator.predict = lambda inputs: batches.append(len(inputs[0])) or predict(inputs)
+    np.testing.assert_allclose(evaluator.score_vectors(np.arange(30), topics_vecs), expected, rtol=1e-4, atol=1e-5)
+    assert max(batches) == 3
+
+    # a head over more than the cosine does not factorize
+    output = keras.layers.Dense(1, activation='sigmoid')(keras.layers.Concatenate()([sbm.output, sbm.output]))
+    evaluator = make_evaluator(keras.Model(sbm.inputs, output), docvecs, FakeTopics(topics_vecs))
+    assert evaluator.get_doc_tower() is None and evaluator.is_pairwise()
+
+
+def test_score_training_model():
+    from tensorflow.keras.backend import l2_normalize
+
+    docvecs = np.random.rand(30, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(4, 20) * (np.random.rand(4, 20) > 0.5))
+    # the training model of arcs/arcs.ipynb
+    docvec_input = keras.Input((8,), name='doc_vec')
+    target_vec = keras.Input((20,), name='target_vec')
+    sbm = keras.layers.Dense(20, use_bias=False, name='SBM')(docvec_input)
+    predict_vec = keras.layers.Lambda(lambda x: l2_normalize(x, axis=-1), name='l2_norm')(sbm)
+    dot_product = keras.layers.Dot(axes=1, normalize=True, name='dot_product')([predict_vec, target_vec])
+    output = keras.layers.Dense(units=1, activation='sigmoid', name='output')(dot_product)
+    model = keras.Model(inputs=[docvec_input, target_vec], outputs=output)
+
+    pairwise = make_evaluator(model, docvecs, FakeTopics(topics_vecs), split_towers=False)
+    expected = pairwise.score_vectors(np.arange(30), topics_vecs)
+    evaluator = make_evaluator(model, docvecs, FakeTopics(topics_vecs), batch_size=8)
+    assert not evaluator.is_pairwise() and [layer.name for layer in evaluator.score_head] == ['output']
+    scores = evaluator.score_vectors(np.arange(30), topics_vecs)
+    np.testing.assert_allclose(scores, expected, rtol=1e-4, atol=1e-5)
+    # with a positive head weight the ranking is the one of the cosine
+    cosine = normalize(docvecs @ model.get_layer('SBM').get_weights()[0]) @ topics_vecs.T
+    if model.get_layer('output').get_weights()[0][0, 0] > 0:
+        np.testing.assert_array_equal(np.argsort(-scores, axis=0)[:5], np.argsort(-cosine, axis=0)[:5])
+
+
+def test_create_runs(tmp_path):
+    docvecs = np.random.rand(50, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(3, 20))
+    inputs = keras.Input(shape=(8,))
+    sbm = keras.Model(inputs, keras.layers.Dense(20, use_bias=False, name='SBM')(inputs))
+    expected = normalize(docvecs @ sbm.get_layer('SBM').get_weights()[0]) @ topics_vecs.T
+
+    evaluator = make_evaluator(sbm, docvecs, FakeTopics(topics_vecs), doc_block=16, workers=2)
+    runs_file = str(tmp_path / "runs.txt")
+    evaluator.create_runs(runs_file, depth=10)
+    with open(runs_file) as fp:
+        lines = [line.split() for line in fp]
+    assert len(lines) == 30
+    assert [int(line[2]) for line in lines if line[0] == "52"] == np.argsort(-expected[:, 1])[:10].tolist()
+
+
+def test_ann_candidates(tmp_path):
+    from evaluation.ann import BruteForceIndex
+
+    docvecs = np.random.rand(60, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(3, 20))
+    inputs = keras.Input(shape=(8,))
+    sbm = keras.Model(inputs, keras.layers.Dense(20, use_bias=False, name='SBM')(inputs))
+    evaluator = make_evaluator(sbm, docvecs, FakeTopics(topics_vecs), doc_block=16)
+
+    full = evaluator.create_runs(str(tmp_path / "full.txt"), depth=10)
+    # every document a candidate: same run as scoring the full collection
+    ann = evaluator.create_runs(str(tmp_path / "ann.txt"), depth=10, ann_index=BruteForceIndex(docvecs),
+                                candidates=60)
+    for topic_no in (51, 52, 53):
+        np.testing.assert_array_equal(ann.result(topic_no)[0], full.result(topic_no)[0])
+    # candidates are restricted to the scored documents
+    subset = evaluator.create_runs(str(tmp_path / "subset.txt"), depth=10, doc_rows=np.arange(0, 60, 2),
+                                   ann_index=BruteForceIndex(docvecs), candidates=60)
+    full_subset = evaluator.create_runs(str(tmp_path / "full_subset.txt"), depth=10, doc_rows=np.arange(0, 60, 2))
+    np.testing.assert_array_equal(subset.result(51)[0], full_subset.result(51)[0])
+
+    rows, _ = BruteForceIndex(docvecs).search(evaluator.topic_queries([51, 52, 53]), 20)
+    blocks = list(evaluator.candidate_blocks(BruteForceIndex(docvecs), 20, [51, 52, 53]))
+    for topic_no, topic_rows in zip((51, 52, 53), rows):
+        candidate_rows = np.concatenate([block_rows for block_rows, block_topics, _ in blocks
+                                         if block_topics == [topic_no]])
+        scores = np.concatenate([scores[:, 0] for _, block_topics, scores in blocks if block_topics == [topic_no]])
+        assert sorted(candidate_rows.tolist()) == sorted(topic_rows.tolist())
+        np.testing.assert_allclose(scores, evaluator.score_vectors(candidate_rows, topics_vecs)[:, topic_no - 51],
+                                   rtol=1e-5)
+
+    # a candidate of several topics is projected once
+    projected = []
+    predict = evaluator.predict
+    evaluator.predict = lambda inputs: projected.append(len(inputs)) or predict(inputs)
+    list(evaluator.candidate_blocks(BruteForceIndex(docvecs), 20, [51, 52, 53]))
+    assert sum(projected) == len(np.unique(rows))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from evaluation.metrics import evaluate_rankings, evaluate_scores, evaluate_top_k, relevance_matrix, summarize
+from evaluation.ranking import TopK
+from trec.trecqrels import TrecQrels
+from trec.test_trecqrels import SAMPLE_QRELS
+
+DOC_LIST = ["D0", "D1", "D2", "D3", "D4"]
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "qrels.51-52").write_text(SAMPLE_QRELS)
+    return TrecQrels(str(tmp_path)).build_index(DOC_LIST)
+
+
+def test_relevance_matrix(index):
+    rows = [[3, 2, 1, -1], [2, 1, 0, 4], [1, 0, -1, -1]]
+    assert relevance_matrix(rows, [51, 52, 51], index).tolist() == [[True, False, True, False],
+                                                                    [True, False, False, False],
+                                                                    [True, False, False, False]]
+
+
+def test_evaluate_rankings(index):
+    # topic 51 has 3 relevant documents, GONE is never retrieved, topic 53 is not judged
+    results = evaluate_rankings([[2, 3, 0, 1], [2, 0, 1, 3], [0, 1, 2, 3]], [51, 52, 53], index, precision_at=2)
+    assert results["topic_nos"].tolist() == [51, 52]
+    np.testing.assert_allclose(results["map"], [(1 / 2 + 2 / 4) / 3, 1.0])
+    np.testing.assert_allclose(results["P_2"], [0.5, 0.5])
+    np.testing.assert_allclose(results["Rprec"], [1 / 3, 1.0])
+    ideal = 1 + 1 / np.log2(3) + 1 / np.log2(4)
+    np.testing.assert_allclose(results["ndcg"], [(1 / np.log2(3) + 1 / np.log2(5)) / ideal, 1.0])
+    assert summarize(results)["map"] == pytest.approx(((1 / 2 + 2 / 4) / 3 + 1) / 2)
+
+
+def test_evaluate_scores(index):
+    scores = np.array([[0.1, 0.9], [0.5, 0.2], [0.3, 0.8], [0.9, 0.1], [0.0, 0.0]], dtype=np.float32)
+    results = evaluate_scores(scores, [51, 52], index, depth=3)
+
+    top_k = TopK([51, 52], k=3)
+    top_k.push(np.arange(5), [51, 52], scores)
+    expected = evaluate_top_k(top_k, index, depth=3)
+    for name in ("map", "P_10", "Rprec", "ndcg"):
+        np.testing.assert_allclose(results[name], expected[name])
+    np.testing.assert_allclose(results["map"], [(1 + 1) / 3, 1 / 2])
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+from evaluation import projection_cache
+from evaluation.projection_cache import ProjectionCache, model_digest
+
+
+def test_projection_cache(tmp_path):
+    sbm_file, d2v_dir = tmp_path / "sbm.h5", tmp_path / "docvecs"
+    sbm_file.write_bytes(b"weights v1")
+    d2v_dir.mkdir()
+    (d2v_dir / "vectors.bin").write_bytes(b"vectors")
+    docvecs = np.random.rand(10, 4).astype(np.float32)
+    calls = []
+
+    def predict(batch):
+        calls.append(len(batch))
+        return batch * 2
+
+    cache = ProjectionCache(str(tmp_path / "cache"))
+    projections = cache.get_or_build(str(sbm_file), str(d2v_dir), docvecs, predict, batch_size=4)
+    assert calls == [4, 4, 2]
+    np.testing.assert_allclose(projections, docvecs * 2)
+
+    assert model_digest(str(d2v_dir)) == model_digest(str(d2v_dir))
+    np.testing.assert_allclose(cache.get_or_build(str(sbm_file), str(d2v_dir), docvecs, predict), docvecs * 2)
+    assert len(calls) == 3
+
+    # a retrained SBM invalidates the entry and replaces it
+    sbm_file.write_bytes(b"weights v2")
+    cache.get_or_build(str(sbm_file), str(d2v_dir), docvecs, lambda batch: batch * 3)
+    assert len(list((tmp_path / "cache").glob("*.bin"))) == 1
+    np.testing.assert_allclose(cache.get_or_build(str(sbm_file), str(d2v_dir), docvecs, predict), docvecs * 3)
+    assert len(calls) == 3
+
+
+def test_model_digest_arrays(tmp_path):
+    # Doc2Vec.save writes the large arrays next to the model file
+    model_file = tmp_path / "doc2vec.model"
+    model_file.write_bytes(b"pickle")
+    vectors_file = tmp_path / "doc2vec.model.docvecs.vectors_docs.npy"
+    vectors_file.write_bytes(b"vectors v1")
+    (tmp_path / "other.model.docvecs.vectors_docs.npy").write_bytes(b"other")
+
+    digest = model_digest(str(model_file))
+    vectors_file.write_bytes(b"vectors v2")
+    retrained = model_digest(str(model_file))
+    assert retrained != digest
+    # arrays of another model in the same folder are not part of it
+    (tmp_path / "other.model.docvecs.vectors_docs.npy").write_bytes(b"other v2")
+    assert model_digest(str(model_file)) == retrained
+
+
+def test_key_signature(tmp_path, monkeypatch):
+    sbm_file, d2v_file = tmp_path / "sbm.h5", tmp_path / "doc2vec.model"
+    sbm_file.write_bytes(b"weights")
+    d2v_file.write_bytes(b"pickle")
+    key = ProjectionCache(str(tmp_path / "cache")).key(str(sbm_file), str(d2v_file))
+
+    hashed = []
+    file_digest = projection_cache._file_digest
+    monkeypatch.setattr(projection_cache, "_file_digest", lambda filename: hashed.append(filename) or
+                        file_digest(filename))
+    # a new process finds the key by the signature of the unchanged files
+    monkeypatch.setattr(projection_cache, "_digests", {})
+    assert ProjectionCache(str(tmp_path / "cache")).key(str(sbm_file), str(d2v_file)) == key
+    assert hashed == []
+
+    # a touched file is hashed again, its content still maps to the same key
+    stat = os.stat(sbm_file)
+    os.utime(sbm_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert ProjectionCache(str(tmp_path / "cache")).key(str(sbm_file), str(d2v_file)) == key
+    assert hashed == [str(sbm_file), str(d2v_file)]
+
+
+def test_empty_collection(tmp_path):
+    cache = ProjectionCache(str(tmp_path / "cache"))
+    projections = cache.build("empty", np.empty((0, 4), dtype=np.float32), lambda batch: batch[:, :3])
+    assert projections.shape == (0, 3)
+    assert cache.get("empty").shape == (0, 3)
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import numpy as np
+from sklearn.preprocessing import normalize
+from tensorflow import keras
+
+from doc_embedding.docvector_store import DocVectorStore, export_docvecs
+from evaluation.evaluator import Evaluator
+from evaluation.quantization import quantization_report
+from evaluation.test_evaluator import FakeTopics
+from trec.test_trecqrels import SAMPLE_QRELS
+from trec.trecqrels import TrecQrels
+from utils import ModelLoader
+
+
+def test_quantization_report(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    doc_nos = ["D%d" % i for i in range(200)]
+    d2v = SimpleNamespace(docvecs=SimpleNamespace(vectors_docs=vectors, index2entity=doc_nos),
+                          wv=SimpleNamespace(index2word=[]), vector_size=16)
+    (tmp_path / "qrels").mkdir()
+    (tmp_path / "qrels" / "qrels.51-52").write_text(SAMPLE_QRELS)
+    index = TrecQrels(str(tmp_path / "qrels")).build_index(doc_nos)
+
+    inputs = keras.Input(shape=(16,))
+    sbm = keras.Model(inputs, keras.layers.Dense(30, use_bias=False, name='SBM')(inputs))
+    topics = FakeTopics(normalize(rng.random((2, 30))))
+
+    def make_evaluator(dtype):
+        export_docvecs(d2v, str(tmp_path / dtype), dtype=dtype)
+        model_loader = ModelLoader()
+        model_loader.docvecs, model_loader.sbm = DocVectorStore(str(tmp_path / dtype)), sbm
+        return Evaluator(model_loader, topics)
+
+    reference = make_evaluator("float32")
+    report = quantization_report(reference, reference, k=20, sample=50, index=index)
+    assert report["min_cosine"] > 1 - 1e-6 and report["mean_relative_error"] == 0 and report["overlap@20"] == 1.0
+    assert report["mean_score_drift"] == 0 and report["reference_metrics"] == report["quantized_metrics"]
+
+    for dtype, itemsize in (("float16", 2), ("int8", 1)):
+        quantized = make_evaluator(dtype)
+        report = quantization_report(reference, quantized, k=20)
+        assert report["quantized_bytes"] < report["reference_bytes"] * itemsize / 4 + 100
+        assert report["min_cosine"] > 0.999 and report["overlap@20"] >= 0.9
+        assert 0 < report["mean_score_drift"] < 0.01
+        assert "reference_metrics" not in report
+
+    # a depth beyond the collection is clipped to it, without inf or nan padding
+    report = quantization_report(reference, quantized, k=500, index=index)
+    assert "overlap@200" in report and report["overlap@200"] == 1.0 and np.isfinite(report["mean_score_drift"])
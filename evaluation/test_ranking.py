@@ -0,0 +1,30 @@
+import numpy as np
+
+from evaluation.ranking import TopK, write_runs
+
+
+def test_top_k():
+    scores = np.random.rand(1000, 3).astype(np.float32)
+    scores[10, 0] = scores[11, 0] = 2
+    top_k = TopK([51, 52, 53], k=20)
+    for start in range(0, 1000, 64):
+        # blocks of topic 52 alone and of the other topics
+        top_k.push(np.arange(start, min(start + 64, 1000)), [52], scores[start: start + 64, 1:2])
+        top_k.push(np.arange(start, min(start + 64, 1000)), [53, 51], scores[start: start + 64, [2, 0]])
+
+    for j, topic_no in enumerate([51, 52, 53]):
+        rows, top_scores = top_k.result(topic_no)
+        expected = np.lexsort((np.arange(1000), -scores[:, j]))[:20]
+        np.testing.assert_array_equal(rows, expected)
+        np.testing.assert_array_equal(top_scores, scores[expected, j])
+    assert top_k.result(51)[0][:2].tolist() == [10, 11]
+
+
+def test_write_runs(tmp_path):
+    top_k = TopK([51, 52], k=5)
+    top_k.push([0, 1, 2], [51, 52], np.array([[0.5, 0.1], [0.25, 0.2], [1.0, 0.3]], dtype=np.float32))
+    runs_file = str(tmp_path / "runs.txt")
+    write_runs(runs_file, top_k, ["D0", "D1", "D2"], depth=2)
+    with open(runs_file) as fp:
+        assert fp.read().splitlines() == ["51 Q0 D2 0 1 test", "51 Q0 D0 1 0.5 test",
+                                          "52 Q0 D2 0 0.30000001 test", "52 Q0 D1 1 0.2 test"]
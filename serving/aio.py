@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from scipy.sparse import vstack
+
+from serving.batcher import MAX_BATCH, MAX_WAIT
+from serving.ranker import DEFAULT_DEPTH, MAX_DEPTH
+
+logger = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = 1024
+MAX_QUEUED = 256
+
+
+class Overloaded(Exception):
+    'Raised by :meth:`AsyncRanker.rank` when `max_in_flight` queries are pending and the caller does not wait'
+
+
+class AsyncRanker:
+    """asyncio front of a :class:`serving.ranker.Ranker`, serving many concurrent queries from one event loop.
+
+    A query is tokenized in a thread of the tokenizer executor, then queued to a single batching task, which
+    collects up to `max_batch` queries (waiting at most `max_wait` seconds for more) and ranks them in one pass over
+    the documents in the scoring thread, so neither tokenization nor scoring blocks the event loop and no thread is
+    held per query. Backpressure: at most `max_in_flight` queries are accepted at once, further callers wait (or
+    get :class:`Overloaded` with `wait=False`), and the queue to the batching task holds at most `max_queued`
+    vectorized queries. A cancelled query is dropped from its batch if it was not scored yet. :meth:`close` fails
+    all unanswered queries and :meth:`rank` fails once closing started.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> async def main():
+        ...     async with AsyncRanker(Ranker(model_loader, trec_topics)) as ranker:
+        ...         return await asyncio.gather(*(ranker.rank(text, k=10) for text in texts))
+        >>> results = asyncio.run(main())
+
+    """
+
+    def __init__(self, ranker, max_batch=MAX_BATCH, max_wait=MAX_WAIT, max_in_flight=MAX_IN_FLIGHT,
+                 max_queued=MAX_QUEUED, tokenizer_workers=1):
+        """
+        :param ranker: :class:`serving.ranker.Ranker`
+        :param max_batch: maximum number of queries ranked at once
+        :param max_wait: seconds the first query of a batch waits for others
+        :param max_in_flight: maximum number of accepted, unanswered queries
+        :param max_queued: maximum number of vectorized queries waiting for the batching task
+        :param tokenizer_workers: number of tokenizer threads, spacy pipelines are not meant to be shared by threads
+        """
+        self.ranker = ranker
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.tokenizer_workers = tokenizer_workers
+        self.in_flight = None
+        self.queue = None
+        self.task = None
+        # queries taken from the queue by the batching task and not answered yet
+        self.batch = []
+        # callers blocked on the full queue
+        self.putting = 0
+        self.closing = False
+        self.tokenize_executor = None
+        self.score_executor = None
+        self.batches = 0
+        self.ranked = 0
+
+    async def start(self):
+        'Start the batching task, on the running event loop'
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.queue = asyncio.Queue(self.max_queued)
+        self.tokenize_executor = ThreadPoolExecutor(self.tokenizer_workers, thread_name_prefix="tokenize")
+        self.score_executor = ThreadPoolExecutor(1, thread_name_prefix="score")
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        Stop the batching task. Unanswered queries, including those of the batch being scored, fail with a
+        RuntimeError. A batch being scored finishes in the scoring thread, its results are dropped.
+        """
+        self.closing = True
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        for _, _, future in self.batch:
+            self._fail(future)
+        self.batch = []
+        while True:
+            while not self.queue.empty():
+                self._fail(self.queue.get_nowait()[2])
+            if not self.putting:
+                break
+            # let the callers woken by the freed slots put their queries
+            await asyncio.sleep(0)
+        self.tokenize_executor.shutdown(wait=False)
+        self.score_executor.shutdown(wait=False)
+
+    def _check_open(self):
+        if self.closing:
+            raise RuntimeError("AsyncRanker is closed")
+
+    @staticmethod
+    def _fail(future):
+        if not future.done():
+            future.set_exception(RuntimeError("AsyncRanker is closed"))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def rank(self, topic_text, k=DEFAULT_DEPTH, wait=True):
+        """
+        Rank all documents for a query text.
+        :param topic_text: query text, tokenized like TREC topics
+        :param k: number of results
+        :param wait: if False, raise :class:`Overloaded` instead of waiting when `max_in_flight` queries are pending
+        :return: doc_nos and float scores of the top k documents, best first
+        """
+        if not 0 < k <= MAX_DEPTH:
+            raise ValueError("k must be in 1..%d" % MAX_DEPTH)
+        self._check_open()
+        if not wait and self.in_flight.locked():
+            raise Overloaded("%d queries in flight" % self.max_in_flight)
+        async with self.in_flight:
+            self._check_open()
+            loop = asyncio.get_running_loop()
+            topic_vec = await loop.run_in_executor(self.tokenize_executor, self.ranker.vectorize, [topic_text])
+            # closing may have started meanwhile, the queue is then no longer drained
+            self._check_open()
+            future = loop.create_future()
+            self.putting += 1
+            try:
+                await self.queue.put((topic_vec, k, future))
+            finally:
+                self.putting -= 1
+            # cancelling the caller cancels the future, the batching task then skips the query
+            return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        # collected into self.batch, so close() answers them if the task is cancelled meanwhile
+        self.batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(self.batch) < self.max_batch:
+            if not self.queue.empty():
+                self.batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self.batch = [item for item in self.batch if not item[2].done()]
+        return self.batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            topic_vecs = vstack([topic_vec for topic_vec, _, _ in batch], format='csr')
+            try:
+                results = await loop.run_in_executor(self.score_executor, self.ranker.rank_vectors, topic_vecs,
+                                                     [k for _, k, _ in batch])
+            except Exception as e:
+                logger.exception("batch of %d queries failed", len(batch))
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self.batch = []
+                continue
+            for (_, _, future), result in zip(batch, results):
+                # the caller may have been cancelled while the batch was scored
+                if not future.done():
+                    future.set_result(result)
+            self.batch = []
+            self.batches += 1
+            self.ranked += len(batch)
@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 32
+MAX_WAIT = 0.005
+
+
+class MicroBatcher:
+    """Coalesce concurrent requests into batches processed by one thread.
+
+    The first pending request opens a batch, which is processed once `max_batch` requests joined it or `max_wait`
+    seconds passed, so a lone request waits at most `max_wait` and a burst is scored in one pass over the
+    documents instead of one pass per request.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> batcher = MicroBatcher(ranker.rank_batch, max_batch=32, max_wait=0.005)
+        >>> doc_nos, scores = batcher.submit({"text": "oil prices", "k": 10}).result()
+        >>> batcher.close()
+
+    """
+
+    def __init__(self, process, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        """
+        :param process: callable mapping a list of requests to the list of their results
+        :param max_batch: maximum number of requests per batch
+        :param max_wait: seconds the first request of a batch waits for others
+        """
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.processed = 0
+        self.thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        """
+        :param request: a request of the process callable
+        :return: a :class:`concurrent.futures.Future` of its result
+        """
+        future = Future()
+        self.requests.put((request, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # stop after this batch
+                self.requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [(request, future) for request, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.process([request for request, _ in batch])
+            except Exception as e:
+                logger.exception("batch of %d requests failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self.batches += 1
+            self.processed += len(batch)
+
+    def close(self):
+        'Process the pending requests and stop'
+        self.requests.put(None)
+        self.thread.join()
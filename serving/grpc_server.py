@@ -0,0 +1,104 @@
+"""gRPC front of the ranking server, sharing the micro-batching of the HTTP server.
+
+The service is registered by a generic handler with JSON encoded messages, so it needs no generated protobuf code:
+method "/arcs.Ranker/Rank", request {"text": ..., "k": ...} or {"topic_no": ...}, response {"doc_nos", "scores"}.
+
+Usage::
+
+    python -m serving.grpc_server --docvecs F:/Models/docvecs_d1000/ --sbm F:/Models/NN/sbm_keyword --port 50051
+
+"""
+import argparse
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+from serving.batcher import MAX_BATCH, MAX_WAIT, MicroBatcher
+from serving.ranker import Ranker
+
+logger = logging.getLogger(__name__)
+
+SERVICE = "arcs.Ranker"
+RANK_METHOD = "/%s/Rank" % SERVICE
+GRPC_WORKERS = 64
+
+
+def _encode(message):
+    return json.dumps(message).encode("utf-8")
+
+
+def _decode(data):
+    return json.loads(data.decode("utf-8"))
+
+
+def create_grpc_server(ranker, address, max_batch=MAX_BATCH, max_wait=MAX_WAIT, workers=GRPC_WORKERS):
+    """
+    :param ranker: :class:`serving.ranker.Ranker`
+    :param address: "host:port" to listen on, port 0 picks a free port
+    :param max_batch: maximum number of queries per batch
+    :param max_wait: seconds the first query of a batch waits for others
+    :param workers: number of threads serving requests, the concurrent requests that can join a batch
+    :return: the started server, its :class:`MicroBatcher` and the bound port
+    """
+    batcher = MicroBatcher(ranker.rank_batch, max_batch=max_batch, max_wait=max_wait)
+
+    def rank(query, context):
+        try:
+            ranker.validate(query)
+        except (ValueError, KeyError, TypeError) as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        doc_nos, scores = batcher.submit(query).result()
+        return {"doc_nos": doc_nos, "scores": scores}
+
+    handler = grpc.method_handlers_generic_handler(SERVICE, {
+        "Rank": grpc.unary_unary_rpc_method_handler(rank, request_deserializer=_decode, response_serializer=_encode)})
+    server = grpc.server(ThreadPoolExecutor(workers))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port(address)
+    server.start()
+    return server, batcher, port
+
+
+def rank_stub(channel):
+    """
+    :param channel: a :class:`grpc.Channel` to the server
+    :return: callable(query dict) -> response dict
+    """
+    return channel.unary_unary(RANK_METHOD, request_serializer=_encode, response_deserializer=_decode)
+
+
+def main():
+    from trec.trectopics import TrecTopics
+    from utils import ModelLoader
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docvecs", required=True, help="folder of a DocVectorStore")
+    parser.add_argument("--sbm", required=True, help="SBM model file")
+    parser.add_argument("--topics", help="folder of TREC topics, to query topics by number")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50051)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT, help="seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model_loader = ModelLoader()
+    model_loader.load_docvecs(args.docvecs)
+    model_loader.load_sbm(args.sbm)
+    ranker = Ranker(model_loader, TrecTopics(args.topics) if args.topics else None)
+    server, batcher, _ = create_grpc_server(ranker, "%s:%d" % (args.host, args.port), max_batch=args.max_batch,
+                                            max_wait=args.max_wait)
+    logger.info("serving %d documents on %s:%d", len(ranker.doc_list), args.host, args.port)
+    try:
+        server.wait_for_termination()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop(None)
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Load generator of the ranking servers: concurrent clients sending queries, reporting p50/p99 latency and QPS.
+
+Usage::
+
+    python -m serving.loadgen --port 8080 --concurrency 32 --requests 2000 --queries queries.txt
+    python -m serving.loadgen --grpc --port 50051 --concurrency 32 --topic-nos 51-100
+
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_QUERIES = ["oil prices", "airline safety", "stock market crash", "computer virus", "drug trafficking",
+                   "nuclear power plant", "trade tariffs japan", "hubble telescope", "genetic engineering",
+                   "tropical storm damage"]
+
+
+def http_client(host, port):
+    'Factory of per thread senders keeping one HTTP connection alive'
+    def connect():
+        connection = http.client.HTTPConnection(host, port)
+
+        def send(query):
+            connection.request("POST", "/rank", body=json.dumps(query), headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise RuntimeError("%d %s" % (response.status, body[:200]))
+            return json.loads(body)
+        return send
+    return connect
+
+
+def grpc_client(host, port):
+    'Factory of senders sharing one gRPC channel'
+    import grpc
+    from serving.grpc_server import rank_stub
+
+    stub = rank_stub(grpc.insecure_channel("%s:%d" % (host, port)))
+    return lambda: stub
+
+
+def run_load(connect, queries, concurrency, requests):
+    """
+    Send requests from concurrent client threads, each waiting for its response before the next request.
+    :param connect: factory returning a send(query) callable per client thread
+    :param queries: query dicts, sent round robin
+    :param concurrency: number of client threads
+    :param requests: total number of requests
+    :return: dict of requests, errors, qps, p50_ms, p99_ms, mean_ms
+    """
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def client(i):
+        send = connect()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            start = time.perf_counter()
+            try:
+                send(queries[n % len(queries)])
+            except Exception:
+                errors[i] += 1
+                # the connection may be broken
+                send = connect()
+                continue
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.array(values) for values in latencies]) * 1000
+    summary = {"requests": requests, "errors": sum(errors), "qps": len(all_latencies) / elapsed}
+    if len(all_latencies):
+        summary.update({"p50_ms": float(np.percentile(all_latencies, 50)),
+                        "p99_ms": float(np.percentile(all_latencies, 99)), "mean_ms": float(all_latencies.mean())})
+    return summary
+
+
+def format_summary(summary):
+    return ", ".join("%s %.1f" % (name, value) if isinstance(value, float) else "%s %d" % (name, value)
+                     for name, value in summary.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--grpc", action="store_true", help="load the gRPC server instead of the HTTP server")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--queries", help="file of query texts, one per line")
+    parser.add_argument("--topic-nos", help="range of topic numbers queried instead of texts, e.g. 51-100")
+    args = parser.parse_args()
+
+    if args.topic_nos:
+        first, last = map(int, args.topic_nos.split("-"))
+        queries = [{"topic_no": topic_no, "k": args.k} for topic_no in range(first, last + 1)]
+    else:
+        texts = DEFAULT_QUERIES
+        if args.queries:
+            with open(args.queries, 'r', encoding="utf-8") as fp:
+                texts = [line.strip() for line in fp if line.strip()]
+        queries = [{"text": text, "k": args.k} for text in texts]
+
+    connect = grpc_client(args.host, args.port) if args.grpc else http_client(args.host, args.port)
+    print(format_summary(run_load(connect, queries, args.concurrency, args.requests)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse, vstack
+from sklearn.preprocessing import normalize
+
+from evaluation.evaluator import DOC_BLOCK, PREDICT_BATCH, Evaluator
+from evaluation.ranking import TopK
+from trec.trectopics import EXTRA_STOPWORDS, TOKEN_MAX_LEN, TOKEN_MIN_LEN
+from utils import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 100
+MAX_DEPTH = 1000
+# documents checked against the SBM before scoring by its factorization
+CHECK_DOCS = 256
+
+
+def query_int(query, name, default=None):
+    """
+    An integer field of a query, JSON numbers like 10.0 included.
+    :param query: query dict
+    :param name: field name
+    :param default: value of a missing field
+    :return: int
+    """
+    value = query.get(name, default)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("%s must be an integer" % name)
+    return value
+
+
+class Ranker:
+    """Rank all documents for ad-hoc queries with models loaded once.
+
+    A query is either a topic text, tokenized like :class:`trec.trectopics.TrecTopics` topics and vectorized against
+    the Doc2Vec vocabulary, or the number of a vectorized TREC topic. :meth:`rank_batch` scores a whole batch of
+    queries in one pass over the documents.
+
+    If the SBM projects documents by the kernel K of its 'SBM' layer and scores the cosine with the topic vector t
+    (a keyword model, or a retrieval model split by :meth:`Evaluator.get_doc_tower`), the score factorizes into
+    d . (K t) / |d K|, followed by the scalar head of a retrieval model. The norms |d K| are computed once from the
+    Gram matrix K K^T, so a query costs one matrix product with the document vectors instead of projecting every
+    document into the vocabulary space.
+    The factorization is checked against the SBM on some documents and not used if they disagree.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> model_loader = ModelLoader()
+        >>> model_loader.load_docvecs("F:/Models/docvecs_d1000/")
+        >>> model_loader.load_sbm("F:/Models/NN/sbm_keyword")
+        >>> ranker = Ranker(model_loader, TrecTopics("F:/Runs/topics"))
+        >>> ranker.rank_batch([{"text": "oil prices in the middle east"}, {"topic_no": 51, "k": 10}])
+
+    """
+
+    def __init__(self, model_loader, trec_topic=None, doc_block=DOC_BLOCK, batch_size=PREDICT_BATCH,
+                 projections=None, tokenizer=None, factorize=True):
+        """
+
+        Parameters
+        ----------
+        model_loader : :class:`utils.ModelLoader`
+            Loader holding the document vectors and the SBM.
+        trec_topic : :class:`trec.trectopics.TrecTopics`, optional
+            Topics queried by number, vectorized from their titles unless already vectorized.
+        doc_block : int, optional
+            Number of documents scored per block.
+        batch_size : int, optional
+            Number of documents per SBM prediction, if the SBM does not factorize.
+        projections : array-like, optional
+            Precomputed keyword model predictions of all documents, see :class:`evaluation.evaluator.Evaluator`.
+        tokenizer : :class:`utils.Tokenizer`, optional
+            Tokenizer of query texts, one with the settings of TREC topics if None.
+        factorize : bool, optional
+            If True, score by the factorization of the SBM when it is exact.
+
+        """
+        self.model_loader = model_loader
+        self.doc_list = model_loader.get_docs_list()
+        self.vocab = model_loader.get_vocab()
+        self.topics = trec_topic
+        if trec_topic is not None and trec_topic.topics_vecs is None:
+            trec_topic.vectorize(vocab_dict=self.vocab, include_title=True, sparse=True)
+        self.evaluator = Evaluator(model_loader, trec_topic, doc_block=doc_block, batch_size=batch_size,
+                                   projections=projections)
+        self.doc_block = doc_block
+        self.tokenizer = tokenizer
+
+        self.kernel = None
+        self.doc_norms = None
+        if factorize and projections is None:
+            self.init_factorization()
+
+    def get_tokenizer(self):
+        if self.tokenizer is None:
+            self.tokenizer = Tokenizer(minimum_len=TOKEN_MIN_LEN, maximum_len=TOKEN_MAX_LEN,
+                                       extra_stopwords=EXTRA_STOPWORDS)
+        return self.tokenizer
+
+    def init_factorization(self):
+        'Compute the document norms |d K| if the SBM factorizes, checked on the first documents'
+        sbm = self.model_loader.sbm
+        if self.evaluator.is_pairwise() or 'SBM' not in [layer.name for layer in sbm.layers]:
+            return
+        kernel = np.asarray(sbm.get_layer('SBM').get_weights()[0], dtype=np.float32)
+        if kernel.shape[1] != len(self.vocab):
+            return
+        docvecs = self.model_loader.get_docvecs()
+
+        gram = kernel @ kernel.T
+        doc_norms = np.empty(len(self.doc_list), dtype=np.float32)
+        for start in range(0, len(self.doc_list), self.doc_block):
+            block = docvecs[start: start + self.doc_block]
+            doc_norms[start: start + len(block)] = np.sqrt(np.maximum(((block @ gram) * block).sum(axis=1), 0))
+
+        rows = np.arange(min(CHECK_DOCS, len(self.doc_list)))
+        check_vecs = normalize(np.random.default_rng(0).random((2, len(self.vocab)), dtype=np.float32))
+        expected = self.evaluator.score_vectors(rows, check_vecs)
+        self.kernel, self.doc_norms = kernel, doc_norms
+        if not np.allclose(self.score_factorized(rows, check_vecs), expected, rtol=1e-3, atol=1e-4):
+            logger.warning("%s does not factorize by its 'SBM' layer, scoring it block by block", sbm.name)
+            self.kernel, self.doc_norms = None, None
+
+    def score_factorized(self, doc_rows, topic_vecs):
+        'Scores of documents against topic vectors by the factorization of the SBM'
+        if self.evaluator.get_doc_tower() is not None:
+            # the normalized Dot of a split model also normalizes the topic input, as in Evaluator.score_vectors
+            topic_vecs = normalize(topic_vecs)
+        queries = np.asarray(topic_vecs @ self.kernel.T, dtype=np.float32)
+        norms = self.doc_norms[doc_rows]
+        scores = np.asarray(self.model_loader.get_docvecs()[doc_rows], dtype=np.float32) @ queries.T
+        # the scalar head of a split retrieval model over the cosine
+        return self.evaluator.apply_head(scores / np.where(norms > 0, norms, 1)[:, None])
+
+    def vectorize(self, texts):
+        """
+        Bag of words vectors of query texts, like the vectors of :meth:`TrecTopics.vectorize`.
+        :param texts: query texts
+        :return: l2 normalized float32 CSR matrix, one row per text
+        """
+        indptr, indices = [0], []
+        for tokens in self.get_tokenizer().tokenize_batch(texts):
+            for token in tokens:
+                if token in self.vocab:
+                    entry = self.vocab[token]
+                    indices.append(getattr(entry, "index", entry))
+            indptr.append(len(indices))
+        vecs = csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                          shape=(len(indptr) - 1, len(self.vocab)))
+        vecs.sum_duplicates()
+        return normalize(vecs)
+
+    def validate(self, query):
+        """
+        Check a query before it joins a batch, so a bad query does not fail the others.
+        :param query: dict holding a "text" or a "topic_no", and optionally the number of results "k"
+        :return: None
+        """
+        if not isinstance(query, dict):
+            raise TypeError("a query must be an object")
+        if "text" in query:
+            if not isinstance(query["text"], str):
+                raise ValueError("text must be a string")
+        elif "topic_no" in query:
+            if self.topics is None or query_int(query, "topic_no") not in self.topics.topic_row_maps:
+                raise KeyError("unknown topic %s" % query["topic_no"])
+        else:
+            raise ValueError("a query needs a text or a topic_no")
+        if not 0 < query_int(query, "k", DEFAULT_DEPTH) <= MAX_DEPTH:
+            raise ValueError("k must be in 1..%d" % MAX_DEPTH)
+
+    def query_vectors(self, queries):
+        """
+        :param queries: dicts holding a "text" or a "topic_no"
+        :return: float32 CSR matrix, one row per query
+        """
+        texts = [query["text"] for query in queries if "text" in query]
+        text_vecs = self.vectorize(texts) if texts else None
+        rows, next_text = [], 0
+        for query in queries:
+            if "text" in query:
+                rows.append(text_vecs[next_text])
+                next_text += 1
+            else:
+                vec = self.topics.get_topic_vectors([int(query["topic_no"])], dense=False)
+                rows.append(vec if issparse(vec) else csr_matrix(vec))
+        return vstack(rows, format='csr', dtype=np.float32) if rows else \
+            csr_matrix((0, len(self.vocab)), dtype=np.float32)
+
+    def score(self, doc_rows, topic_vecs):
+        if self.kernel is not None:
+            return self.score_factorized(doc_rows, topic_vecs)
+        return self.evaluator.score_vectors(doc_rows, topic_vecs)
+
+    def rank_batch(self, queries):
+        """
+        Rank all documents for a batch of queries in one pass over the documents.
+        :param queries: dicts holding a "text" or a "topic_no", and optionally the number of results "k"
+        :return: a list of (doc_nos, float scores) per query, best first
+        """
+        depths = [min(int(query.get("k", DEFAULT_DEPTH)), MAX_DEPTH) for query in queries]
+        return self.rank_vectors(self.query_vectors(queries), depths)
+
+    def rank_vectors(self, topic_vecs, depths):
+        """
+        Rank all documents for already vectorized queries in one pass over the documents.
+        :param topic_vecs: float32 CSR matrix, one row per query, e.g. of :meth:`vectorize`
+        :param depths: number of results per query
+        :return: a list of (doc_nos, float scores) per query, best first
+        """
+        top_k = TopK(range(len(depths)), k=max(depths, default=1))
+        for start in range(0, len(self.doc_list), self.doc_block):
+            doc_rows = np.arange(start, min(start + self.doc_block, len(self.doc_list)))
+            top_k.push(doc_rows, top_k.topic_nos, self.score(doc_rows, topic_vecs))
+
+        results = []
+        for i, depth in enumerate(depths):
+            rows, scores = top_k.result(i)
+            results.append(([self.doc_list[row] for row in rows[:depth].tolist()], scores[:depth].tolist()))
+        return results
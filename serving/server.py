@@ -0,0 +1,165 @@
+"""HTTP ranking server keeping the document vectors and the SBM loaded between requests.
+
+Usage::
+
+    python -m serving.server --docvecs F:/Models/docvecs_d1000/ --sbm F:/Models/NN/sbm_keyword \
+        --topics F:/Runs/topics/ --port 8080
+
+    POST /rank   {"text": "oil prices in the middle east", "k": 10}  or  {"topic_no": 51}
+                 -> {"doc_nos": [...], "scores": [...], "took_ms": 12.3}
+    GET  /stats  -> requests, batches, mean batch size, latency percentiles and QPS since the start
+
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from serving.batcher import MAX_BATCH, MAX_WAIT, MicroBatcher
+from serving.ranker import Ranker
+
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 10000
+
+
+class LatencyStats:
+    'Latencies of the last requests, thread safe'
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.errors += error
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            requests, errors = self.requests, self.errors
+        elapsed = time.perf_counter() - self.started
+        summary = {"requests": requests, "errors": errors, "qps": requests / elapsed if elapsed else 0.0}
+        if len(latencies):
+            summary.update({"p50_ms": float(np.percentile(latencies, 50)),
+                            "p99_ms": float(np.percentile(latencies, 99)), "max_ms": float(latencies.max())})
+        return summary
+
+
+class RankingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.server.stats_summary())
+        else:
+            self._reply(404, {"error": "unknown path"})
+
+    def do_POST(self):
+        if self.path != "/rank":
+            self._reply(404, {"error": "unknown path"})
+            return
+        start = time.perf_counter()
+        try:
+            query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.server.ranker.validate(query)
+        except (ValueError, KeyError, TypeError) as e:
+            self.server.stats.record(time.perf_counter() - start, error=True)
+            self._reply(400, {"error": str(e)})
+            return
+        try:
+            doc_nos, scores = self.server.batcher.submit(query).result()
+        except Exception as e:
+            self.server.stats.record(time.perf_counter() - start, error=True)
+            self._reply(500, {"error": str(e)})
+            return
+        took = time.perf_counter() - start
+        self.server.stats.record(took)
+        self._reply(200, {"doc_nos": doc_nos, "scores": scores, "took_ms": 1000 * took})
+
+
+class RankingServer(ThreadingHTTPServer):
+    """Threaded HTTP server whose request threads hand their queries to one :class:`MicroBatcher`.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> server = RankingServer(("127.0.0.1", 8080), Ranker(model_loader, trec_topics))
+        >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+        >>> server.shutdown(); server.close()
+
+    """
+    daemon_threads = True
+    # concurrent clients connecting at once, the default backlog of 5 refuses bursts
+    request_queue_size = 256
+
+    def __init__(self, address, ranker, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        super(RankingServer, self).__init__(address, RankingHandler)
+        self.ranker = ranker
+        self.batcher = MicroBatcher(ranker.rank_batch, max_batch=max_batch, max_wait=max_wait)
+        self.stats = LatencyStats()
+
+    def stats_summary(self):
+        summary = self.stats.summary()
+        summary["batches"] = self.batcher.batches
+        summary["mean_batch"] = self.batcher.processed / self.batcher.batches if self.batcher.batches else 0.0
+        return summary
+
+    def close(self):
+        self.server_close()
+        self.batcher.close()
+
+
+def main():
+    from trec.trectopics import TrecTopics
+    from utils import ModelLoader
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docvecs", required=True, help="folder of a DocVectorStore")
+    parser.add_argument("--sbm", required=True, help="SBM model file")
+    parser.add_argument("--topics", help="folder of TREC topics, to query topics by number")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT, help="seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model_loader = ModelLoader()
+    model_loader.load_docvecs(args.docvecs)
+    model_loader.load_sbm(args.sbm)
+    ranker = Ranker(model_loader, TrecTopics(args.topics) if args.topics else None)
+    server = RankingServer((args.host, args.port), ranker, max_batch=args.max_batch, max_wait=args.max_wait)
+    logger.info("serving %d documents on %s:%d", len(ranker.doc_list), args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from serving.aio import AsyncRanker, Overloaded
+from serving.test_ranker import keyword_sbm, make_ranker
+
+
+def test_rank():
+    ranker = make_ranker(keyword_sbm(8), np.random.rand(100, 8).astype(np.float32))
+    texts = ["oil price", "stock market", "bank rate", "oil"] * 10
+
+    async def run():
+        async with AsyncRanker(ranker, max_batch=16, max_wait=0.01) as async_ranker:
+            results = await asyncio.gather(*(async_ranker.rank(text, k=5) for text in texts))
+            return results, async_ranker.batches
+
+    results, batches = asyncio.run(run())
+    for (doc_nos, scores), text in zip(results, texts):
+        expected_doc_nos, expected_scores = ranker.rank_batch([{"text": text, "k": 5}])[0]
+        assert doc_nos == expected_doc_nos
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+    assert batches < len(texts)
+
+
+def test_backpressure_and_cancel():
+    ranker = make_ranker(keyword_sbm(8), np.random.rand(100, 8).astype(np.float32))
+    # hold the scoring thread until released
+    release = threading.Event()
+    rank_vectors = ranker.rank_vectors
+    ranker.rank_vectors = lambda *args: release.wait() and rank_vectors(*args)
+
+    async def run():
+        async with AsyncRanker(ranker, max_batch=2, max_wait=0.001, max_in_flight=3) as async_ranker:
+            first = asyncio.ensure_future(async_ranker.rank("oil", k=3))
+            others = [asyncio.ensure_future(async_ranker.rank(text, k=3)) for text in ("stock", "bank")]
+            await asyncio.sleep(0.1)
+            try:
+                await async_ranker.rank("rate", wait=False)
+                assert False
+            except Overloaded:
+                pass
+            # cancelled while its batch is scored, and while queued
+            first.cancel()
+            others[1].cancel()
+            release.set()
+            assert (await others[0])[0] == rank_vectors(ranker.vectorize(["stock"]), [3])[0][0]
+            for future in (first, others[1]):
+                try:
+                    await future
+                    assert False
+                except asyncio.CancelledError:
+                    pass
+            # a slot is free again
+            return await async_ranker.rank("rate", k=2, wait=False)
+
+    doc_nos, scores = asyncio.run(run())
+    assert len(doc_nos) == 2
+
+
+def test_close_in_flight():
+    ranker = make_ranker(keyword_sbm(8), np.random.rand(100, 8).astype(np.float32))
+    release = threading.Event()
+    rank_vectors = ranker.rank_vectors
+    ranker.rank_vectors = lambda *args: release.wait() and rank_vectors(*args)
+
+    async def run():
+        async_ranker = AsyncRanker(ranker, max_batch=1, max_wait=0.001, max_in_flight=5, max_queued=1)
+        await async_ranker.start()
+        # one query scored, one queued, three blocked on the full queue and one waiting for a slot
+        queries = [asyncio.ensure_future(async_ranker.rank(text, k=3)) for text in ("oil", "stock", "bank", "rate",
+                                                                                    "market", "price")]
+        await asyncio.sleep(0.2)
+        assert async_ranker.putting == 3
+        await asyncio.wait_for(async_ranker.close(), 1)
+        results = await asyncio.wait_for(asyncio.gather(*queries, return_exceptions=True), 1)
+        try:
+            await async_ranker.rank("oil")
+            assert False
+        except RuntimeError:
+            pass
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        release.set()
+    assert all(isinstance(result, RuntimeError) for result in results)
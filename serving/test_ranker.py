@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from tensorflow import keras
+
+from serving.ranker import Ranker
+from utils import ModelLoader
+
+VOCAB = {"oil": 0, "price": 1, "stock": 2, "market": 3, "bank": 4, "rate": 5}
+
+
+class FakeTopics:
+    def __init__(self, topics_vecs):
+        self.topics_vecs = csr_matrix(topics_vecs, dtype=np.float32)
+        self.topic_row_maps = {51 + i: i for i in range(topics_vecs.shape[0])}
+
+    def get_topic_vectors(self, topic_nos, dense=True):
+        vecs = self.topics_vecs[[self.topic_row_maps[topic_no] for topic_no in topic_nos]]
+        return vecs.toarray() if dense else vecs
+
+
+class FakeKeyedVectors:
+    'Document vectors of a loaded Doc2Vec model, which cannot be indexed by slices or arrays of rows'
+
+    def __init__(self, vectors):
+        self.vectors_docs = vectors
+        self.index2entity = ["D%d" % i for i in range(len(vectors))]
+
+    def __getitem__(self, key):
+        raise TypeError("index vectors_docs instead")
+
+
+def make_ranker(sbm, docvecs, topics_vecs=None, **kwargs):
+    model_loader = ModelLoader()
+    model_loader.docvecs, model_loader.sbm, model_loader.vocab = FakeKeyedVectors(docvecs), sbm, VOCAB
+    tokenizer = SimpleNamespace(tokenize_batch=lambda texts: [text.lower().split() for text in texts])
+    topics = FakeTopics(topics_vecs) if topics_vecs is not None else None
+    return Ranker(model_loader, topics, tokenizer=tokenizer, doc_block=16, **kwargs)
+
+
+def keyword_sbm(dim):
+    inputs = keras.Input(shape=(dim,))
+    projected = keras.layers.Dense(len(VOCAB), use_bias=False, name='SBM')(inputs)
+    return keras.Model(inputs, keras.layers.UnitNormalization()(projected))
+
+
+def test_rank_batch():
+    docvecs = np.random.rand(50, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(2, len(VOCAB)))
+    sbm = keyword_sbm(8)
+    expected = normalize(docvecs @ sbm.get_layer('SBM').get_weights()[0])
+
+    ranker = make_ranker(sbm, docvecs, topics_vecs)
+    assert ranker.kernel is not None
+    baseline = make_ranker(sbm, docvecs, topics_vecs, factorize=False)
+    assert baseline.kernel is None
+
+    queries = [{"text": "Oil price oil unknown", "k": 5}, {"topic_no": 52, "k": 3}, {"text": "nothing known"}]
+    query_vecs = normalize(np.array([[2, 1, 0, 0, 0, 0], topics_vecs[1], np.zeros(len(VOCAB))]))
+    for results in (ranker.rank_batch(queries), baseline.rank_batch(queries)):
+        assert [len(doc_nos) for doc_nos, _ in results] == [5, 3, 50]
+        for (doc_nos, scores), query_vec, k in zip(results, query_vecs, (5, 3)):
+            exact = expected @ query_vec
+            assert doc_nos == ["D%d" % row for row in np.argsort(-exact, kind='stable')[:k]]
+            np.testing.assert_allclose(scores, np.sort(exact)[::-1][:k], rtol=1e-4)
+        assert max(results[2][1]) == 0
+
+
+def test_validate():
+    ranker = make_ranker(keyword_sbm(4), np.random.rand(10, 4).astype(np.float32), np.eye(1, len(VOCAB)))
+    ranker.validate({"text": "oil", "k": 10})
+    ranker.validate({"topic_no": 51})
+    ranker.validate({"topic_no": 51.0, "k": 10.0})
+    # 1e400 is parsed from JSON as inf
+    for query in ({"topic_no": 99}, {"text": 5}, {"k": 3}, {"text": "oil", "k": 0}, {"text": "oil", "k": 5000},
+                  {"text": "oil", "k": float("inf")}, {"topic_no": float("inf")}, {"text": "oil", "k": "5"},
+                  {"text": "oil", "k": 2.5}, {"text": "oil", "k": True}, ["text"]):
+        try:
+            ranker.validate(query)
+            assert False, query
+        except (KeyError, ValueError, TypeError):
+            pass
+
+
+def test_not_factorized():
+    # a bias breaks the factorization, the SBM is then predicted block by block
+    docvecs = np.random.rand(30, 8).astype(np.float32)
+    inputs = keras.Input(shape=(8,))
+    projected = keras.layers.Dense(len(VOCAB), name='SBM', bias_initializer='ones')(inputs)
+    sbm = keras.Model(inputs, keras.layers.UnitNormalization()(projected))
+    ranker = make_ranker(sbm, docvecs)
+    assert ranker.kernel is None
+    doc_nos, scores = ranker.rank_batch([{"text": "stock market", "k": 4}])[0]
+    exact = normalize(np.asarray(sbm(docvecs)))[:, [2, 3]].sum(axis=1) / np.sqrt(2)
+    assert doc_nos == ["D%d" % row for row in np.argsort(-exact)[:4]]
+
+
+def test_rank_training_model():
+    from tensorflow.keras.backend import l2_normalize
+
+    docvecs = np.random.rand(40, 8).astype(np.float32)
+    topics_vecs = normalize(np.random.rand(2, len(VOCAB)))
+    # the training model of arcs/arcs.ipynb, a sigmoid over the cosine
+    docvec_input = keras.Input((8,), name='doc_vec')
+    target_vec = keras.Input((len(VOCAB),), name='target_vec')
+    sbm = keras.layers.Dense(len(VOCAB), use_bias=False, name='SBM')(docvec_input)
+    predict_vec = keras.layers.Lambda(lambda x: l2_normalize(x, axis=-1), name='l2_norm')(sbm)
+    dot_product = keras.layers.Dot(axes=1, normalize=True, name='dot_product')([predict_vec, target_vec])
+    output = keras.layers.Dense(units=1, activation='sigmoid', name='output')(dot_product)
+    model = keras.Model(inputs=[docvec_input, target_vec], outputs=output)
+
+    ranker = make_ranker(model, docvecs, topics_vecs)
+    assert ranker.kernel is not None
+    pairs = [np.repeat(docvecs, 2, axis=0), np.tile(topics_vecs, (len(docvecs), 1))]
+    expected = np.asarray(model.predict_on_batch(pairs)).reshape(len(docvecs), 2)
+    for i, (doc_nos, scores) in enumerate(ranker.rank_batch([{"topic_no": 51, "k": 5}, {"topic_no": 52, "k": 5}])):
+        np.testing.assert_allclose(scores, np.sort(expected[:, i])[::-1][:5], rtol=1e-4, atol=1e-6)
+        assert set(doc_nos) <= {"D%d" % row for row in np.argsort(-expected[:, i])[:6]}
+
+    # topic vectors which are not l2 normalized, e.g. of an l1 norm
+    l1_vecs = normalize(topics_vecs, norm='l1')
+    pairs[1] = np.tile(l1_vecs, (len(docvecs), 1))
+    expected = np.asarray(model.predict_on_batch(pairs)).reshape(len(docvecs), 2)
+    for i, (_, scores) in enumerate(ranker.rank_vectors(csr_matrix(l1_vecs, dtype=np.float32), [5, 5])):
+        np.testing.assert_allclose(scores, np.sort(expected[:, i])[::-1][:5], rtol=1e-4, atol=1e-6)
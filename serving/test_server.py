@@ -0,0 +1,90 @@
+import http.client
+import json
+import threading
+import time
+
+import grpc
+import numpy as np
+
+from serving.batcher import MicroBatcher
+from serving.grpc_server import create_grpc_server, rank_stub
+from serving.loadgen import http_client, run_load
+from serving.server import RankingServer
+from serving.test_ranker import keyword_sbm, make_ranker
+
+
+def test_micro_batcher():
+    batch_sizes = []
+
+    def process(requests):
+        batch_sizes.append(len(requests))
+        time.sleep(0.01)
+        if "fail" in requests:
+            raise ValueError("bad batch")
+        return [request * 2 for request in requests]
+
+    batcher = MicroBatcher(process, max_batch=4, max_wait=0.05)
+    futures = [batcher.submit(i) for i in range(10)]
+    assert [future.result() for future in futures] == [2 * i for i in range(10)]
+    assert batch_sizes[0] == 4 and sum(batch_sizes) == 10
+
+    failed = batcher.submit("fail")
+    try:
+        failed.result()
+        assert False
+    except ValueError:
+        pass
+    batcher.close()
+    assert batcher.processed == 11
+
+
+def test_http_server():
+    ranker = make_ranker(keyword_sbm(8), np.random.rand(200, 8).astype(np.float32))
+    server = RankingServer(("127.0.0.1", 0), ranker, max_batch=16, max_wait=0.01)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    try:
+        expected = ranker.rank_batch([{"text": "oil price", "k": 5}])[0]
+        send = http_client(host, port)()
+        response = send({"text": "oil price", "k": 5})
+        assert response["doc_nos"] == expected[0]
+
+        summary = run_load(http_client(host, port), [{"text": "stock market"}, {"text": "bank rate", "k": 10}],
+                           concurrency=8, requests=80)
+        assert summary["errors"] == 0 and summary["p99_ms"] >= summary["p50_ms"] > 0
+        # concurrent requests were coalesced
+        assert server.batcher.batches < server.batcher.processed == 81
+
+        connection = http.client.HTTPConnection(host, port)
+        connection.request("POST", "/rank", body=json.dumps({"topic_no": 51}))
+        response = connection.getresponse()
+        assert response.status == 400 and "unknown topic" in json.loads(response.read())["error"]
+        # too large for an int, a bad request instead of a dropped connection
+        connection.request("POST", "/rank", body='{"text": "oil", "k": 1e400}')
+        response = connection.getresponse()
+        assert response.status == 400 and "integer" in json.loads(response.read())["error"]
+        connection.request("GET", "/stats")
+        stats = json.loads(connection.getresponse().read())
+        assert stats["requests"] == 83 and stats["errors"] == 2 and stats["mean_batch"] > 1
+    finally:
+        server.shutdown()
+        server.close()
+
+
+def test_grpc_server():
+    ranker = make_ranker(keyword_sbm(8), np.random.rand(100, 8).astype(np.float32))
+    server, batcher, port = create_grpc_server(ranker, "127.0.0.1:0")
+    try:
+        with grpc.insecure_channel("127.0.0.1:%d" % port) as channel:
+            rank = rank_stub(channel)
+            assert rank({"text": "oil", "k": 3})["doc_nos"] == ranker.rank_batch([{"text": "oil", "k": 3}])[0][0]
+            for query in ({"topic_no": 51}, {"text": "oil", "k": float("inf")}):
+                try:
+                    rank(query)
+                    assert False
+                except grpc.RpcError as e:
+                    assert e.code() == grpc.StatusCode.INVALID_ARGUMENT
+    finally:
+        server.stop(None)
+        batcher.close()
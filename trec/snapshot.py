@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SIGNATURE_KEY = "__signature__"
+
+
+def source_signature(filepaths, **extra):
+    """
+    Describe the source files a snapshot is built from, a snapshot is only valid for an identical signature.
+    :param filepaths: iterable of source files, e.g. `TextDirectoryCorpus.iter_filepaths()`
+    :param extra: anything else the snapshot depends on, e.g. tokenizer settings
+    :return: json serializable dict
+    """
+    files = []
+    for filepath in sorted(os.path.abspath(filepath) for filepath in filepaths):
+        stat = os.stat(filepath)
+        files.append([filepath, stat.st_mtime_ns, stat.st_size])
+    return {"version": SNAPSHOT_VERSION, "files": files, "extra": extra}
+
+
+def save_snapshot(filename, signature, **arrays):
+    """
+    Write arrays into an uncompressed npz snapshot together with their signature, atomically.
+    :param filename: snapshot file
+    :param signature: see :func:`source_signature`
+    :param arrays: arrays to store, no object arrays
+    :return: None
+    """
+    folder = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(folder, exist_ok=True)
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, 'wb') as fp:
+        np.savez(fp, **{SIGNATURE_KEY: np.array(json.dumps(signature, sort_keys=True))}, **arrays)
+    os.replace(tmp_file, filename)
+    logger.info("saved snapshot %s", filename)
+
+
+def load_snapshot(filename, signature):
+    """
+    Load the arrays of a snapshot if it exists and was built from the same sources.
+    :param filename: snapshot file
+    :param signature: see :func:`source_signature`
+    :return: dict of arrays, None if missing, outdated or unreadable
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        with np.load(filename) as data:
+            if json.loads(str(data[SIGNATURE_KEY])) != json.loads(json.dumps(signature, sort_keys=True)):
+                logger.info("snapshot %s is outdated", filename)
+                return None
+            return {key: data[key] for key in data.files if key != SIGNATURE_KEY}
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("ignoring unreadable snapshot %s: %s", filename, e)
+        return None
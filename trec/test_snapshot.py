@@ -0,0 +1,78 @@
+import os
+
+from trec.snapshot import load_snapshot, save_snapshot, source_signature
+from trec.test_trecqrels import SAMPLE_QRELS
+from trec.test_trectopics import SAMPLE_TOPICS
+from trec.trecqrels import TrecQrels
+from trec.trectopics import TrecTopics
+
+
+def test_signature(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("a")
+    snapshot = str(tmp_path / "cache" / "snapshot.npz")
+    signature = source_signature([str(source)], option=1)
+    save_snapshot(snapshot, signature, values=[1, 2, 3])
+
+    assert load_snapshot(snapshot, signature)["values"].tolist() == [1, 2, 3]
+    assert load_snapshot(snapshot, source_signature([str(source)], option=2)) is None
+    source.write_text("ab")
+    assert load_snapshot(snapshot, source_signature([str(source)], option=1)) is None
+    assert load_snapshot(str(tmp_path / "missing.npz"), signature) is None
+
+
+def test_qrels_snapshot(tmp_path):
+    (tmp_path / "qrels").mkdir()
+    (tmp_path / "qrels" / "qrels.51-52").write_text(SAMPLE_QRELS)
+    snapshot = str(tmp_path / "qrels.npz")
+
+    parsed = TrecQrels(str(tmp_path / "qrels"), snapshot=snapshot)
+    assert os.path.exists(snapshot)
+    loaded = TrecQrels(str(tmp_path / "qrels"), snapshot=snapshot)
+    loaded.get_texts = None  # must not parse again
+    loaded.qrels = {}
+    loaded.init()
+    assert loaded.arrays is not None
+
+    doc_list = ["D4", "D3", "D2", "D1"]
+    parsed_index, loaded_index = parsed.build_index(doc_list), loaded.build_index(doc_list)
+    for topic_no in (51, 52):
+        for is_rel in (True, False):
+            assert loaded_index.get_doc_nos(loaded_index.get_ids(topic_no, is_rel)) == \
+                parsed_index.get_doc_nos(parsed_index.get_ids(topic_no, is_rel))
+            assert loaded_index.get_ids(topic_no, is_rel).tolist() == sorted(loaded_index.get_ids(topic_no, is_rel))
+    assert loaded.arrays is not None
+    assert loaded.qrels == parsed.qrels
+
+
+def test_topics_snapshot(tmp_path):
+    (tmp_path / "topics").mkdir()
+    (tmp_path / "topics" / "topics.51-52").write_text(SAMPLE_TOPICS)
+    snapshot = str(tmp_path / "topics.npz")
+
+    parsed = TrecTopics(str(tmp_path / "topics"), lemmatization=False, snapshot=snapshot)
+    parsed.init()
+    loaded = TrecTopics(str(tmp_path / "topics"), lemmatization=False, snapshot=snapshot)
+    loaded.init()
+    assert loaded.tokenizer is None
+    assert loaded.topics == parsed.topics
+
+    other = TrecTopics(str(tmp_path / "topics"), lemmatization=False, use_stop=False, snapshot=snapshot)
+    other.init()
+    assert other.tokenizer is not None
+    assert "will" in other.get_desc(51)
+
+
+def test_topics_snapshot_model_version(tmp_path, monkeypatch):
+    import trec.trectopics
+
+    (tmp_path / "topics").mkdir()
+    (tmp_path / "topics" / "topics.51-52").write_text(SAMPLE_TOPICS)
+    snapshot = str(tmp_path / "topics.npz")
+    TrecTopics(str(tmp_path / "topics"), lemmatization=False, snapshot=snapshot).init()
+
+    # an upgraded spacy model tokenizes the topics again
+    monkeypatch.setattr(trec.trectopics, "spacy_model_version", lambda model: "99.0.0")
+    upgraded = TrecTopics(str(tmp_path / "topics"), lemmatization=False, snapshot=snapshot)
+    upgraded.init()
+    assert upgraded.tokenizer is not None
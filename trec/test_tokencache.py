@@ -0,0 +1,32 @@
+from trec.tokencache import TokenCache
+
+SETTINGS = {"minimum_len": 2, "maximum_len": 15, "output_lemma": True, "use_stopwords": True}
+
+
+def test_get_put(tmp_path):
+    with TokenCache(str(tmp_path), SETTINGS) as cache:
+        digest = cache.digest("The quick brown fox")
+        assert cache.get("WSJ870807-0086", digest) is None
+
+        cache.put("WSJ870807-0086", digest, ["quick", "brown", "fox"])
+        cache.put("WSJ870807-0087", cache.digest(""), [])
+        assert cache.get("WSJ870807-0086", digest) == ["quick", "brown", "fox"]
+        assert cache.get("WSJ870807-0087", cache.digest("")) == []
+
+        # changed text of the same document is a miss, and replaces the old entry once re-tokenized
+        changed = cache.digest("The quick brown dog")
+        assert cache.get("WSJ870807-0086", changed) is None
+        cache.put("WSJ870807-0086", changed, ["quick", "brown", "dog"])
+        assert len(cache) == 2
+
+    with TokenCache(str(tmp_path), SETTINGS) as cache:
+        assert cache.get("WSJ870807-0086", changed) == ["quick", "brown", "dog"]
+
+
+def test_settings_isolation(tmp_path):
+    digest = TokenCache.digest("The quick brown fox")
+    with TokenCache(str(tmp_path), SETTINGS) as cache:
+        cache.put("WSJ870807-0086", digest, ["quick", "brown", "fox"])
+
+    with TokenCache(str(tmp_path), dict(SETTINGS, output_lemma=False)) as cache:
+        assert cache.get("WSJ870807-0086", digest) is None
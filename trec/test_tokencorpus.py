@@ -0,0 +1,32 @@
+from trec.tokencorpus import TokenCorpus, TokenCorpusWriter, convert_content
+from utils import read_content
+
+DOCS = [(["market", "stock", "price", "stock"], "WSJ870807-0086", "Stocks rally"),
+        ([], "FR881-0001", None),
+        (["agency", "rule", "market"], "AP880212-0001", "Rule | notice")]
+
+
+def test_write_read(tmp_path):
+    path = str(tmp_path / "tokens")
+    with TokenCorpusWriter(path) as writer:
+        for tokens, doc_no, title in DOCS:
+            writer.add(tokens, doc_no, title)
+
+    corpus = TokenCorpus(path)
+    assert len(corpus) == 3
+    assert len(corpus.vocab) == 5
+    assert [(doc.words, doc.tags) for doc in corpus] == [(tokens, [doc_no]) for tokens, doc_no, _ in DOCS]
+    assert corpus["AP880212-0001"].words == ["agency", "rule", "market"]
+    assert "FR881-0001" in corpus and "FR881-0002" not in corpus
+    assert corpus.titles == ["Stocks rally", None, "Rule   notice"]
+
+
+def test_convert_content(tmp_path):
+    filename = str(tmp_path / "lemmatized.dat")
+    with open(filename, 'w') as f:
+        f.write("WSJ870807-0086|Stocks rally|market stock price stock\n")
+        f.write("AP880212-0001||agency rule market\n")
+    convert_content(filename, str(tmp_path / "tokens"))
+
+    corpus = TokenCorpus(str(tmp_path / "tokens"))
+    assert list(corpus.read_content()) == list(read_content(filename))
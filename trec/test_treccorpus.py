@@ -1,7 +1,25 @@
+import pytest
 from gensim.corpora import TextCorpus, TextDirectoryCorpus
 from gensim.models.doc2vec import TaggedDocument
 
-from trec.treccorpus import TrecCorpus
+from trec import treccorpus
+from trec.treccorpus import TrecCorpus, scan_docs, decode_doc, parse_content
+
+SAMPLE_DOCS = """<DOC>
+<DOCNO> FR881-0001 </DOCNO>
+<HEAD> First title </HEAD>
+<TEXT>
+first body
+</TEXT>
+</DOC>
+<DOC>
+<DOCNO>FR881-0002</DOCNO>
+<TEXT>
+second body
+spans lines
+</TEXT>
+</DOC>
+"""
 
 def test_get_texts():
 
@@ -33,6 +51,99 @@ def test_parse_file():
 
 
 
+def test_scan_docs(tmp_path):
+    file = tmp_path / "fr881.dat"
+    file.write_text(SAMPLE_DOCS * 3)
+
+    # a tiny chunk size forces tags to be split across chunk borders
+    for chunk_size in (7, 64, 1 << 20):
+        docs = [(doc_no, decode_doc(raw)) for doc_no, raw in scan_docs(str(file), chunk_size=chunk_size)]
+        assert [doc_no for doc_no, _ in docs] == ["FR881-0001", "FR881-0002"] * 3
+        assert "<HEAD> First title </HEAD>" in docs[0][1]
+        assert "second body spans lines" in docs[1][1]
+        assert "\n" not in docs[1][1]
+
+
+def test_parse_content():
+    content = ("<PARENT> FR881-0001 </PARENT> <HL> Minor <F P=1>head</F> </HL> <HEAD> Main title </HEAD> "
+               "<SUMMARY> short summary </SUMMARY> <CENTER> centered junk </CENTER> "
+               "<TEXT> body <!-- PJG 0012 --> text <FLD001> field junk </FLD001> end </TEXT>")
+    text, title = parse_content(content)
+    assert title == "Main title"
+    assert text.split() == ["short", "summary", "body", "text", "end"]
+
+    text, _ = parse_content(content, strip_noise=False)
+    assert text.split() == ["short", "summary", "body", "text", "field", "junk", "end"]
+
+    # a noise tag without end tag must not swallow the rest of the body
+    text, title = parse_content("<TEXT> kept <CENTER> also kept </TEXT>")
+    assert title is None
+    assert text.split() == ["kept", "also", "kept"]
+
+
+def write_sample_files(folder, count=3):
+    for i in range(count):
+        text = SAMPLE_DOCS.replace("FR881-000", "FR88%d-000" % i).replace("body", "body%s" % ("x" * i))
+        (folder / ("fr88%d.dat" % i)).write_text(text * (i + 1))
+
+
+def test_get_texts_parallel(tmp_path, monkeypatch):
+    write_sample_files(tmp_path)
+    serial = list(TrecCorpus(str(tmp_path), dictionary={}).get_texts())
+    assert len(serial) == 12
+
+    # one document per message, so files are streamed back in several chunks
+    monkeypatch.setattr(treccorpus, "INGEST_CHUNK", 1)
+    corpus = TrecCorpus(str(tmp_path), dictionary={}, processes=2)
+    assert list(corpus.get_texts()) == serial
+    assert corpus.length == len(serial)
+
+    # a window of one file per process, later files are only submitted as the earlier ones are yielded
+    monkeypatch.setattr(treccorpus, "INGEST_AHEAD", 1)
+    write_sample_files(tmp_path, count=5)
+    serial = list(TrecCorpus(str(tmp_path), dictionary={}).get_texts())
+    assert list(TrecCorpus(str(tmp_path), dictionary={}, processes=2).get_texts()) == serial
+
+    unordered = TrecCorpus(str(tmp_path), dictionary={}, processes=2, ordered=False).get_texts()
+    assert sorted(unordered) == sorted(serial)
+
+    with pytest.raises(ValueError):
+        TrecCorpus(str(tmp_path), dictionary={}, processes=2, use_scanner=False)
+
+
+def test_get_texts_parallel_token_cache(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_sample_files(data)
+    cache = str(tmp_path / "cache")
+    serial = list(TrecCorpus(str(data), dictionary={}).get_texts())
+
+    # the parallel run fills the cache, the next runs are served from it
+    assert list(TrecCorpus(str(data), dictionary={}, processes=2, token_cache=cache).get_texts()) == serial
+    assert list(TrecCorpus(str(data), dictionary={}, processes=2, token_cache=cache).get_texts()) == serial
+    assert list(TrecCorpus(str(data), dictionary={}, token_cache=cache).get_texts()) == serial
+
+
+def test_get_cached_texts(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_sample_files(data)
+    cache = str(tmp_path / "cache")
+    serial = list(TrecCorpus(str(data), dictionary={}).get_texts())
+    assert list(TrecCorpus(str(data), dictionary={}, token_cache=cache).get_texts()) == serial
+
+    # fully cached, spaCy is never started
+    corpus = TrecCorpus(str(data), dictionary={}, token_cache=cache)
+    monkeypatch.setattr(corpus.tokenizer, "tokenize_pipe", None)
+    assert list(corpus.get_texts()) == serial
+
+    # misses between hits keep document order, also when runs of hits end the spaCy pipe
+    (data / "fr881.dat").write_text(SAMPLE_DOCS.replace("first body", "changed body") * 2)
+    serial = list(TrecCorpus(str(data), dictionary={}).get_texts())
+    monkeypatch.setattr(treccorpus, "CACHE_REORDER_LIMIT", 1)
+    assert list(TrecCorpus(str(data), dictionary={}, token_cache=cache).get_texts()) == serial
+
+
 def test_read_doc():
     a = "ddsad"
     b = [1,2,3,4,5]
@@ -1,5 +1,16 @@
+import numpy as np
+
 from trec.trecqrels import TrecQrels
 
+SAMPLE_QRELS = """51 0 D3 1
+51 0 D1 1
+51 0 D2 0
+51 0 GONE 1
+52 0 D2 1
+52 0 D1 0
+52 0 D4 0
+"""
+
 
 def test_get_texts():
     assert False
@@ -22,3 +33,22 @@ def test_get_doc_list():
 
 def test_contains():
     assert False
+
+
+def test_qrels_index(tmp_path):
+    (tmp_path / "qrels.51-52").write_text(SAMPLE_QRELS)
+    qrels = TrecQrels(str(tmp_path))
+    assert sorted(qrels.get_doc_list(51)) == ["D1", "D3", "GONE"]
+    assert len(qrels.get_random_docs(5, 52)) == 5
+
+    index = qrels.build_index(["D0", "D1", "D2", "D3", "D4"])
+    assert index.get_ids(51).tolist() == [1, 3, 5]
+    assert index.get_doc_nos(index.get_ids(51)) == ["D1", "D3", "GONE"]
+    assert index.get_ids(52, is_rel=False).tolist() == [1, 4]
+    assert index.get_ids(99).tolist() == []
+    assert index.contains(51, "D3") and index.contains(51, "GONE") and index.contains(52, 4, is_rel=False)
+    assert index.contains(52, np.int64(4), is_rel=False) and not index.contains(52, np.int32(0), is_rel=False)
+    assert not index.contains(51, "D2") and not index.contains(51, "UNKNOWN") and not index.contains(99, "D1")
+    assert index.contains_ids(52, [0, 1, 4, 6], is_rel=False).tolist() == [False, True, True, False]
+    assert sorted(index.sample(2, 52).tolist()) == [1, 4]
+    assert np.isin(index.sample(5, 52), [1, 4]).all()
@@ -1,5 +1,30 @@
+import numpy as np
+
 from trec.trectopics import TrecTopics
 
+SAMPLE_TOPICS = """<top>
+<num> Number: 51
+<title> Topic: Airbus subsidies airbus
+
+<desc> Description:
+Document will discuss government assistance to Airbus.
+
+<narr> Narrative:
+A relevant document will cite subsidies.
+</top>
+
+<top>
+<num> Number: 52
+<title> Topic: South African sanctions
+
+<desc> Description:
+Document will discuss sanctions against South Africa.
+
+<narr> Narrative:
+A relevant document will discuss any sanctions.
+</top>
+"""
+
 
 def test_get_texts():
     assert False
@@ -31,6 +56,44 @@ def test_get_title():
     print(trectopics.get_desc(296))
 
 
+def test_vectorize_sparse(tmp_path):
+    (tmp_path / "topics.51-52").write_text(SAMPLE_TOPICS)
+    vocab = {word: i for i, word in enumerate(["airbus", "subsidies", "south", "african", "sanctions", "other"])}
+
+    trectopics = TrecTopics(str(tmp_path), lemmatization=False)
+    trectopics.init()
+    trectopics.vectorize(vocab_dict=vocab, include_title=True)
+    dense = trectopics.topics_vecs
+
+    trectopics.vectorize(vocab_dict=vocab, include_title=True, sparse=True)
+    assert trectopics.is_sparse() and trectopics.topics_vecs.nnz == 5
+    np.testing.assert_allclose(trectopics.topics_vecs.toarray(), dense, rtol=1e-6)
+    np.testing.assert_allclose(trectopics.get_topic_vector(51), dense[0], rtol=1e-6)
+    assert trectopics.get_topic_vector(52, dense=False).shape == (1, len(vocab))
+    np.testing.assert_allclose(trectopics.get_topic_vectors([52, 51, 52]), dense[[1, 0, 1]], rtol=1e-6)
+
+
+def test_parse_once(tmp_path):
+    (tmp_path / "topics.51-52").write_text(SAMPLE_TOPICS)
+    vocab = {word: i for i, word in enumerate(["airbus", "subsidies", "south", "sanctions", "government"])}
+
+    trectopics = TrecTopics(str(tmp_path), lemmatization=False)
+    calls = []
+    tokenize_batch = trectopics.get_tokenizer().tokenize_batch
+    trectopics.get_tokenizer().tokenize_batch = lambda texts: calls.append(1) or tokenize_batch(texts)
+
+    trectopics.vectorize(vocab_dict=vocab, include_title=True)
+    title_vecs = trectopics.topics_vecs
+    trectopics.vectorize(vocab_dict=vocab, include_title=True, include_desc=True, norm='l1')
+    trectopics.init()
+    trectopics.vectorize(vocab_dict=vocab, include_title=True)
+    assert len(calls) == 1
+    assert trectopics.get_title(52) == ["south", "african", "sanctions"]
+    assert trectopics.get_desc(51) == trectopics.get_tokenizer().tokenize(
+        "Document will discuss government assistance to Airbus. ")
+    np.testing.assert_allclose(trectopics.topics_vecs, title_vecs)
+
+
 def test_get_desc():
     assert False
 
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SEP = "\x1f"
+COMMIT_EVERY = 10000
+
+
+class TokenCache:
+    """Content addressed on-disk cache of tokenized documents.
+
+    One sqlite database is kept per tokenizer settings fingerprint, inside it every document is stored under its
+    doc_no together with a hash of the raw text it was tokenized from. A lookup only hits if both match,
+    so new or changed documents go through spaCy again while unchanged ones are served from disk.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> cache = TokenCache("/home/corpus/token_cache/", tokenizer.settings())
+        >>> digest = cache.digest(text)
+        >>> tokens = cache.get(doc_no, digest)
+        >>> if tokens is None:
+        ...     tokens = tokenizer.tokenize(text)
+        ...     cache.put(doc_no, digest, tokens)
+        >>> cache.close()
+
+    """
+
+    def __init__(self, cache_dir, settings, commit_every=COMMIT_EVERY):
+        """
+
+        Parameters
+        ----------
+        cache_dir : str
+            Folder holding the cache databases, created if missing.
+        settings : dict
+            Everything besides the raw text that changes the tokens, e.g. :meth:`utils.Tokenizer.settings`
+            plus the spaCy model name and version.
+        commit_every : int, optional
+            Number of writes buffered before they are committed to disk.
+
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.settings = settings
+        self.fingerprint = hashlib.blake2b(json.dumps(settings, sort_keys=True).encode("utf-8"),
+                                           digest_size=8).hexdigest()
+        self.path = os.path.join(cache_dir, "tokens-%s.sqlite" % self.fingerprint)
+        self.commit_every = commit_every
+        self.pending = 0
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tokens "
+                          "(doc_no TEXT PRIMARY KEY, digest BLOB NOT NULL, tokens TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS settings (settings TEXT NOT NULL)")
+        if self.conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 0:
+            self.conn.execute("INSERT INTO settings VALUES (?)", (json.dumps(settings, sort_keys=True),))
+        self.conn.commit()
+
+    @staticmethod
+    def digest(text):
+        """
+        Hash the raw text of a document.
+        :param text: raw text fed to the tokenizer
+        :return: 16 bytes digest
+        """
+        return hashlib.blake2b(text.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+
+    def get(self, doc_no, digest):
+        """
+        Look up the tokens of a document.
+        :param doc_no: document number
+        :param digest: digest of the raw text, see :meth:`digest`
+        :return: a list of tokens, None if the document is not cached or its text changed
+        """
+        row = self.conn.execute("SELECT digest, tokens FROM tokens WHERE doc_no = ?", (doc_no,)).fetchone()
+        if row is None or row[0] != digest:
+            return None
+        return row[1].split(TOKEN_SEP) if row[1] else []
+
+    def put(self, doc_no, digest, tokens):
+        """
+        Store the tokens of a document, replacing an outdated entry of the same doc_no.
+        :param doc_no: document number
+        :param digest: digest of the raw text, see :meth:`digest`
+        :param tokens: a list of tokens
+        :return: None
+        """
+        self.put_many([(doc_no, digest, tokens)])
+
+    def put_many(self, entries):
+        """
+        Store many documents at once.
+        :param entries: iterable of (doc_no, digest, tokens)
+        :return: None
+        """
+        rows = [(doc_no, digest, TOKEN_SEP.join(tokens)) for doc_no, digest, tokens in entries]
+        self.conn.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", rows)
+        self.pending += len(rows)
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
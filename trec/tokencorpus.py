@@ -0,0 +1,171 @@
+import logging
+import os
+from array import array
+
+import numpy as np
+from gensim.models.doc2vec import TaggedDocument
+
+from utils import read_content
+
+logger = logging.getLogger(__name__)
+
+VOCAB_FILE = "vocab.txt"
+TOKENS_FILE = "tokens.i32"
+OFFSETS_FILE = "offsets.i64"
+DOCS_FILE = "docs.txt"
+
+FLUSH_TOKENS = 1 << 20
+
+
+class TokenCorpusWriter:
+    """Write tokenized documents into the compact binary token corpus format read by :class:`TokenCorpus`.
+
+    A token corpus is a folder of four files:
+
+    * vocab.txt - one token per line, the line number is the token id
+    * tokens.i32 - token ids of all documents back to back, int32
+    * offsets.i64 - start of every document in tokens.i32 plus the total length, int64
+    * docs.txt - doc_no|title per document
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> with TokenCorpusWriter("/home/corpus/trec_tokens/") as writer:
+        ...     for tokens, (doc_no, title) in trec.get_texts():
+        ...         writer.add(tokens, doc_no, title)
+
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.vocab = {}
+        self.offsets = array('q', [0])
+        self.buffer = array('i')
+        self.tokens_fp = open(os.path.join(path, TOKENS_FILE), 'wb')
+        self.docs_fp = open(os.path.join(path, DOCS_FILE), 'w', encoding="utf-8")
+
+    def add(self, tokens, doc_no, title=None):
+        """
+        Append one document.
+        :param tokens: a list of tokens
+        :param doc_no: document number
+        :param title: title of the document, None if not exist
+        :return: None
+        """
+        vocab = self.vocab
+        self.buffer.extend([vocab.setdefault(token, len(vocab)) for token in tokens])
+        self.offsets.append(self.offsets[-1] + len(tokens))
+        self.docs_fp.write(doc_no + "|" + (title or '').replace("\n", " ").replace("|", " ") + "\n")
+        if len(self.buffer) >= FLUSH_TOKENS:
+            self.flush()
+
+    def flush(self):
+        self.buffer.tofile(self.tokens_fp)
+        self.buffer = array('i')
+
+    def close(self):
+        self.flush()
+        self.tokens_fp.close()
+        self.docs_fp.close()
+        np.asarray(self.offsets, dtype=np.int64).tofile(os.path.join(self.path, OFFSETS_FILE))
+        with open(os.path.join(self.path, VOCAB_FILE), 'w', encoding="utf-8") as fp:
+            for token in self.vocab:
+                fp.write(token + "\n")
+        logger.info("wrote %d documents, %d tokens, %d types into %s",
+                    len(self.offsets) - 1, self.offsets[-1], len(self.vocab), self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def convert_content(filename, path):
+    """
+    Convert a file written by :meth:`trec.treccorpus.TrecCorpus.save_to_file` (doc_no|title|text per row)
+    into a token corpus.
+    :param filename: filename of the file contains documents
+    :param path: folder of the token corpus to be created
+    :return: None
+    """
+    with TokenCorpusWriter(path) as writer:
+        for tokens, (doc_no, title) in read_content(filename):
+            writer.add(tokens, doc_no, title)
+
+
+class TokenCorpus:
+    """Memory mapped, read-only view of a token corpus written by :class:`TokenCorpusWriter`.
+
+    Iterating yields :class:`~gensim.models.doc2vec.TaggedDocument`, so the corpus can be fed to `Doc2Vec` directly
+    and re-read every epoch without parsing any text. Documents can also be fetched by doc_no.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> documents = TokenCorpus("/home/corpus/trec_tokens/")
+        >>> model.build_vocab(documents)
+        >>> model.train(documents, total_examples=len(documents), epochs=model.epochs)
+        >>> documents["WSJ870807-0086"].words
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        tokens_file = os.path.join(path, TOKENS_FILE)
+        # a plain ndarray view of the mapping, slicing np.memmap itself is noticeably slower per document
+        self.tokens = np.memmap(tokens_file, dtype=np.int32, mode='r').view(np.ndarray) \
+            if os.path.getsize(tokens_file) else np.empty(0, dtype=np.int32)
+        self.offsets = np.fromfile(os.path.join(path, OFFSETS_FILE), dtype=np.int64)
+        with open(os.path.join(path, VOCAB_FILE), 'r', encoding="utf-8") as fp:
+            self.vocab = np.array([line.rstrip("\n") for line in fp], dtype=object)
+
+        self.doc_list = []
+        self.titles = []
+        with open(os.path.join(path, DOCS_FILE), 'r', encoding="utf-8") as fp:
+            for line in fp:
+                doc_no, title = line.rstrip("\n").split("|", 1)
+                self.doc_list.append(doc_no)
+                self.titles.append(title if title else None)
+        self.doc_index = {doc_no: i for i, doc_no in enumerate(self.doc_list)}
+        assert len(self.doc_list) == len(self.offsets) - 1
+
+    def __len__(self):
+        return len(self.doc_list)
+
+    def get_ids(self, i):
+        """
+        Token ids of the i-th document.
+        :param i: row of the document
+        :return: int32 array, a view into the memory mapped file
+        """
+        return self.tokens[self.offsets[i]: self.offsets[i + 1]]
+
+    def get_tokens(self, i):
+        """
+        Tokens of the i-th document.
+        :param i: row of the document
+        :return: a list of tokens
+        """
+        return self.vocab[self.get_ids(i)].tolist()
+
+    def __getitem__(self, doc_no):
+        return TaggedDocument(self.get_tokens(self.doc_index[doc_no]), [doc_no])
+
+    def __contains__(self, doc_no):
+        return doc_no in self.doc_index
+
+    def __iter__(self):
+        for i, doc_no in enumerate(self.doc_list):
+            yield TaggedDocument(self.get_tokens(i), [doc_no])
+
+    def read_content(self):
+        """
+        Same stream as :func:`utils.read_content` on the original text file.
+        :return: a generator yield [tokens of text], (doc_no, title)
+        """
+        for i, doc_no in enumerate(self.doc_list):
+            yield self.get_tokens(i), (doc_no, self.titles[i] or '')
@@ -1,10 +1,15 @@
 import logging
 
+import queue
 import re
+from collections import deque
+from multiprocessing import Pool, Queue, cpu_count
 
 from gensim import utils
 from gensim.corpora.textcorpus import TextDirectoryCorpus
 
+from trec.tokencache import TokenCache
+from trec.tokencorpus import TokenCorpusWriter
 from utils import Tokenizer
 
 logger = logging.getLogger(__name__)
@@ -18,10 +23,27 @@ TITLE_END_TAGS = ["</HEAD>", "</TITLE>", "</TTL>", "</HL>", "</SUBJECT>", "</HEA
 BODY_TAGS = ["<SUMMARY>", "<LEADPARA>", "<LP>", "<TEXT>"]
 BODY_END_TAGS = ["</SUMMARY>", "</LEADPARA>", "</LP>", "</TEXT>"]
 
-# TODO: strip noise tags and their corresponding content.
 NOISE_TAG = ["<CENTER>", "<FLD001>", "<FDL002>"]
 NOISE_END_TAG = ["</CENTER>", "</FDL001>", "</FDL002>"]
 
+SCAN_CHUNK_SIZE = 16 * 1024 * 1024
+# documents an ingest worker sends back at a time
+INGEST_CHUNK = 256
+# seconds between checks of the ingest pool for failed workers
+INGEST_POLL = 1.0
+# files per ingest process submitted beyond the next file to yield, bounds the chunks held back while ordered
+INGEST_AHEAD = 2
+# consecutive token cache hits that end the spaCy pipe of the misses before them
+CACHE_REORDER_LIMIT = 1024
+
+DOC_TAG = b"<DOC>"
+DOC_END_TAG = b"</DOC>"
+DOCNO_TAG = b"<DOCNO>"
+DOCNO_END_TAG = b"</DOCNO>"
+
+# line breaks are folded into blanks, the same way the line reader joins stripped lines with " "
+_LINE_BREAKS = bytes.maketrans(b"\r\n", b"  ")
+
 
 def tokenize(content, token_min_len=TOKEN_MIN_LEN, token_max_len=TOKEN_MAX_LEN, lower=True):
     """Tokenize a piece of text from body text.
@@ -89,6 +111,219 @@ def extract(buffer, start_tag, end_tag, max_pos, noise_prefix):
     return None
 
 
+def scan_docs(path, chunk_size=SCAN_CHUNK_SIZE):
+    """Scan a TREC format data file for documents in a single pass over large binary chunks.
+
+    The file is read `chunk_size` bytes at a time, `<DOC>`, `<DOCNO>` and `</DOC>` boundaries are located once
+    with `bytes.find`, and only the unfinished tail of a chunk is carried over to the next one,
+    so the cost stays linear in the file size no matter how long a single document is.
+
+    Parameters
+    ----------
+    path : str
+        Path to the TREC data file.
+    chunk_size : int
+        Number of bytes read from the file at a time.
+
+    Yields
+    ------
+    (str, memoryview)
+        Document id and a zero-copy view of the raw bytes between `</DOCNO>` and `</DOC>`.
+        The view stays valid after the scanner moves on.
+
+    """
+    buffer = b""
+    pos = 0
+    search_from = 0
+    with open(path, 'rb') as f:
+        while True:
+            end = buffer.find(DOC_END_TAG, search_from)
+            if end < 0:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                buffer = buffer[pos:] + chunk
+                # only the last few bytes of the old buffer may hold the beginning of a split end tag
+                search_from = max(0, len(buffer) - len(chunk) - len(DOC_END_TAG) + 1)
+                pos = 0
+                continue
+
+            doc_start = buffer.find(DOC_TAG, pos, end)
+            if doc_start >= 0:
+                k1 = buffer.find(DOCNO_TAG, doc_start, end)
+                k2 = buffer.find(DOCNO_END_TAG, k1, end) if k1 >= 0 else -1
+                if k2 >= 0:
+                    doc_no = buffer[k1 + len(DOCNO_TAG): k2].strip().decode("utf-8", errors="ignore")
+                    yield doc_no, memoryview(buffer)[k2 + len(DOCNO_END_TAG): end]
+                else:
+                    logger.warning("skip document without <DOCNO> in %s at byte %d", path, doc_start)
+
+            pos = end + len(DOC_END_TAG)
+            search_from = pos
+
+
+def decode_doc(raw):
+    """Decode raw document bytes produced by :func:`scan_docs` into a single line of text.
+
+    :param raw: bytes-like document content
+    :return: utf-8 decoded content with line breaks replaced by blanks
+    """
+    return bytes(raw).translate(_LINE_BREAKS).decode("utf-8", errors="ignore")
+
+
+def _tag_names(tags):
+    return frozenset(tag.strip("</>") for tag in tags)
+
+
+BODY_NAMES = _tag_names(BODY_TAGS)
+TITLE_NAMES = _tag_names(TITLE_TAGS)
+TITLE_NAMES_ORDER = [tag.strip("<>") for tag in TITLE_TAGS]
+# both spellings of the field tags appear in the tag lists, match either of them
+NOISE_NAMES = _tag_names(NOISE_TAG + NOISE_END_TAG)
+TEXT_NAME = "TEXT"
+
+# any tag, stripped from the extracted text
+TAG_PATTERN = re.compile(r"<[^>]*>")
+# structural tags only, group 1 - "/" for end tags, group 2 - tag name
+STRUCTURE_PATTERN = re.compile(r"<(/?)(%s)(?:\s[^>]*)?>" % "|".join(
+    sorted(BODY_NAMES | TITLE_NAMES | NOISE_NAMES, key=len, reverse=True)))
+
+
+def parse_content(content, strip_noise=True):
+    """Extract fine text and title from raw content.
+
+    Body (:data:`BODY_TAGS`), title (:data:`TITLE_TAGS`) and noise (:data:`NOISE_TAG`) tags are all located by one
+    precompiled pattern in a single pass. Text inside body tags is kept, noise tags are skipped together with their
+    content, and the title is taken from the first title tag (in :data:`TITLE_TAGS` priority) found before `<TEXT>`.
+    Remaining inner tags are stripped from the kept text at the end with one substitution.
+
+    :param content: raw tag structured content
+    :param strip_noise: If True - drop noise tags together with their content.
+    :return: text - main body of the document, title - title of the document, None is not exist
+    """
+    text = []
+    titles = {}
+    title_name = None
+    title = None
+    body_depth = 0
+    noise_name = None
+    text_seen = False
+    last = 0
+    for m in STRUCTURE_PATTERN.finditer(content):
+        if noise_name is None and last < m.start():
+            if body_depth:
+                text.append(content[last:m.start()])
+            if title is not None:
+                title.append(content[last:m.start()])
+
+        is_end, name = m.group(1), m.group(2)
+        if noise_name is not None:
+            if is_end and name == noise_name:
+                noise_name = None
+        elif name in BODY_NAMES:
+            body_depth = max(0, body_depth - 1) if is_end else body_depth + 1
+            if name == TEXT_NAME:
+                text_seen = True
+        elif name in TITLE_NAMES:
+            if is_end:
+                if name == title_name:
+                    titles[name] = TAG_PATTERN.sub(" ", " ".join(title)).strip()
+                    title_name = None
+                    title = None
+            elif title_name is None and not text_seen and name not in titles:
+                title_name = name
+                title = []
+        elif strip_noise and not is_end:
+            # an unclosed noise tag is treated as a plain tag instead of swallowing the rest of the document
+            if content.find("</" + name + ">", m.end()) >= 0:
+                noise_name = name
+        last = m.end()
+
+    text = TAG_PATTERN.sub(" ", " ".join(text))
+    for name in TITLE_NAMES_ORDER:
+        if name in titles:
+            return text, titles[name]
+    return text, None
+
+
+def parse_doc(content, merge_title=True, strip_noise=True):
+    """Turn raw document content into the text fed to the tokenizer.
+
+    :param content: raw tag structured content
+    :param merge_title: If True - prepend the title to the body text, if title exist.
+    :param strip_noise: If True - drop noise tags together with their content.
+    :return: text - text to be tokenized, title - title of the document, None is not exist
+    """
+    text, title = parse_content(content, strip_noise)
+    if merge_title and title is not None:
+        text = title + " " + text.strip()
+    return text, title
+
+
+# state of an ingest worker process, created once by _init_ingest_worker
+_ingest_worker = {}
+
+
+def _init_ingest_worker(tokenizer_settings, merge_title, strip_noise, scan_chunk_size, token_cache_args, results):
+    _ingest_worker["tokenizer"] = Tokenizer(**tokenizer_settings)
+    _ingest_worker["merge_title"] = merge_title
+    _ingest_worker["strip_noise"] = strip_noise
+    _ingest_worker["scan_chunk_size"] = scan_chunk_size
+    # workers only read the cache, new entries are written by the parent process
+    _ingest_worker["token_cache"] = TokenCache(*token_cache_args) if token_cache_args is not None else None
+    _ingest_worker["results"] = results
+
+
+def _tokenize_chunk(docs, misses):
+    """Tokenize the cache misses of a chunk of documents in place.
+
+    :param docs: a list of (tokens or None, (doc_no, title))
+    :param misses: a list of (text, (position in docs, digest))
+    :return: new_entries - a list of (doc_no, digest, tokens) missing from the token cache
+    """
+    new_entries = []
+    for tokens, (i, digest) in _ingest_worker["tokenizer"].tokenize_pipe(misses, n_process=1):
+        docs[i] = tokens, docs[i][1]
+        if digest is not None:
+            new_entries.append((docs[i][1][0], digest, tokens))
+    return new_entries
+
+
+def _ingest_file(task):
+    """Parse, strip and tokenize every document of one data file inside an ingest worker.
+
+    Documents are sent back through the results queue in chunks of :data:`INGEST_CHUNK` as soon as they are
+    tokenized, as (file_no, docs, new_entries, last) messages, so a large file is not held in memory at once.
+    docs - a list of (tokens, (doc_no, title)) in file order,
+    new_entries - a list of (doc_no, digest, tokens) missing from the token cache,
+    last - True on the final message of the file.
+
+    :param task: (file_no, path) of the TREC data file
+    :return: file_no
+    """
+    file_no, path = task
+    token_cache = _ingest_worker["token_cache"]
+    results = _ingest_worker["results"]
+    docs = []
+    misses = []
+    for doc_no, raw in scan_docs(path, chunk_size=_ingest_worker["scan_chunk_size"]):
+        text, title = parse_doc(decode_doc(raw), _ingest_worker["merge_title"], _ingest_worker["strip_noise"])
+        tokens = None
+        digest = None
+        if token_cache is not None:
+            digest = token_cache.digest(text)
+            tokens = token_cache.get(doc_no, digest)
+        if tokens is None:
+            misses.append((text, (len(docs), digest)))
+        docs.append((tokens, (doc_no, title)))
+        if len(docs) >= INGEST_CHUNK:
+            results.put((file_no, docs, _tokenize_chunk(docs, misses), False))
+            docs = []
+            misses = []
+    results.put((file_no, docs, _tokenize_chunk(docs, misses), True))
+    return file_no
+
+
 class TrecCorpus(TextDirectoryCorpus):
     """Treat a TREC 1-5 disk articles as a read-only, streamed, memory-efficient corpus.
 
@@ -120,8 +355,10 @@ class TrecCorpus(TextDirectoryCorpus):
 
     """
 
-    def __init__(self, input, dictionary=None, merge_title=True, spacy_tokenizer=True,
-                 lines_are_documents=True, min_depth=0, max_depth=None, **kwargs):
+    def __init__(self, input, dictionary=None, merge_title=True, strip_noise=True, spacy_tokenizer=True,
+                 lines_are_documents=True, min_depth=0, max_depth=None,
+                 use_scanner=True, scan_chunk_size=SCAN_CHUNK_SIZE, processes=1, ordered=True, token_cache=None,
+                 **kwargs):
         """
 
         Parameters
@@ -136,6 +373,8 @@ class TrecCorpus(TextDirectoryCorpus):
             If True - yield metadata with each document.
         merge_title : bool, optional
             If True - merge document's title into body text, if title exist.
+        strip_noise : bool, optional
+            If True - drop noise tags (:data:`NOISE_TAG`) together with their content.
         min_depth : int, optional
             Minimum depth in directory tree at which to begin searching for files.
         max_depth : int, optional
@@ -147,6 +386,19 @@ class TrecCorpus(TextDirectoryCorpus):
             Regex to use for file name exclusion, all files matching this pattern will be ignored.
         lines_are_documents : bool, optional
             If True - each line is considered a document, otherwise - each file is one document.
+        use_scanner : bool, optional
+            If True - split files into documents with the byte level :func:`scan_docs`,
+            otherwise - fall back to the line by line reader :meth:`read_doc`.
+        scan_chunk_size : int, optional
+            Number of bytes the scanner reads at a time.
+        processes : int, optional
+            Number of ingest worker processes, each owns a subset of the data files. -1 use all cores.
+            If 1 - parse in this process and only parallelize spaCy. Parallel ingest requires `use_scanner`.
+        ordered : bool, optional
+            If True - parallel ingest yields documents in file order, otherwise - in order of completion.
+        token_cache : str, optional
+            Folder of the on-disk :class:`~trec.tokencache.TokenCache`. If given, only documents that are new or
+            changed since the last run with the same tokenizer settings go through spaCy.
         kwargs: keyword arguments passed through to the `TextCorpus` constructor.
             See :meth:`gemsim.corpora.textcorpus.TextCorpus.__init__` docstring for more details on these.
 
@@ -157,13 +409,34 @@ class TrecCorpus(TextDirectoryCorpus):
                                          lines_are_documents=lines_are_documents,
                                          min_depth=min_depth, max_depth=max_depth, **kwargs)
         self.merge_title = merge_title
+        self.strip_noise = strip_noise
         self.line_feeder = None
         self.spacy_tokenizer = spacy_tokenizer
+        self.use_scanner = use_scanner
+        self.scan_chunk_size = scan_chunk_size
+        if processes != 1 and not use_scanner:
+            raise ValueError("parallel ingest splits files with the byte level scanner, it requires use_scanner=True")
+        self.processes = processes
+        self.ordered = ordered
 
         # if self.spacy_tokenizer:
         self.tokenizer = Tokenizer(minimum_len=TOKEN_MIN_LEN, maximum_len=TOKEN_MAX_LEN, lowercase=True,
                                    output_lemma=True, use_stopwords=True)
 
+        self.token_cache_dir = token_cache
+        self.token_cache = None
+        if token_cache is not None:
+            self.token_cache = TokenCache(token_cache, self.token_cache_settings())
+
+    def token_cache_settings(self):
+        """Settings that change the tokens of a document besides its raw text.
+
+        :return: dict of tokenizer arguments plus the spaCy model name and version
+        """
+        meta = self.tokenizer.nlp.meta
+        return dict(self.tokenizer.settings(),
+                    spacy_model="%s_%s-%s" % (meta.get("lang"), meta.get("name"), meta.get("version")))
+
     def _get_texts(self):
         """Inner function to generate documents from corpus.
 
@@ -173,12 +446,8 @@ class TrecCorpus(TextDirectoryCorpus):
             Document as sequence of tokens ,(doc_no, title)
 
         """
-        self.line_feeder = self.getstream()
         for doc_no, content in self.parse_file():
-            text, title = self.parse_content(content)
-
-            if self.merge_title and title is not None:
-                text = title + " " + text.strip()
+            text, title = parse_doc(content, self.merge_title, self.strip_noise)
 
             # yield self.tokenizer.tokenize(text), (doc_no, title)
             yield text, (doc_no, title)
@@ -192,12 +461,173 @@ class TrecCorpus(TextDirectoryCorpus):
             Document as sequence of tokens ,(doc_no, title)
 
         """
+        if self.processes != 1:
+            return self.get_texts_parallel()
+        if self.token_cache is not None:
+            return self.get_cached_texts()
         return self.tokenizer.tokenize_pipe(self._get_texts())
         # return self._get_texts()
 
+    def _lookup_texts(self):
+        """Inner function to look documents up in the token cache before they reach spaCy.
+
+        Yields
+        ------
+        str
+            Text to be tokenized ,(doc_no, title, digest, cached tokens or None)
+
+        """
+        for text, (doc_no, title) in self._get_texts():
+            digest = self.token_cache.digest(text)
+            yield text, (doc_no, title, digest, self.token_cache.get(doc_no, digest))
+
+    def get_cached_texts(self):
+        """Generate documents from corpus, consulting the token cache first.
+
+        Only cache misses are sent to spaCy. Hits are served directly, and held in a reorder buffer while misses
+        before them are still being tokenized. A run of :data:`CACHE_REORDER_LIMIT` hits ends the spaCy pipe,
+        so the buffer stays small and a fully cached corpus never starts the spaCy processes.
+
+        Yields
+        ------
+        list of str
+            Document as sequence of tokens ,(doc_no, title)
+
+        """
+        docs = self._lookup_texts()
+        # [tokens or None while tokenized, doc_no, title] in document order, the first one at position `first`
+        pending = deque()
+        first = 0
+
+        def misses(text, doc_no, title, digest):
+            hits = 0
+            while True:
+                pending.append([None, doc_no, title])
+                yield text, (first + len(pending) - 1, doc_no, digest)
+                for text, (doc_no, title, digest, tokens) in docs:
+                    if tokens is None:
+                        break
+                    pending.append([tokens, doc_no, title])
+                    hits += 1
+                    if hits >= CACHE_REORDER_LIMIT:
+                        return
+                else:
+                    return
+                hits = 0
+
+        for text, (doc_no, title, digest, tokens) in docs:
+            if tokens is not None:
+                yield tokens, (doc_no, title)
+                continue
+            pipe = self.tokenizer.tokenize_pipe(misses(text, doc_no, title, digest))
+            for tokens, (position, doc_no, digest) in pipe:
+                self.token_cache.put(doc_no, digest, tokens)
+                pending[position - first][0] = tokens
+                while pending and pending[0][0] is not None:
+                    tokens, doc_no, title = pending.popleft()
+                    first += 1
+                    yield tokens, (doc_no, title)
+            # hits read after the last miss of the pipe
+            while pending:
+                tokens, doc_no, title = pending.popleft()
+                first += 1
+                yield tokens, (doc_no, title)
+        self.token_cache.commit()
+
+    def get_texts_parallel(self):
+        """Generate documents from corpus with a pool of ingest workers.
+
+        Every worker owns whole data files and runs scanning, tag stripping and tokenization end-to-end,
+        so throughput scales with the number of processes instead of being bound to one parser feeding spaCy.
+        Results are streamed back in chunks of :data:`INGEST_CHUNK` documents, in file order if `ordered`
+        (chunks of later files are held back until the earlier files are complete),
+        otherwise as soon as they are ready. Files are submitted to the pool at most
+        :data:`INGEST_AHEAD` x processes ahead of the next file to yield, so the chunks held back behind a large
+        file take at most that many files of memory.
+
+        Yields
+        ------
+        list of str
+            Document as sequence of tokens ,(doc_no, title)
+
+        """
+        paths = list(self.iter_filepaths())
+        processes = cpu_count() if self.processes < 1 else self.processes
+        processes = max(1, min(processes, len(paths)))
+        token_cache_args = None
+        if self.token_cache is not None:
+            token_cache_args = (self.token_cache_dir, self.token_cache.settings)
+
+        num_texts = 0
+        results = Queue()
+        with Pool(processes, initializer=_init_ingest_worker,
+                  initargs=(self.tokenizer.settings(), self.merge_title, self.strip_noise,
+                            self.scan_chunk_size, token_cache_args, results)) as pool:
+            # file_no -> AsyncResult of the files submitted and not finished
+            pending = {}
+            # chunks of files after next_file, held back while ordered
+            held = {}
+            finished = set()
+            next_file = 0
+            while next_file < len(paths):
+                for file_no in range(len(finished) + len(pending), min(next_file + processes * INGEST_AHEAD,
+                                                                           len(paths))):
+                    pending[file_no] = pool.apply_async(_ingest_file, ((file_no, paths[file_no]),))
+                try:
+                    file_no, docs, new_entries, last = results.get(timeout=INGEST_POLL)
+                except queue.Empty:
+                    for ingest in pending.values():
+                        if ingest.ready():
+                            # a failed worker sends no final message, raise its exception
+                            ingest.get()
+                    continue
+                if self.token_cache is not None:
+                    self.token_cache.put_many(new_entries)
+                if last:
+                    finished.add(file_no)
+                    pending.pop(file_no).get()
+                if not self.ordered:
+                    yield from docs
+                    num_texts += len(docs)
+                    next_file = len(finished)
+                    continue
+                held.setdefault(file_no, []).append(docs)
+                while next_file in held:
+                    for docs in held.pop(next_file):
+                        yield from docs
+                        num_texts += len(docs)
+                    if next_file not in finished:
+                        break
+                    next_file += 1
+        if self.token_cache is not None:
+            self.token_cache.commit()
+        self.length = num_texts
+
     def parse_file(self):
         """parse TREC format data file into doc_no + content
 
+        :return: doc_no - Document id, content - raw document content except docno line.
+        """
+        if self.use_scanner:
+            return self.scan_files()
+        self.line_feeder = self.getstream()
+        return self.read_docs()
+
+    def scan_files(self):
+        """Split all data files into documents with the byte level scanner.
+
+        :return: doc_no - Document id, content - raw document content after the docno tag.
+        """
+        num_texts = 0
+        for path in self.iter_filepaths():
+            for doc_no, raw in scan_docs(path, chunk_size=self.scan_chunk_size):
+                yield doc_no, decode_doc(raw)
+                num_texts += 1
+        self.length = num_texts
+
+    def read_docs(self):
+        """Split the line stream of :meth:`getstream` into documents.
+
         :return: doc_no - Document id, content - raw document content except docno line.
         """
         while True:
@@ -240,30 +670,7 @@ class TrecCorpus(TextDirectoryCorpus):
         :param content: raw tag structured content
         :return: text - main body of the document, title - title of the document, None is not exist
         """
-        text = ""
-        title = None
-        text_tag_start_pos = content.find("<TEXT>")
-        # iterate all body tags and append them together
-        for i in range(0, len(BODY_TAGS)):
-            start_tag = BODY_TAGS[i]
-            end_tag = BODY_END_TAGS[i]
-
-            h1 = [m.end() for m in re.finditer(start_tag, content)]
-            h2 = [m.start() for m in re.finditer(end_tag, content)]
-
-            for j in range(0, len(h1)):
-                text += strip_tags(content, h1[j], h2[j])
-
-        # iterate all title tags, create the title once tag founded.
-        for i in range(0, len(TITLE_TAGS)):
-            start_tag = TITLE_TAGS[i]
-            end_tag = TITLE_END_TAGS[i]
-
-            h1 = content.find(start_tag, 0, text_tag_start_pos)
-            if h1 >= 0:
-                title = extract(content, start_tag, end_tag, -1, None)
-                break  # only one title will be created
-        return text, title
+        return parse_content(content, self.strip_noise)
 
     def getstream(self):
         """Generate documents from the underlying plain text collection (of one or more files).
@@ -298,3 +705,18 @@ class TrecCorpus(TextDirectoryCorpus):
                     title = ''
                 f.write(doc_no + "|" + title + "|" + ' '.join(text) + "\n")
         print(count)
+
+    def save_to_token_corpus(self, path):
+        """Tokenize the corpus into the binary token corpus format, see :class:`~trec.tokencorpus.TokenCorpus`.
+
+        :param path: folder of the token corpus to be created
+        :return: number of documents written
+        """
+        count = 0
+        with TokenCorpusWriter(path) as writer:
+            for text, (doc_no, title) in self.get_texts():
+                writer.add(text, doc_no, title)
+                count += 1
+                if count % 10000 == 0:
+                    logger.info("saved %d documents", count)
+        return count
@@ -1,6 +1,10 @@
 from gensim.corpora import TextDirectoryCorpus
 import random
 
+import numpy as np
+
+from trec.snapshot import load_snapshot, save_snapshot, source_signature
+
 class TrecQrels(TextDirectoryCorpus):
     """A class read and process TREC 1-8 Qrels.
 
@@ -21,7 +25,7 @@ class TrecQrels(TextDirectoryCorpus):
 
     """
     def __init__(self, qrels_input, min_depth=0, max_depth=None,
-                 pattern=None, exclude_pattern=None,
+                 pattern=None, exclude_pattern=None, snapshot=None,
                  **kwargs):
         """
 
@@ -38,6 +42,8 @@ class TrecQrels(TextDirectoryCorpus):
             Regex to use for file name inclusion, all those files *not* matching this pattern will be ignored.
         exclude_pattern : str, optional
             Regex to use for file name exclusion, all files matching this pattern will be ignored.
+        snapshot : str, optional
+            npz file caching the parsed qrels, rebuilt whenever a qrels file changes.
         lines_are_documents : bool, optional
             If True - each line is considered a document, otherwise - each file is one document.
         kwargs: keyword arguments passed through to the `TextCorpus` constructor.
@@ -50,10 +56,27 @@ class TrecQrels(TextDirectoryCorpus):
                                         pattern=pattern, exclude_pattern=exclude_pattern,
                                         lines_are_documents=True, **kwargs)
 
-        self.qrels = {}
+        self._qrels = {}
+        # arrays of an up to date snapshot, turned into sets on first access of qrels
+        self.arrays = None
+        self.index = None
+        self.snapshot = snapshot
 
         self.init()
 
+    @property
+    def qrels(self):
+        """{is_rel: {topic_no: set of doc_no}}"""
+        if self.arrays is not None:
+            arrays, self.arrays = self.arrays, None
+            self.from_arrays(**arrays)
+        return self._qrels
+
+    @qrels.setter
+    def qrels(self, qrels):
+        self._qrels = qrels
+        self.arrays = None
+
     def get_texts(self):
         """Generate documents from corpus.
 
@@ -77,12 +100,67 @@ class TrecQrels(TextDirectoryCorpus):
 
     def init(self):
         """
-        Initialize the class by read all qrels files in the qrels_path
+        Initialize the class by read all qrels files in the qrels_path, or the snapshot if it is up to date.
+        Calling it again does nothing.
 
         :return: None
         """
+        if self._qrels or self.arrays is not None:
+            return
+        signature = source_signature(self.iter_filepaths()) if self.snapshot else None
+        if self.snapshot:
+            self.arrays = load_snapshot(self.snapshot, signature)
+            if self.arrays is not None:
+                return
+
         for doc_no, topic_no, is_rel in self.get_texts():
-            self.qrels.setdefault(True if is_rel is "1" else False, {}).setdefault(topic_no, set()).add(doc_no)
+            self.qrels.setdefault(is_rel == "1", {}).setdefault(topic_no, set()).add(doc_no)
+
+        if self.snapshot:
+            save_snapshot(self.snapshot, signature, **self.to_arrays())
+
+    def to_arrays(self):
+        """
+        Flatten the qrels into arrays sorted by judgement and topic.
+
+        :return: dict of doc_nos (unique doc_no strings), is_rel, topic_nos and docs (positions in doc_nos)
+        """
+        doc_nos = sorted({doc_no for topics in self.qrels.values() for docs in topics.values() for doc_no in docs})
+        doc_pos = {doc_no: i for i, doc_no in enumerate(doc_nos)}
+        is_rel, topic_nos, docs = [], [], []
+        for rel in sorted(self.qrels):
+            for topic_no in sorted(self.qrels[rel]):
+                judged = sorted(doc_pos[doc_no] for doc_no in self.qrels[rel][topic_no])
+                docs.extend(judged)
+                is_rel.extend([rel] * len(judged))
+                topic_nos.extend([topic_no] * len(judged))
+        return {"doc_nos": np.array(doc_nos, dtype=str), "is_rel": np.array(is_rel, dtype=bool),
+                "topic_nos": np.array(topic_nos, dtype=np.int32), "docs": np.array(docs, dtype=np.int32)}
+
+    def from_arrays(self, doc_nos, is_rel, topic_nos, docs):
+        """
+        Rebuild the qrels sets from the arrays of :meth:`to_arrays`.
+
+        :return: None
+        """
+        doc_nos = np.asarray(doc_nos, dtype=object)
+        bounds = np.flatnonzero((np.diff(topic_nos) != 0) | (np.diff(is_rel) != 0)) + 1
+        starts = np.concatenate(([0], bounds)).tolist()
+        ends = np.concatenate((bounds, [len(docs)])).tolist() if len(docs) else []
+        for start, end in zip(starts, ends):
+            self._qrels.setdefault(bool(is_rel[start]), {})[int(topic_nos[start])] = set(doc_nos[docs[start:end]])
+
+    def build_index(self, doc_list=None, doc_index=None):
+        """
+        Build the integer coded :class:`QrelsIndex` of the qrels, kept as `self.index`.
+
+        :param doc_list: doc_no of every doc row (e.g. `docvecs.index2entity`) to share ids with, None to number
+        the judged documents only
+        :param doc_index: doc_no -> row of doc_list, built from doc_list if not given
+        :return: the QrelsIndex
+        """
+        self.index = QrelsIndex(self, doc_list=doc_list, doc_index=doc_index)
+        return self.index
 
     def get_doc_list(self, topic_no, is_rel=True):
         """
@@ -118,11 +196,11 @@ class TrecQrels(TextDirectoryCorpus):
         If False: sample irrelevant document list.
         :return: A list of document numbers
         """
-        total_docs = len(self.qrels[is_rel][topic_no])
-        if k > total_docs:
-            return random.choices(self.qrels[is_rel][topic_no], k)
+        docs = tuple(self.qrels[is_rel][topic_no])
+        if k > len(docs):
+            return random.choices(docs, k=k)
         else:
-            return random.sample(self.qrels[is_rel][topic_no], k)
+            return random.sample(docs, k)
 
     def get_doc(self, topic_no, is_rel=True):
         """
@@ -135,3 +213,187 @@ class TrecQrels(TextDirectoryCorpus):
         """
         for doc_no in self.qrels[is_rel][topic_no]:
             yield doc_no
+
+
+class QrelsIndex:
+    """Integer coded, read-only index of TREC qrels.
+
+    doc_no strings are interned to int ids shared with the rows of the document vectors (judged documents missing
+    from them get ids from `n_docs` on), and the judged documents of every topic are stored CSR style as sorted int32
+    id arrays, one for relevant and one for irrelevant judgements. :meth:`contains_ids` tests many ids at once by a
+    binary search in them, :meth:`contains` tests one document in O(1) against a hashed set of the ids of the topic,
+    built on the first test of the topic, so only the topics that are tested cost set memory.
+
+    Examples
+    --------
+    .. sourcecode:: pycon
+
+        >>> index = qrels.build_index(docvecs.index2entity)
+        >>> index.get_ids(51)
+        >>> index.contains(51, "WSJ870807-0086")
+        >>> index.contains_ids(51, rows, is_rel=False)
+
+    """
+
+    def __init__(self, qrels, doc_list=None, doc_index=None):
+        """
+
+        Parameters
+        ----------
+        qrels : :class:`TrecQrels`
+            Qrels to index.
+        doc_list : list of str, optional
+            doc_no of every doc row, ids 0..len(doc_list)-1 are these rows.
+        doc_index : dict, optional
+            doc_no -> row of doc_list, built from doc_list if not given.
+
+        """
+        if doc_list is None:
+            doc_list = []
+        if doc_index is None:
+            doc_index = {doc_no: i for i, doc_no in enumerate(doc_list)}
+        self.doc_list = doc_list
+        self.n_docs = len(doc_list)
+        self.doc_index = doc_index
+        # judged documents without a doc row
+        self.extra_docs = []
+        self.extra_index = {}
+
+        self.indptr = {}
+        self.ids = {}
+        if getattr(qrels, "arrays", None) is not None:
+            # qrels loaded from a snapshot and not materialized into sets yet
+            self.from_arrays(**qrels.arrays)
+        else:
+            self.from_sets(qrels.qrels)
+        self.topic_pos = {int(topic_no): pos for pos, topic_no in enumerate(self.topic_nos)}
+        # per topic views into the id arrays, cheaper to look up than slicing by indptr every call
+        self.views = {is_rel: {int(topic_no): self.ids[is_rel][self.indptr[is_rel][pos]: self.indptr[is_rel][pos + 1]]
+                               for pos, topic_no in enumerate(self.topic_nos)} for is_rel in (True, False)}
+        self.empty = np.empty(0, dtype=np.int32)
+        # per topic sets of ids for contains, built on demand
+        self.id_sets = {True: {}, False: {}}
+
+    def from_sets(self, qrels):
+        groups = {is_rel: qrels.get(is_rel, {}) for is_rel in (True, False)}
+        self.topic_nos = np.array(sorted(set(groups[True]) | set(groups[False])), dtype=np.int32)
+        for is_rel, topics in groups.items():
+            arrays = [np.sort(np.fromiter((self.intern(doc_no) for doc_no in topics.get(int(topic_no), ())),
+                                          dtype=np.int32)) for topic_no in self.topic_nos]
+            self.indptr[is_rel] = np.concatenate(([0], np.cumsum([len(a) for a in arrays]))).astype(np.int64)
+            self.ids[is_rel] = np.concatenate(arrays + [np.empty(0, dtype=np.int32)])
+
+    def from_arrays(self, doc_nos, is_rel, topic_nos, docs):
+        'Index the flat arrays of :meth:`TrecQrels.to_arrays`'
+        doc_ids = np.fromiter((self.intern(doc_no) for doc_no in doc_nos.tolist()), dtype=np.int64,
+                              count=len(doc_nos))
+        judged_ids = doc_ids[docs]
+        self.topic_nos = np.unique(topic_nos).astype(np.int32)
+        for rel in (True, False):
+            mask = is_rel == rel
+            rel_topics, rel_ids = topic_nos[mask], judged_ids[mask]
+            order = np.lexsort((rel_ids, rel_topics))
+            counts = np.bincount(np.searchsorted(self.topic_nos, rel_topics), minlength=len(self.topic_nos))
+            self.indptr[rel] = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+            self.ids[rel] = rel_ids[order].astype(np.int32)
+
+    def intern(self, doc_no):
+        """
+        :param doc_no: document number
+        :return: int id of the document, its doc row if it has one
+        """
+        doc_id = self.doc_index.get(doc_no)
+        if doc_id is None:
+            doc_id = self.extra_index.get(doc_no)
+            if doc_id is None:
+                doc_id = self.extra_index[doc_no] = self.n_docs + len(self.extra_docs)
+                self.extra_docs.append(doc_no)
+        return doc_id
+
+    @property
+    def n_ids(self):
+        return self.n_docs + len(self.extra_docs)
+
+    def get_doc_no(self, doc_id):
+        return self.doc_list[doc_id] if doc_id < self.n_docs else self.extra_docs[doc_id - self.n_docs]
+
+    def get_doc_nos(self, ids):
+        """
+        :param ids: iterable of int ids
+        :return: a list of document numbers
+        """
+        return [self.get_doc_no(doc_id) for doc_id in ids]
+
+    def get_ids(self, topic_no, is_rel=True):
+        """
+        Judged documents of a topic.
+
+        :param topic_no: Topic number 51-450
+        :param is_rel: If True: relevant documents. If False: irrelevant documents.
+        :return: sorted int32 array of ids, a view into the index, empty for an unknown topic
+        """
+        return self.views[is_rel].get(topic_no, self.empty)
+
+    def get_counts(self, is_rel=True):
+        """
+        :param is_rel: If True: relevant documents. If False: irrelevant documents.
+        :return: number of judged documents per topic, aligned with `topic_nos`
+        """
+        return np.diff(self.indptr[is_rel])
+
+    def contains_ids(self, topic_no, ids, is_rel=True):
+        """
+        Vectorized membership test, a binary search in the sorted ids of the topic.
+
+        :param topic_no: Topic number 51-450
+        :param ids: int array of ids
+        :param is_rel: If True: relevant documents. If False: irrelevant documents.
+        :return: bool array aligned with ids
+        """
+        ids = np.asarray(ids)
+        topic_ids = self.get_ids(topic_no, is_rel)
+        if not len(topic_ids):
+            return np.zeros(ids.shape, dtype=bool)
+        found = np.minimum(np.searchsorted(topic_ids, ids), len(topic_ids) - 1)
+        return topic_ids[found] == ids
+
+    def contains(self, topic_no, doc_no, is_rel=True):
+        """
+        Check whether the document is judged for the topic.
+
+        :param topic_no: Topic number 51-450
+        :param doc_no: Document number or int id
+        :param is_rel: If True: Check relevant documents. If False: Check irrelevant documents.
+        :return: True if contains.
+        """
+        id_set = self.id_sets[is_rel].get(topic_no)
+        if id_set is None:
+            id_set = self.id_sets[is_rel][topic_no] = frozenset(self.get_ids(topic_no, is_rel).tolist())
+        if isinstance(doc_no, str):
+            doc_id = self.doc_index.get(doc_no)
+            if doc_id is None:
+                doc_id = self.extra_index.get(doc_no)
+            return doc_id in id_set
+        return int(doc_no) in id_set
+
+    def sample(self, k, topic_no, is_rel=False, rng=None):
+        """
+        Sample judged documents of a topic, without replacement unless k exceeds their number.
+
+        :param k: number of documents
+        :param topic_no: Topic number 51-450
+        :param is_rel: If True: sample relevant documents. If False: sample irrelevant documents.
+        :param rng: numpy random Generator, a fresh one if None
+        :return: int32 array of ids
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        ids = self.get_ids(topic_no, is_rel)
+        if not len(ids):
+            return ids
+        return rng.choice(ids, size=k, replace=k > len(ids))
+
+    def nbytes(self):
+        'Memory of the arrays of the index, the doc_no dicts and the sets of contains excluded'
+        return sum(a.nbytes for a in self.ids.values()) + sum(a.nbytes for a in self.indptr.values()) + \
+            self.topic_nos.nbytes
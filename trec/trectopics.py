@@ -2,10 +2,12 @@
 
 import logging
 
+import numpy as np
 from gensim.corpora import TextDirectoryCorpus
-from utils import Tokenizer
+from trec.snapshot import load_snapshot, save_snapshot, source_signature
+from utils import SPACY_MODEL, Tokenizer, spacy_model_version
 
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, issparse
 # from scipy.special import softmax
 from sklearn.preprocessing import normalize
 
@@ -20,7 +22,20 @@ EXTRA_STOPWORDS = ["relevant", "document"]
 class TrecTopics(TextDirectoryCorpus):
     def __init__(self, topics_path, min_depth=0, max_depth=None, metadata=True,
                  lemmatization=True, use_stop=True,
-                 pattern=None, exclude_pattern=None, **kwargs):
+                 pattern=None, exclude_pattern=None, snapshot=None, **kwargs):
+        """
+        :param topics_path: folder of TREC topics
+        :param min_depth: minimum depth in the folder tree at which to find topic files, 0 for `topics_path` itself
+        :param max_depth: maximum depth in the folder tree at which to find topic files, None for no limit
+        :param metadata: passed on to the gensim corpus, :meth:`get_texts` always yields the topic numbers
+        :param lemmatization: tokenize topics into lemmas instead of their surface text
+        :param use_stop: remove stopwords, the spacy ones and :data:`EXTRA_STOPWORDS`, from the tokens
+        :param pattern: regex that the topic file names must match, None for all files
+        :param exclude_pattern: regex of topic file names to skip, None to skip none
+        :param snapshot: npz file caching the tokenized topics, rebuilt whenever a topic file, the tokenizer
+            settings or the version of the spacy model change
+        :param kwargs: passed on to :class:`gensim.corpora.textcorpus.TextDirectoryCorpus`
+        """
         super(TrecTopics, self).__init__(topics_path, dictionary={}, metadata=metadata,
                                          min_depth=min_depth, max_depth=max_depth,
                                          pattern=pattern, exclude_pattern=exclude_pattern,
@@ -31,12 +46,29 @@ class TrecTopics(TextDirectoryCorpus):
         self.topic_row_maps = {}
         self.oov = {}
 
-        self.tokenizer = Tokenizer(minimum_len=TOKEN_MIN_LEN, maximum_len=TOKEN_MAX_LEN,
-                                   lowercase=True, output_lemma=lemmatization, use_stopwords=use_stop,
-                                   extra_stopwords=EXTRA_STOPWORDS)
+        # vectorization cache, valid for one vocabulary
+        self.vocab_dict = None
+        self.indexed_fields = {}
+        self.normalized_vecs = {}
+        self.vecs_key = None
 
-    def get_texts(self):
+        self.snapshot = snapshot
+        self.tokenizer_settings = {"minimum_len": TOKEN_MIN_LEN, "maximum_len": TOKEN_MAX_LEN, "lowercase": True,
+                                   "output_lemma": lemmatization, "use_stopwords": use_stop,
+                                   "extra_stopwords": EXTRA_STOPWORDS}
+        # created by get_tokenizer, loading spacy takes seconds and is not needed if the snapshot is up to date
+        self.tokenizer = None
+
+    def get_tokenizer(self):
+        if self.tokenizer is None:
+            self.tokenizer = Tokenizer(**self.tokenizer_settings)
+        return self.tokenizer
 
+    def parse_topics(self):
+        """
+        Parse the topic files without tokenizing.
+        :return: a generator yield topic_no, raw title, raw desc, raw narr
+        """
         inside_top = False
         inside_desc = False
         inside_narr = False
@@ -76,15 +108,64 @@ class TrecTopics(TextDirectoryCorpus):
                     inside_narr = True
                 elif line.startswith("</top>"):
                     inside_top = False
-                    yield int(topic_no), \
-                          self.tokenizer.tokenize(title), self.tokenizer.tokenize(desc), self.tokenizer.tokenize(narr)
+                    yield int(topic_no), title, desc, narr
                     title = ""
                     desc = ""
                     narr = ""
 
+    def get_texts(self):
+        """
+        Tokenized topics, parsed and tokenized only once per instance, see :meth:`init`.
+        :return: a generator yield topic_no, [title tokens], [desc tokens], [narr tokens]
+        """
+        self.init()
+        for topic_no, fields in self.topics.items():
+            yield topic_no, fields["title"], fields["desc"], fields["narr"]
+
     def init(self):
-        for topic_no, title, desc, narr in self.get_texts():
-            self.topics[topic_no] = {"title": title, "desc": desc, "narr": narr}
+        """
+        Parse all topics and tokenize their fields in a single spacy pipe, or load them from the snapshot if it is
+        up to date. Later calls reuse the parsed topics.
+        :return: None
+        """
+        if self.topics:
+            return
+        signature = source_signature(self.iter_filepaths(),
+                                     spacy_model="%s-%s" % (SPACY_MODEL, spacy_model_version(SPACY_MODEL)),
+                                     tokenizer=self.tokenizer_settings) if self.snapshot else None
+        if self.snapshot:
+            arrays = load_snapshot(self.snapshot, signature)
+            if arrays is not None:
+                self.from_arrays(**arrays)
+                return
+
+        raw_topics = list(self.parse_topics())
+        tokenized = self.get_tokenizer().tokenize_batch(text for _, title, desc, narr in raw_topics
+                                                  for text in (title, desc, narr))
+        for i, (topic_no, _, _, _) in enumerate(raw_topics):
+            self.topics[topic_no] = {"title": tokenized[3 * i], "desc": tokenized[3 * i + 1],
+                                     "narr": tokenized[3 * i + 2]}
+
+        if self.snapshot:
+            save_snapshot(self.snapshot, signature, **self.to_arrays())
+
+    def to_arrays(self):
+        """
+        Flatten the tokenized topics into arrays, tokens of a field joined by spaces.
+        :return: dict of topic_nos and one string array per field
+        """
+        arrays = {"topic_nos": np.array(list(self.topics), dtype=np.int32)}
+        for field in ("title", "desc", "narr"):
+            arrays[field] = np.array([" ".join(fields[field]) for fields in self.topics.values()], dtype=str)
+        return arrays
+
+    def from_arrays(self, topic_nos, title, desc, narr):
+        """
+        Rebuild the tokenized topics from the arrays of :meth:`to_arrays`.
+        :return: None
+        """
+        for topic_no, *texts in zip(topic_nos.tolist(), title.tolist(), desc.tolist(), narr.tolist()):
+            self.topics[topic_no] = {field: text.split() for field, text in zip(("title", "desc", "narr"), texts)}
 
     def get_title(self, topic_no):
         return self.topics[topic_no]["title"]
@@ -102,44 +183,107 @@ class TrecTopics(TextDirectoryCorpus):
         index_list = []
         for term in term_list:
             if term in vocab_dict:
-                index_list.append(vocab_dict[term].index)
+                # gensim vocab entries carry the index, a DocVectorStore vocab maps to it directly
+                entry = vocab_dict[term]
+                index_list.append(getattr(entry, "index", entry))
             else:
                 self.oov.setdefault(topic_no, set()).add(term)
         return index_list
 
-    def vectorize(self, vocab_dict, include_title=True, include_desc=False, include_narr=False, norm='l2'):
+    def vectorize(self, vocab_dict, include_title=True, include_desc=False, include_narr=False, norm='l2',
+                  sparse=False):
+        """
+        Build the bag of words vectors of all topics into `topics_vecs`, one row per topic.
+        Indexed fields and normalized vectors are cached per vocabulary, so calling it again with another
+        combination of fields, norm or sparse does not parse or tokenize the topics again.
+        :param vocab_dict: vocabulary of the Doc2Vec model
+        :param include_title: use the title of topics
+        :param include_desc: use the description of topics
+        :param include_narr: use the narrative of topics
+        :param norm: norm of the topic vectors
+        :param sparse: keep `topics_vecs` as a normalized float32 CSR matrix instead of a dense vocab sized matrix
+        :return: None
+        """
         assert include_title or include_desc or include_narr is True
 
-        vector_length = len(vocab_dict)
+        if vocab_dict is not self.vocab_dict:
+            self.vocab_dict = vocab_dict
+            self.indexed_fields = {}
+            self.normalized_vecs = {}
+            self.vecs_key = None
 
-        topic_row = [0]
-        index_col = []
-        freq_val = []
+        key = (include_title, include_desc, include_narr, norm, sparse)
+        if key == self.vecs_key:
+            return
 
-        for topic_no, title, desc, narr in self.get_texts():
+        vecs_key = key[:-1]
+        if vecs_key not in self.normalized_vecs:
+            fields = [field for field, included in zip(("title", "desc", "narr"),
+                                                       (include_title, include_desc, include_narr)) if included]
+            indexed = [self.get_indexed_field(vocab_dict, field) for field in fields]
 
-            self.topic_row_maps.setdefault(topic_no, len(self.topic_row_maps))
+            topic_row = [0]
+            index_col = []
+            for topic_no in self.get_topic_list():
+                self.topic_row_maps.setdefault(topic_no, len(self.topic_row_maps))
+                for indexed_field in indexed:
+                    index_col.extend(indexed_field[topic_no])
+                topic_row.append(len(index_col))
 
-            indexed_word_list = []
-            if include_title:
-                indexed_word_list.extend(self.indexedize(vocab_dict, topic_no, title))
-            if include_desc:
-                indexed_word_list.extend(self.indexedize(vocab_dict, topic_no, desc))
-            if include_narr:
-                indexed_word_list.extend(self.indexedize(vocab_dict, topic_no, narr))
+            topics_vecs = csr_matrix((np.ones(len(index_col)), index_col, topic_row),
+                                     shape=(len(topic_row) - 1, len(vocab_dict)))
+            # repeated terms are summed into their count before normalizing
+            topics_vecs.sum_duplicates()
+            # only the sparse vectors are kept, a dense matrix per field combination would take vocab sized rows
+            self.normalized_vecs[vecs_key] = normalize(topics_vecs, norm=norm, axis=1)
 
-            for index in indexed_word_list:
-                index_col.append(index)
-                freq_val.append(1)
-            topic_row.append(len(index_col))
+        if sparse:
+            self.topics_vecs = self.normalized_vecs[vecs_key].astype(np.float32)
+        else:
+            self.topics_vecs = self.normalized_vecs[vecs_key].toarray()
+        self.vecs_key = key
 
-        self.topics_vecs = normalize(csr_matrix((freq_val, index_col, topic_row), dtype=int,
-                                                shape=(len(topic_row) - 1, vector_length)).toarray(),
-                                     norm=norm, axis=1)
+    def get_topic_list(self):
+        self.init()
+        return list(self.topics)
 
-        # self.topics_vecs = csr_matrix((freq_val, index_col, topic_row), dtype=int,
-        #                               shape=(len(topic_row)-1, vector_length)).toarray()
+    def get_indexed_field(self, vocab_dict, field):
+        """
+        Vocabulary indexes of one field of every topic, computed once per vocabulary.
+        :param vocab_dict: vocabulary of the Doc2Vec model
+        :param field: "title", "desc" or "narr"
+        :return: dict of topic_no -> list of indexes
+        """
+        if field not in self.indexed_fields:
+            self.init()
+            self.indexed_fields[field] = {topic_no: self.indexedize(vocab_dict, topic_no, fields[field])
+                                          for topic_no, fields in self.topics.items()}
+        return self.indexed_fields[field]
 
-    def get_topic_vector(self, topic_no):
+    def is_sparse(self):
+        return issparse(self.topics_vecs)
+
+    def get_topic_vector(self, topic_no, dense=True):
+        """
+        :param topic_no: topic number
+        :param dense: densify the row if the topic vectors are sparse
+        :return: a 1-D array, or a 1 x vocab CSR row if sparse and not dense
+        """
         assert 51 <= topic_no <= 450
-        return self.topics_vecs[self.topic_row_maps[topic_no]]
+        row = self.topics_vecs[self.topic_row_maps[topic_no]]
+        if dense and issparse(row):
+            return row.toarray()[0]
+        return row
+
+    def get_topic_vectors(self, topic_nos, dense=True):
+        """
+        Topic vectors of many topics at once, e.g. of one batch, densified only for these rows.
+        :param topic_nos: iterable of topic numbers
+        :param dense: densify the rows if the topic vectors are sparse
+        :return: a len(topic_nos) x vocab matrix, CSR if sparse and not dense
+        """
+        rows = np.fromiter((self.topic_row_maps[topic_no] for topic_no in topic_nos), dtype=np.int64)
+        vecs = self.topics_vecs[rows]
+        if dense and issparse(vecs):
+            return vecs.toarray()
+        return vecs
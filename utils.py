@@ -1,12 +1,30 @@
 import spacy
 import random
+from functools import lru_cache
+import numpy as np
 from gensim.models import Doc2Vec
 from tensorflow.keras import models
 
+from doc_embedding.docvector_store import DocVectorStore
+from evaluation.projection_cache import ProjectionCache
+
 SPACY_MODEL = "en_core_web_sm"
 SPACY_DISABLES = ["parser", "ner"]
 
 
+@lru_cache(maxsize=None)
+def spacy_model_version(model=SPACY_MODEL):
+    """
+    Version of the installed spacy model, from its package metadata without loading it if it is a package.
+    :param model: name of the spacy model
+    :return: version string
+    """
+    version = spacy.util.get_package_version(model)
+    if version is None:
+        version = spacy.load(model, disable=SPACY_DISABLES).meta.get("version")
+    return version
+
+
 class Tokenizer:
     """Customized Spacy tokenizer for tokenize and lemmatize TREC format documents.
 
@@ -28,6 +46,7 @@ class Tokenizer:
 
         if extra_stopwords is None:
             extra_stopwords = []
+        self.extra_stopwords = list(extra_stopwords)
         self.nlp = spacy.load(SPACY_MODEL, disable=SPACY_DISABLES, max_length=10 ** 7)
 
         for word in extra_stopwords:
@@ -73,16 +92,37 @@ class Tokenizer:
         """
         return self._tokenize(self.nlp(text))
 
-    def tokenize_pipe(self, texts):
+    def tokenize_batch(self, texts, batch_size=128):
+        """
+        Tokenize many short texts in one spacy pipe on a single core, same tokens as :meth:`tokenize`.
+        :param texts: iterable of context strings
+        :param batch_size: number of texts buffered per spacy batch
+        :return: a list of lists of tokenized tokens
+        """
+        return [self._tokenize(doc) for doc in self.nlp.pipe(texts, batch_size=batch_size)]
+
+    def tokenize_pipe(self, texts, n_process=-1, batch_size=128):
         """
         Return a generator that tokenize text into a list of tokens, use all cores,
         optimal for large corpus with long documents in it.
-        :param texts: context string
-        :return: a list of tokenized tokens
+        :param texts: (context string, metadata) tuples
+        :param n_process: number of spacy processes, -1 use all cores
+        :param batch_size: number of texts buffered per spacy batch
+        :return: a list of tokenized tokens, metadata
         """
-        for doc, _ in self.nlp.pipe(texts, as_tuples=True, batch_size=128, n_process=-1, disable=SPACY_DISABLES):
+        for doc, _ in self.nlp.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process,
+                                    disable=SPACY_DISABLES):
             yield self._tokenize2(doc), _
 
+    def settings(self):
+        """
+        Return the constructor arguments of this tokenizer, e.g. to build an identical one in a worker process.
+        :return: dict of keyword arguments accepted by Tokenizer
+        """
+        return {"minimum_len": self.minimum_len, "maximum_len": self.maximum_len, "lowercase": self.lowercase,
+                "output_lemma": self.output_lemma, "use_stopwords": self.use_stopwords,
+                "extra_stopwords": list(self.extra_stopwords), "alpha_only": self.alpha_only}
+
     def token_filter(self, token):
         return not ((self.alpha_only & ~token.is_alpha) |
                     (self.use_stopwords & token.is_stop) |
@@ -154,24 +194,69 @@ class ModelLoader:
     def __init__(self):
         self.d2v = None
         self.sbm = None
+        self.docvecs = None
+        self.vocab = None
+        # files the models were loaded from, keys of the projection cache
+        self.d2v_file = None
+        self.sbm_file = None
 
     def load_d2v(self, model_file):
         self.d2v = Doc2Vec.load(model_file)
+        self.d2v_file = model_file
+        self.docvecs = self.d2v.docvecs
+        self.vocab = self.d2v.wv.vocab
+
+    def load_docvecs(self, store_path):
+        """
+        Load only the document vectors from a store exported by :func:`doc_embedding.docvector_store.export_docvecs`,
+        a lightweight alternative to :meth:`load_d2v`.
+        :param store_path: folder of the document vector store
+        :return: None
+        """
+        self.docvecs = DocVectorStore(store_path)
+        self.vocab = self.docvecs.vocab
+        self.d2v_file = store_path
 
     def load_sbm(self, model_file):
         self.sbm = models.load_model(model_file)
+        self.sbm_file = model_file
 
     def get_docs_list(self):
-        assert self.d2v is not None
-        return self.d2v.docvecs.index2entity
+        assert self.docvecs is not None
+        return self.docvecs.index2entity
 
     def get_docvecs(self):
-        assert self.d2v is not None
-        return self.d2v.docvecs.vectors_docs
+        assert self.docvecs is not None
+        return self.docvecs.vectors_docs
+
+    def get_vocab(self):
+        assert self.vocab is not None
+        return self.vocab
 
-    def get_predict_vec_array(self):
-        assert self.d2v is not None and self.sbm is not None
-        return self.sbm.predict(self.get_docvecs())
+    def get_predict_vec_array(self, batch_size=4096, cache_dir=None, dtype="float32"):
+        """
+        SBM predictions of all document vectors, predicted batch by batch into one float32 array.
+        :param batch_size: number of documents per prediction
+        :param cache_dir: folder of a :class:`evaluation.projection_cache.ProjectionCache`, the predictions are
+            then memory mapped from the cache and only computed if the models changed
+        :param dtype: "float32" or "float16" cache storage
+        :return: the predictions, one row per document
+        """
+        assert self.docvecs is not None and self.sbm is not None
+        docvecs = self.get_docvecs()
+        if cache_dir is not None:
+            assert self.sbm_file is not None and self.d2v_file is not None, "models must be loaded from files"
+            return ProjectionCache(cache_dir, dtype=dtype).get_or_build(self.sbm_file, self.d2v_file, docvecs,
+                                                                        self.sbm.predict_on_batch,
+                                                                        batch_size=batch_size)
+        predictions = None
+        for start in range(0, len(docvecs), batch_size):
+            batch = np.asarray(self.sbm.predict_on_batch(np.asarray(docvecs[start: start + batch_size],
+                                                                    dtype=np.float32)), dtype=np.float32)
+            if predictions is None:
+                predictions = np.empty((len(docvecs),) + batch.shape[1:], dtype=np.float32)
+            predictions[start: start + len(batch)] = batch
+        return predictions
 
 
 # def save_predict_vecs(doc2vec_model, sbm_model, vecs_file):